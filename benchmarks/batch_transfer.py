@@ -0,0 +1,80 @@
+"""Compares throughput of batch transfer with the equivalent number of single transfers.
+
+    python -m benchmarks.batch_transfer [recipients] [runs]
+
+Transactions are validated and executed as block transactions are, lookup BlockChain._validate_txs(...), and state
+roots hash is computed after them. Transaction hash covers its signature, so signatures can not be produced here:
+verification is modelled by verifying one real ECDSA signature per transaction.
+"""
+import hashlib
+import sys
+import time
+
+import primitives.blockchain
+from crypto import dsha256, generate_pair_from_seeed
+from primitives import BlockChain, Transaction, TransactionType, WorldState
+from primitives.assets import CURRENCY_ASSET
+from primitives.blockchain import GENESIS_ACCOUNT
+
+_private_key, _public_key = generate_pair_from_seeed(b'benchmark')
+_digest = hashlib.sha256(b'benchmark').digest()
+_signature = _private_key.sign_digest(_digest)
+
+
+def _verify(pub_key: str, signature: str, message: str) -> bool:
+    return _public_key.verify_digest(_signature, _digest)
+
+
+def _state(sender: str) -> WorldState:
+    state = WorldState()
+    state.prepare_for_genesis(GENESIS_ACCOUNT)
+    state.execute_reward_modification(sender, 10 ** 12)
+    state.commit()
+
+    return state
+
+
+def _transfers(pub_key: str, sender: str, recipients: list[str]) -> list[Transaction]:
+    return [Transaction(TransactionType.transfer, sender, None,
+                        {'recipient': recipient, 'asset': CURRENCY_ASSET.name, 'ownership_type': '00', 'amount': 1},
+                        'signature', pub_key, nonce)
+            for nonce, recipient in enumerate(recipients)]
+
+
+def _batch(pub_key: str, sender: str, recipients: list[str]) -> list[Transaction]:
+    return [Transaction(TransactionType.batch_transfer, sender, None,
+                        {'transfers': [[recipient, CURRENCY_ASSET.name, '00', 1] for recipient in recipients]},
+                        'signature', pub_key, 0)]
+
+
+def _measure(txs: list[Transaction], state: WorldState, runs: int) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        new_state = BlockChain._validate_txs(txs, state)
+        new_state.state_roots_hash
+        best = min(best, time.perf_counter() - started)
+
+    return best
+
+
+def main(recipients: int = 1000, runs: int = 3) -> None:
+    primitives.blockchain.check_signature_ecdsa = _verify
+
+    pub_key = _public_key.to_string().hex()
+    sender = dsha256(pub_key)
+    state = _state(sender)
+    names = [dsha256(f'recipient {i}') for i in range(recipients)]
+
+    single, batch = _transfers(pub_key, sender, names), _batch(pub_key, sender, names)
+    single_state = BlockChain._validate_txs(single, state)
+    batch_state = BlockChain._validate_txs(batch, state)
+    assert single_state.state_roots_hash == batch_state.state_roots_hash
+
+    for name, txs in (('single', single), ('batch', batch)):
+        seconds = _measure(txs, state, runs)
+        print(f'{name:6s}: {len(txs):5d} txs, {seconds:.3f}s, {recipients / seconds:10.1f} transfers/s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
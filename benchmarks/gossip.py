@@ -0,0 +1,144 @@
+"""Measures propagation of transactions and blocks between nodes connected by gossip.
+
+    python -m benchmarks.gossip [nodes] [transactions] [timeout]
+
+Nodes run in one process, each with its own data directory, and are connected in a line over Unix sockets: every
+node connects to the previous one, so transactions and blocks cross every node on the way. All nodes mine, so
+branches compete and nodes fall behind and sync. Transactions are submitted to the first node and are waited for
+until mempools of all nodes are empty. Then mining is stopped, the highest node mines one more block, so there is
+the only heaviest branch, and nodes are waited for until they agree on its tip. Compact blocks counters show how many
+blocks were rebuilt from mempool alone and how many needed missing transactions fetched from peer.
+Miner processes of all nodes compete with nodes themselves for CPUs, so on a machine with few CPUs most of the time
+is spent before mempools are empty.
+
+Nodes MUST have the same genesis block, peers with another genesis are dropped. Genesis block has creation time in
+its header, so it differs between independently created data directories: data directory is initialized once, with
+blocks funding sender of transactions, and every node gets a copy of it.
+
+Transaction hash covers its signature, so signatures can not be produced here: verification is modelled as in
+benchmarks.batch_transfer.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import node.admission
+import primitives.blockchain
+from benchmarks.batch_transfer import _public_key, _transfers, _verify
+from benchmarks.reorg_latency import _child
+from crypto import dsha256
+from node import Node
+from node.admission import AdmissionPipeline
+from primitives.blockchain import BLOCK_REWARD
+from run import open_blockchain, start_gossip
+
+
+def _init_data_dir(data_dir: str, sender: str, amount: int) -> None:
+    blockchain, checkpoints = open_blockchain(data_dir)
+    for _ in range(amount // BLOCK_REWARD + 1):
+        blockchain.add_block(_child(blockchain.tree.tip, sender))
+    checkpoints.write(blockchain)
+    checkpoints.close()
+    blockchain.chain.close()
+
+
+def _start_node(index: int, data_dir: str, sockets: list[str]) -> Node:
+    _node = Node(f'node-{index}')
+    _node.attach_blockchain(*open_blockchain(data_dir))
+    # verification is patched in this process only
+    _node.admission = AdmissionPipeline(_node, signature_workers=0)
+    _node.start()
+    start_gossip(_node, sockets[index], sockets[index - 1:index])
+
+    return _node
+
+
+def _wait(condition: Callable[[], bool], deadline: float) -> bool:
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.1)
+
+    return condition()
+
+
+def _heights(nodes: list[Node]) -> list[int]:
+    return [_node.blockchain.snapshot.height for _node in nodes]
+
+
+def _settle(nodes: list[Node], deadline: float) -> bool:
+    """Stops mining and lets the highest node mine one block, which makes its branch the only heaviest one.
+
+    :return: True if nodes have agreed on tip before deadline
+    :rtype: bool
+    """
+    for _node in nodes:
+        _node.mining = False
+    # blocks found before mining was stopped are still relayed
+    heights = []
+    while heights != _heights(nodes) and time.perf_counter() < deadline:
+        heights = _heights(nodes)
+        time.sleep(1.)
+
+    leader = max(nodes, key=lambda n: n.blockchain.snapshot.height)
+    height = leader.blockchain.snapshot.height
+    leader.mining = True
+    _wait(lambda: leader.blockchain.snapshot.height > height, deadline)
+    leader.mining = False
+
+    return _wait(lambda: len({_node.blockchain.snapshot.hash for _node in nodes}) == 1, deadline)
+
+
+def _report(_node: Node) -> str:
+    stats = _node.gossip.stats()
+    return (f'{_node.name}: height {_node.blockchain.snapshot.height:4d}, tip {_node.blockchain.snapshot.hash[:16]}, '
+            f'mempool {len(_node.mempool):5d}, blocks {stats["blocks"]:4d}, '
+            f'compact_complete {stats["compact_complete"]:4d}, compact_fetched {stats["compact_fetched"]:4d}, '
+            f'fetched_txs {stats["fetched_txs"]:5d}, orphans {stats["orphans"]:4d}')
+
+
+def main(nodes: int = 4, transactions: int = 1000, timeout: int = 300) -> None:
+    node.admission.check_signature_ecdsa = _verify
+    primitives.blockchain.check_signature_ecdsa = _verify
+
+    pub_key = _public_key.to_string().hex()
+    sender = dsha256(pub_key)
+    txs = _transfers(pub_key, sender, [dsha256(f'recipient {i}') for i in range(transactions)])
+
+    with tempfile.TemporaryDirectory() as directory:
+        genesis_dir = os.path.join(directory, 'genesis')
+        _init_data_dir(genesis_dir, sender, transactions)
+        data_dirs = [shutil.copytree(genesis_dir, os.path.join(directory, f'node-{i}')) for i in range(nodes)]
+        sockets = [os.path.join(directory, f'node-{i}.sock') for i in range(nodes)]
+
+        started = [_start_node(i, data_dir, sockets) for i, data_dir in enumerate(data_dirs)]
+        try:
+            submitted = time.perf_counter()
+            futures = started[0].admission.submit_many(txs)
+            accepted = sum(future.exception() is None for future in futures)
+            admitted = time.perf_counter()
+
+            deadline = submitted + timeout
+            confirmed = _wait(lambda: not any(len(_node.mempool) for _node in started), deadline)
+            emptied = time.perf_counter()
+            converged = confirmed and _settle(started, deadline)
+            finished = time.perf_counter()
+            report = [_report(_node) for _node in started]
+        finally:
+            for _node in started:
+                _node.gossip.stop()
+                _node.stop(5)
+
+        print(f'{accepted}/{len(txs)} txs admitted by node-0 in {admitted - submitted:.3f}s')
+        if confirmed:
+            print(f'mempools of {nodes} nodes emptied in {emptied - submitted:.3f}s')
+        if converged:
+            print(f'{nodes} nodes converged in {finished - submitted:.3f}s')
+        else:
+            print(f'{nodes} nodes have not converged in {timeout}s')
+        print('\n'.join(report))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
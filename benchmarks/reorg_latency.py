@@ -0,0 +1,68 @@
+"""Measures latency of chain reorganization by its depth.
+
+    python -m benchmarks.reorg_latency [max depth] [runs per depth]
+
+For every depth canonical chain is extended by depth blocks and competing branch of depth + 1 blocks is built on
+the same ancestor, last block of it triggers reorganization.
+"""
+import datetime
+import sys
+
+from primitives import Block, BlockChain, BlockHeader
+from primitives.blockchain import BLOCK_REWARD
+from primitives.block_tree import TreeEntry
+from utils import LatencyStats
+
+EASY_TARGET = int('0x000' + 'F' * 61, 16)  # maximal target allowed by BlockHeader
+
+
+def _child(parent: TreeEntry, beneficiary: str) -> Block:
+    state = parent.state.fork()
+    state.execute_reward_modification(beneficiary, BLOCK_REWARD)
+
+    block = Block(
+        BlockHeader(
+            parent_hash=parent.hash,
+            beneficiary=beneficiary,
+            target=EASY_TARGET,
+            height=parent.height + 1,
+            timestamp=parent.block.header.timestamp + datetime.timedelta(seconds=1),
+            state_root=state.state_roots_hash,
+            comment=beneficiary
+        ),
+        []
+    )
+    block.mine()
+
+    return block
+
+
+def _branch(blockchain: BlockChain, ancestor: TreeEntry, length: int, beneficiary: str):
+    entry, reorg = ancestor, None
+    for _ in range(length):
+        block = _child(entry, beneficiary)
+        reorg = blockchain.add_block(block)
+        entry = blockchain.tree.get(block.hash)
+
+    return reorg
+
+
+def main(max_depth: int = 16, runs: int = 5) -> None:
+    blockchain = BlockChain()
+
+    for depth in range(1, max_depth + 1):
+        stats = LatencyStats(window=runs)
+        for run in range(runs):
+            ancestor = blockchain.tree.tip
+            _branch(blockchain, ancestor, depth, f'{run:064x}')
+            reorg = _branch(blockchain, ancestor, depth + 1, f'{run + runs:064x}')
+            assert reorg is not None and reorg.depth == depth
+            stats.record(reorg.seconds)
+
+        print(f'depth {depth:3d}:', stats.snapshot())
+
+    print('blocks in tree:', len(blockchain.tree), 'chain height:', blockchain.height)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
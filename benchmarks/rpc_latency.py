@@ -0,0 +1,47 @@
+"""Measures JSON-RPC latency with and without mining running in background.
+
+    python -m benchmarks.rpc_latency [requests] [client threads]
+"""
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from node import server
+from primitives import BlockChain
+from utils import metrics, LatencyStats
+
+
+def _measure(requests: int, threads: int) -> dict:
+    stats = LatencyStats(window=requests)
+    body = json.dumps({'jsonrpc': '2.0', 'method': 'mempool.stats', 'id': 1})
+
+    def call(_):
+        client = server.test_client()
+        with stats.time():
+            response = client.post('/', data=body, content_type='application/json')
+        assert response.status_code == 200
+
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(call, range(requests)))
+
+    return stats.snapshot()
+
+
+def main(requests: int = 2000, threads: int = 8) -> None:
+    server.attach_blockchain(BlockChain())
+
+    print('idle:  ', _measure(requests, threads))
+
+    server.start()
+    time.sleep(1)
+    try:
+        print('mining:', _measure(requests, threads))
+    finally:
+        server.stop(timeout=5)
+
+    print('blocks mined:', metrics.counter('miner.blocks'))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+# gunicorn -c gunicorn.conf.py node:server
+#
+# Single writer, many readers. Writer process (run.run_writer) owns the chain: it runs the mining thread, admission
+# pipeline and applies blocks. RPC worker processes serve reads from blocks, tries nodes and transactions index the
+# writer persists in data directory, and forward writes and mempool queries to it over Unix socket, lookup
+# node.reader.serve_reads(...). Read throughput grows with the number of workers.
+
+import multiprocessing
+import os
+import socket
+import time
+
+from utils import config
+
+bind = '127.0.0.1:5000'
+workers = config.getint('deployment', 'workers', fallback=4)
+threads = 8
+
+WRITER_START_TIMEOUT = 120.
+
+
+def on_starting(server):
+    from run import DATA_DIR, WRITER_SOCKET, run_writer
+
+    if os.path.exists(WRITER_SOCKET):
+        os.unlink(WRITER_SOCKET)
+    # spawned, so writer does not inherit state of master
+    server.writer = multiprocessing.get_context('spawn').Process(target=run_writer, args=(DATA_DIR, WRITER_SOCKET),
+                                                                 name='writer')
+    server.writer.start()
+
+    # workers read head writer publishes before it serves socket
+    deadline = time.monotonic() + WRITER_START_TIMEOUT
+    while True:
+        assert server.writer.is_alive(), 'writer has exited'
+        assert time.monotonic() < deadline, 'writer has not started in time'
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(WRITER_SOCKET)
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def post_worker_init(worker):
+    from node.reader import serve_reads
+    from run import DATA_DIR, WRITER_SOCKET
+
+    serve_reads(worker.wsgi, DATA_DIR, WRITER_SOCKET)
+
+
+def worker_exit(server, worker):
+    worker.wsgi.admission.stop()
+
+
+def on_exit(server):
+    server.writer.terminate()
+    server.writer.join(timeout=30)
@@ -1,82 +1,390 @@
-from typing import Callable, Union, Optional
-from datetime import datetime
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
 
-from flask import Flask
+from flask import Flask, g
 
-from utils import config, logger
-from primitives import Transaction, BlockChain, Block, BlockHeader
+from utils import config, logger, metrics, handle_exception
+from primitives import BlockChain, Block, BlockBuilder, ChainSnapshot, Mempool, Transaction
+from primitives.mining import ProcessPoolMiner
+from primitives.parallel_execution import ExecutionReport
+from node.admission import AdmissionPipeline
+from node.events import Event, EventBus, EventType, Subscription
+from node.gossip import Gossip
+from node.response_cache import ResponseCache
+from node.streams import EventStream
+from storage import CheckpointManager
+
+BENEFICIARY = '82be969bdeb6216e89a0e80fdf0c93c2e64b120af0b50abd3d9f6d4a09b395cd'
 
 
 class CallbackTrigger(object):
+    """Represents callback to be executed on node events.
+
+    Public attributes:
+        name — name of trigger, used in event bus stats
+        active — inactive triggers are not subscribed
+        callback — callable receiving Event
+        events — event types callback is executed on
+    """
     name: str = ''
     active: bool = False
-    callback: Callable = None
+    callback: Callable[[Event], None] = None
+    events: tuple[EventType, ...] = tuple(EventType)
 
 
 class Node(Flask):
-    tx_pool: list[Transaction] = []
+    """Represents blockchain node: JSON-RPC app with mining worker.
+
+    Public attributes:
+        mempool — pending transactions
+        blockchain — blockchain node works on
+        builder — pending block built on blockchain tip
+        miner — proof of work searcher
+        inbox — queue of (kind, payload, future) for mining worker
+        events — event bus callbacks are executed on
+        admission — staged admission pipeline of transactions submitted from outside
+        responses — cache of RPC results, invalidated by blockchain on new tip
+        streams — server-sent events stream of new blocks and transactions, fed by event bus
+        gossip — relay of transactions and blocks to other nodes (optional)
+        checkpoints — checkpoint manager state is checkpointed with at block boundaries (optional)
+        mining — worker searches proof of work between inbox messages, otherwise it only validates and relays blocks
+    Public methods:
+        attach_blockchain(...) — sets blockchain node works on
+        pinned(...) — returns chain snapshot pinned for current request
+        submit_tx(...) — queues transaction for admission
+        submit_block(...) — queues block for addition to blockchain
+        add_trigger(...) — subscribes callback trigger to events
+        remove_trigger(...) — unsubscribes callback trigger
+        start(...) — starts mining worker thread
+        stop(...) — stops mining worker thread
+        main_loop(...) — body of mining worker
+
+    Mining worker thread is the only writer of blockchain, builder and mempool. RPC handlers run concurrently in
+    server threads and talk to it through inbox, proof of work search runs in worker processes, so RPC is
+    not stalled by mining. Callbacks are executed on event bus threads, so they do not delay mining either.
+    """
+    mempool: Mempool = None
     blockchain: BlockChain = None
-    _triggers: list[CallbackTrigger] = []
+    builder: BlockBuilder = None
+    miner: ProcessPoolMiner = None
+    inbox: queue.Queue = None
+    events: EventBus = None
+    admission: AdmissionPipeline = None
+    responses: ResponseCache = None
+    streams: EventStream = None
+    gossip: Optional[Gossip] = None
+    checkpoints: Optional[CheckpointManager] = None
+    mining: bool = True
+    _triggers: dict[int, Subscription] = None
     _mined_block: Optional[Block] = None
+    _worker: threading.Thread = None
+    _stopped: threading.Event = None
 
     def __init__(self, import_name):
         super().__init__(import_name)
 
+        self.mempool = Mempool()
+        self.miner = ProcessPoolMiner()
+        self.inbox = queue.Queue()
+        self.events = EventBus()
+        self.admission = AdmissionPipeline(
+            self,
+            max_queue=config.getint('admission', 'max_queue', fallback=1024),
+            signature_workers=config.getint('admission', 'signature_workers', fallback=None)
+        )
+        self.responses = ResponseCache(lambda: self.pinned().hash,
+                                       max_bytes=config.getint('rpc', 'cache_bytes', fallback=64 * 2 ** 20))
+        self.streams = EventStream(max_buffer=config.getint('streams', 'max_buffer', fallback=1024),
+                                   keepalive=config.getfloat('streams', 'keepalive', fallback=15.))
+        self.streams.attach(self.events)
+        self._triggers = {}
+        self._stopped = threading.Event()
+
+        self.before_request(self._start_request_timer)
+        self.after_request(self._record_request_latency)
+        self.teardown_appcontext(self._unpin)
+
+    @staticmethod
+    def _start_request_timer() -> None:
+        g.request_started = time.perf_counter()
+
+    @staticmethod
+    def _record_request_latency(response):
+        metrics.latency('rpc.request').record(time.perf_counter() - g.request_started)
+        return response
+
+    def attach_blockchain(self, blockchain: BlockChain, checkpoints: CheckpointManager = None) -> None:
+        """Sets blockchain node works on and starts pending block on its tip.
+
+        :param blockchain: blockchain
+        :type blockchain: BlockChain
+        :param checkpoints: checkpoint manager blockchain state is built on (optional)
+        :type checkpoints: CheckpointManager
+        :return: None
+        """
+        assert isinstance(blockchain, BlockChain)
+
+        self.blockchain = blockchain
+        self.checkpoints = checkpoints
+        self.builder = BlockBuilder(blockchain, BENEFICIARY, blockchain.target)
+        blockchain.on_new_tip = self.responses.invalidate
+        self.responses.invalidate(blockchain.last)
+        if checkpoints is not None:
+            checkpoints.write_head(blockchain)
+        if blockchain.executor is not None:
+            blockchain.executor.on_report = self._record_execution
+
+    def pinned(self) -> ChainSnapshot:
+        """Returns chain snapshot pinned for current request, it is released when request is torn down.
+
+        All calls of JSON-RPC batch request are answered from the same snapshot, however many blocks are added
+        meanwhile, and reading it never waits for block application.
+
+        :return: snapshot of tip, state after it and its roots
+        :rtype: ChainSnapshot
+        """
+        if 'snapshot' not in g:
+            g.snapshot = self.blockchain.pin()
+        return g.snapshot
+
+    def _unpin(self, _exception) -> None:
+        snapshot = g.pop('snapshot', None)
+        if snapshot is not None:
+            self.blockchain.unpin(snapshot)
+
+    @staticmethod
+    def _record_execution(report: ExecutionReport) -> None:
+        metrics.latency('execution.block').record(report.seconds)
+        metrics.incr('execution.txs', report.transactions)
+        metrics.incr('execution.waves', report.waves)
+        metrics.incr('execution.serial', report.serial)
+        logger.debug(f'executed block: {report}')
+
+    def submit_tx(self, tx: Transaction, verified: bool = False) -> Future:
+        """Queues transaction for admission to mempool and pending block.
+
+        Transactions from outside SHOULD come through admission pipeline, which checks everything but pending state
+        before they reach mining worker.
+
+        :param tx: transaction
+        :type tx: Transaction
+        :param verified: signature was already verified, lookup AdmissionPipeline
+        :type verified: bool
+        :return: future resolved with True if transaction was admitted
+        :rtype: Future
+        """
+        assert isinstance(tx, Transaction)
+
+        future = Future()
+        self.inbox.put(('verified_tx' if verified else 'tx', tx, future))
+        return future
+
+    def submit_block(self, block: Block) -> Future:
+        """Queues block for validation and addition to blockchain.
+
+        :param block: block
+        :type block: Block
+        :return: future resolved with True if block was added, or with exception it was rejected with
+        :rtype: Future
+        """
+        assert isinstance(block, Block)
+
+        future = Future()
+        self.inbox.put(('block', block, future))
+        return future
+
+    def add_trigger(self, trigger: CallbackTrigger) -> None:
+        """Subscribes active callback trigger to its events.
+
+        :param trigger: callback trigger
+        :type trigger: CallbackTrigger
+        :return: None
+        """
+        assert isinstance(trigger, CallbackTrigger)
+
+        if trigger.active and id(trigger) not in self._triggers:
+            self._triggers[id(trigger)] = self.events.subscribe(trigger.callback, trigger.events, trigger.name)
+
+    def remove_trigger(self, trigger: CallbackTrigger) -> None:
+        """Unsubscribes callback trigger.
+
+        :param trigger: callback trigger
+        :type trigger: CallbackTrigger
+        :return: None
+        """
+        try:
+            self.events.unsubscribe(self._triggers.pop(id(trigger)))
+        except KeyError:
+            pass
+
+    def start(self) -> None:
+        """Starts mining worker thread and admission pipeline.
+
+        :return: None
+        """
+        assert self.blockchain is not None
+        assert self._worker is None or not self._worker.is_alive()
+
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self.main_loop, name='node-miner', daemon=True)
+        self._worker.start()
+        self.admission.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stops admission pipeline, mining worker thread and miner processes.
+
+        :param timeout: how long to wait for worker, seconds (optional)
+        :type timeout: float
+        :return: None
+        """
+        self.admission.stop(timeout)
+        self._stopped.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self.miner.shutdown()
+
     def main_loop(self) -> None:
-        """Starts main loop of node (mining + callback executions).
+        """Starts main loop of node (inbox processing + mining).
+
+        Runs until stop() is called.
 
         :return: None
         :rtype: None
         """
 
-        _exit_loop = False
+        while not self._stopped.is_set():
 
-        while not _exit_loop:
+            # worker which does not mine waits for inbox instead
+            self._process_inbox(None if self.mining else 0.1)
 
-            self._mine()
+            if self.mining:
+                self._mine()
 
-            for call in self._callbacks_to_execute():
-                call()  # TODO: pass arbitrary variables from Callback
+    def _process_inbox(self, timeout: float = None) -> None:
+        """Processes everything queued in inbox.
 
-    def _callbacks_to_execute(self) -> Union[tuple[Callable, ...], tuple[()]]:
-        """Returns callbacks to be executed.
+        Current template is dropped if pending block has changed, so next one includes new transactions.
 
-        :return: Tuple of callables which need to be executed.
-        :rtype: tuple[Callable]
+        :param timeout: how long to wait for the first message, seconds (optional, does not wait by default)
+        :type timeout: float
+        :return: None
         """
-        return tuple(t.callback for t in self._triggers if t.active)
+        while True:
+            try:
+                kind, payload, future = self.inbox.get(timeout=timeout) if timeout else self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            timeout = None
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                if kind == 'tx':
+                    result = self._admit_tx(payload)
+                elif kind == 'verified_tx':
+                    result = self._admit_tx(payload, verified=True)
+                elif kind == 'block':
+                    self._accept_block(payload)
+                    result = True
+                else:
+                    raise NotImplementedError
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+            self._mined_block = None
+
+    def _admit_tx(self, tx: Transaction, verified: bool = False) -> bool:
+        """Admits transaction to mempool and applies it to pending block.
+
+        :param tx: transaction
+        :type tx: Transaction
+        :param verified: signature was already verified
+        :type verified: bool
+        :return: True if transaction was admitted
+        :rtype: bool
+        """
+        if not self.mempool.add(tx):
+            return False
+
+        if not self.builder.add(tx, verified):
+            self.mempool.remove(tx.hash)
+            return False
+
+        self.events.publish(EventType.new_tx, tx)
+
+        return True
+
+    def _accept_block(self, block: Block) -> None:
+        """Adds block to blockchain and moves mempool and pending block onto new tip.
+
+        Block on a side branch is only kept by blockchain. On reorganization transactions of disconnected blocks,
+        which are not included in new branch, are returned to mempool and pending block.
+
+        :param block: block
+        :type block: Block
+        :return: None
+        """
+        tip_hash = self.blockchain.last.hash
+        reorg = self.blockchain.add_block(block)
+        if self.blockchain.last.hash == tip_hash:
+            return
+
+        if self.checkpoints is not None:
+            with metrics.latency('checkpoint.write').time():
+                self.checkpoints.maybe_write(self.blockchain)
+            self.checkpoints.write_head(self.blockchain)
+
+        if reorg is None:
+            self.mempool.remove_confirmed(block.transactions)
+            for tx in self.builder.rebase():
+                self.mempool.remove(tx.hash)
+            self.events.publish(EventType.new_block, block)
+            return
+
+        metrics.latency(f'chain.reorg.depth.{reorg.depth}').record(reorg.seconds)
+        metrics.incr('chain.reorgs')
+
+        confirmed_txs = [tx for connected in reorg.connected for tx in connected.transactions]
+        confirmed = {tx.hash for tx in confirmed_txs}
+        self.mempool.remove_confirmed(confirmed_txs)
+        for tx in self.builder.rebase(confirmed):
+            self.mempool.remove(tx.hash)
+        for disconnected in reorg.disconnected:
+            for tx in disconnected.transactions:
+                if tx.hash not in confirmed and self.mempool.add(tx) and not self.builder.add(tx):
+                    self.mempool.remove(tx.hash)
+
+        self.events.publish(EventType.reorg, {'old_tip': reorg.disconnected[-1], 'new_tip': reorg.connected[-1],
+                                              'reorg': reorg})
+        for connected in reorg.connected:
+            self.events.publish(EventType.new_block, connected)
 
     def _mine(self):
 
         if not self._mined_block:
+            self._mined_block = self.builder.template(comment=f'test height {self.blockchain.height}')
 
-            txs = self.tx_pool[:]
+        with metrics.latency('miner.search').time():
+            found = self.miner.mine(self._mined_block,
+                                    interrupted=lambda: not self.inbox.empty() or self._stopped.is_set()
+                                    or not self.mining)
 
+        if found:
+            self.events.publish(EventType.mined_block, self._mined_block)
             try:
-                new_state = self.blockchain.validate_txs_on_current_state(txs)
-            except Exception:
-                raise
-
-            self._mined_block = Block(
-                BlockHeader(
-                    parent_hash=self.blockchain.last.hash,
-                    beneficiary='82be969bdeb6216e89a0e80fdf0c93c2e64b120af0b50abd3d9f6d4a09b395cd',
-                    target=28269553036454149273332760011886696253239742350009903329945699220681916415,
-                    height=self.blockchain.height,
-                    timestamp=datetime.now(),
-                    state_root=new_state.state_roots_hash,
-                    comment=f'test height {self.blockchain.height}'
-                ),
-                self.tx_pool
-            )
-
-            self._mined_block.mine()  # TODO: multiprocessing
-
-            self.blockchain.add_block(self._mined_block)
+                self._accept_block(self._mined_block)
+            except Exception as e:
+                handle_exception(logger, e)
+            else:
+                metrics.incr('miner.blocks')
             self._mined_block = None
 
-        ...
-
 
 server = Node(__name__)
 server.config.from_object(config)
@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from typing import Any, Callable, Iterable, Optional, Union
+
+from crypto import check_signature_ecdsa, dsha256
+from primitives import Transaction
+from utils import LatencyStats, logger, handle_exception
+
+
+class AdmissionRejected(Exception):
+    """Raised into future of transaction rejected by admission pipeline.
+
+    Public attributes:
+        stage — name of stage transaction was rejected at
+        reason — human-readable reason
+    """
+
+    def __init__(self, stage: str, reason: str) -> None:
+        super().__init__(f'{stage}: {reason}')
+        self.stage = stage
+        self.reason = reason
+
+
+def admission_result(future: Future, deadline: float) -> dict[str, Any]:
+    """Waits for admission of transaction until deadline and returns its JSON-serializable result.
+
+    :param future: future returned by AdmissionPipeline.submit(...)
+    :type future: Future
+    :param deadline: time.monotonic() deadline
+    :type deadline: float
+    :return: "accepted" flag (None if admission did not finish in time), "stage" and "reason" of rejection
+    :rtype: dict[str, Any]
+    """
+    try:
+        future.result(max(deadline - time.monotonic(), 0.))
+    except AdmissionRejected as e:
+        return {'accepted': False, 'stage': e.stage, 'reason': e.reason}
+    except TimeoutError:
+        return {'accepted': None, 'stage': None, 'reason': 'timeout'}
+
+    return {'accepted': True}
+
+
+def resolve_with_result(future: Future, result: dict[str, Any]) -> None:
+    """Resolves future as AdmissionPipeline does from result returned by admission_result(...), e.g. received from
+    another process. Future of admission which did not finish in time is resolved with TimeoutError.
+
+    :param future: future of submission
+    :type future: Future
+    :param result: result returned by admission_result(...)
+    :type result: dict[str, Any]
+    :return: None
+    """
+    if result['accepted']:
+        future.set_result(True)
+    elif result['accepted'] is None:
+        future.set_exception(TimeoutError(result['reason']))
+    else:
+        future.set_exception(AdmissionRejected(result['stage'], result['reason']))
+
+
+def _verify_signature(pub_key: str, signature: str, tx_hash: str) -> bool:
+    """Verifies signature of transaction. Runs in worker process.
+
+    :return: True if signature is valid
+    :rtype: bool
+    """
+    try:
+        return bool(check_signature_ecdsa(pub_key, signature, tx_hash))
+    except Exception:
+        return False
+
+
+class AdmissionStage(object):
+    """Represents stage of AdmissionPipeline: bounded queue served by worker threads.
+
+    Public attributes:
+        name — name of stage
+        max_queue — maximum number of queued items
+        processed, rejected — counters
+        wait — queue waiting latency stats
+        latency — processing latency stats
+    Public methods:
+        put(...) — queues item without blocking
+        start(...) — starts worker threads
+        stop(...) — stops worker threads
+        stats(...) — returns queue depth, counters and latencies
+
+    Handler receives payload and returns payload for the next stage or raises AdmissionRejected. Handler may return
+    Future instead, then item proceeds when it is resolved.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Any], threads: int = 1, max_queue: int = 1024) -> None:
+        """Initialization of stage.
+
+        :param name: name of stage
+        :type name: str
+        :param handler: callable processing payload
+        :type handler: Callable[[Any], Any]
+        :param threads: number of worker threads
+        :type threads: int
+        :param max_queue: maximum number of queued items
+        :type max_queue: int
+        """
+        self.name = name
+        self.max_queue = max_queue
+        self.processed = 0
+        self.rejected = 0
+        self.wait = LatencyStats()
+        self.latency = LatencyStats()
+        self.next: Optional[AdmissionStage] = None
+        self._handler = handler
+        self._threads = threads
+        self._workers: list[threading.Thread] = []
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._stopped = threading.Event()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name}, {self._queue.qsize()}/{self.max_queue})'
+
+    def put(self, payload: Any, future: Future) -> bool:
+        """Queues item without blocking, rejects it if queue is full.
+
+        :param payload: payload to be processed
+        :type payload: Any
+        :param future: future of submission
+        :type future: Future
+        :return: True if item was queued
+        :rtype: bool
+        """
+        try:
+            self._queue.put_nowait((payload, future, time.perf_counter()))
+        except queue.Full:
+            self.rejected += 1
+            future.set_exception(AdmissionRejected(self.name, 'overloaded'))
+            return False
+
+        return True
+
+    def start(self) -> None:
+        """Starts worker threads.
+
+        :return: None
+        """
+        self._stopped.clear()
+        self._workers = [threading.Thread(target=self._run, name=f'admission-{self.name}-{i}', daemon=True)
+                         for i in range(self._threads)]
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stops worker threads, queued items are rejected.
+
+        :param timeout: how long to wait for every thread, seconds (optional)
+        :type timeout: float
+        :return: None
+        """
+        self._stopped.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+        while True:
+            try:
+                _, future, _ = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            future.set_exception(AdmissionRejected(self.name, 'stopped'))
+
+    def stats(self) -> dict:
+        """Returns queue depth, counters and latencies, milliseconds.
+
+        :return: queue depth and capacity, counters, waiting and processing latency summaries
+        :rtype: dict
+        """
+        return {'queued': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'processed': self.processed,
+                'rejected': self.rejected,
+                'wait': self.wait.snapshot(),
+                'latency': self.latency.snapshot()}
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                payload, future, queued = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            started = time.perf_counter()
+            self.wait.record(started - queued)
+            try:
+                result = self._handler(payload)
+            except Exception as e:
+                self._complete(future, started, error=e)
+                continue
+
+            if isinstance(result, Future):
+                # handler finishes asynchronously, stage thread is free for the next item meanwhile
+                result.add_done_callback(lambda done, future=future, started=started:
+                                         self._complete(future, started, done=done))
+            else:
+                self._complete(future, started, result)
+
+    def _complete(self, future: Future, started: float, result: Any = None, error: Exception = None,
+                  done: Future = None) -> None:
+        """Passes result of handler to the next stage or resolves future of item with it.
+
+        :return: None
+        """
+        self.latency.record(time.perf_counter() - started)
+        if done is not None:
+            error = done.exception()
+            result = None if error is not None else done.result()
+
+        if error is not None:
+            if not isinstance(error, AdmissionRejected):
+                handle_exception(logger, error)
+                error = AdmissionRejected(self.name, f'{type(error).__name__}: {error}')
+            self.rejected += 1
+            future.set_exception(error)
+            return
+
+        self.processed += 1
+        if self.next is not None:
+            self.next.put(result, future)
+        else:
+            future.set_result(result)
+
+
+class AdmissionPipeline(object):
+    """Admits transactions to node in stages connected by bounded queues.
+
+    Public attributes:
+        stages — decode, stateless, signature and stateful stages, in order
+    Public methods:
+        submit(...) — queues raw transaction for admission
+        submit_many(...) — queues many raw transactions at once
+        start(...) — starts stages
+        stop(...) — stops stages and signature workers
+        stats(...) — returns per-stage queue depth, counters and latencies
+    Private attributes:
+        _executor — pool of signature verification processes
+
+    Stages:
+        - decode — JSON dump (str, bytes or parsed dict) is decoded with Transaction.json_parser_hook
+        - stateless — public key matches sender, payload is valid for type, transaction is not in mempool
+        - signature — signature is verified on pool of worker processes
+        - stateful — transaction is admitted to mempool and pending block by node worker, lookup Node.submit_tx(...);
+          stage does not wait for worker, so transactions submitted together are admitted in one pass of its inbox
+    Every submission gets future resolved with True when transaction is admitted, or with AdmissionRejected naming
+    the stage which rejected it. Queues never block: when the next stage is full, transaction is rejected as
+    overloaded right away, so overload costs constant memory and callers learn about it immediately.
+    """
+    _executor: ProcessPoolExecutor = None
+
+    def __init__(self, node, max_queue: int = 1024, decode_threads: int = 2, signature_workers: int = None) -> None:
+        """Initialization of pipeline.
+
+        :param node: node transactions are admitted to
+        :type node: Node
+        :param max_queue: maximum number of queued transactions of every stage
+        :type max_queue: int
+        :param decode_threads: number of threads of decode and stateless stages
+        :type decode_threads: int
+        :param signature_workers: number of signature verification processes, 0 to verify in stage threads
+            (optional, CPUs by default)
+        :type signature_workers: int
+        """
+        self.node = node
+        self._signature_workers = (os.cpu_count() or 1) if signature_workers is None else signature_workers
+
+        self.stages = [
+            AdmissionStage('decode', self._decode, decode_threads, max_queue),
+            AdmissionStage('stateless', self._check_stateless, decode_threads, max_queue),
+            # every thread keeps one verification in flight
+            AdmissionStage('signature', self._check_signature, self._signature_workers or 1, max_queue),
+            AdmissionStage('stateful', self._check_stateful, 1, max_queue),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+
+    def submit(self, raw: Union[str, bytes, dict, Transaction]) -> Future:
+        """Queues transaction for admission without blocking.
+
+        :param raw: transaction JSON dump, parsed dump or transaction itself
+        :type raw: Union[str, bytes, dict, Transaction]
+        :return: future resolved with True if transaction was admitted, or with AdmissionRejected
+        :rtype: Future
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.stages[0].put(raw, future)
+
+        return future
+
+    def submit_many(self, raws: Iterable[Union[str, bytes, dict, Transaction]]) -> list[Future]:
+        """Queues many transactions for admission, in order.
+
+        :param raws: transactions JSON dumps, parsed dumps or transactions
+        :type raws: Iterable[Union[str, bytes, dict, Transaction]]
+        :return: futures of transactions, lookup submit(...)
+        :rtype: list[Future]
+        """
+        return [self.submit(raw) for raw in raws]
+
+    def start(self) -> None:
+        """Starts stages.
+
+        :return: None
+        """
+        if self._signature_workers and self._executor is None:
+            self._executor = ProcessPoolExecutor(self._signature_workers)
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stops stages and signature worker processes, queued transactions are rejected.
+
+        :param timeout: how long to wait for every thread, seconds (optional)
+        :type timeout: float
+        :return: None
+        """
+        for stage in self.stages:
+            stage.stop(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, dict]:
+        """Returns per-stage queue depth, counters and latencies.
+
+        :return: stage name -> stats, lookup AdmissionStage.stats(...)
+        :rtype: dict[str, dict]
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    @staticmethod
+    def _decode(raw: Union[str, bytes, dict, Transaction]) -> Transaction:
+        if isinstance(raw, Transaction):
+            return raw
+
+        try:
+            if isinstance(raw, dict):
+                tx = Transaction.json_parser_hook(raw)
+            else:
+                tx = json.loads(raw, object_hook=Transaction.json_parser_hook)
+        except Exception as e:
+            raise AdmissionRejected('decode', f'malformed transaction: {type(e).__name__}')
+
+        if not isinstance(tx, Transaction):
+            raise AdmissionRejected('decode', 'not a transaction')
+
+        return tx
+
+    def _check_stateless(self, tx: Transaction) -> tuple[Transaction, str]:
+        try:
+            sender_matches = dsha256(tx.pub_key) == tx.sender
+            payload_is_valid = tx.tx_type.payload_is_valid(tx.payload)
+            tx.atomize()
+        except Exception as e:
+            raise AdmissionRejected('stateless', f'malformed transaction: {type(e).__name__}')
+
+        if not sender_matches:
+            raise AdmissionRejected('stateless', 'public key does not match sender')
+        if not payload_is_valid:
+            raise AdmissionRejected('stateless', 'invalid payload')
+
+        tx_hash = tx.hash
+        if tx_hash in self.node.mempool:
+            raise AdmissionRejected('stateless', 'already in mempool')
+
+        return tx, tx_hash
+
+    def _check_signature(self, item: tuple[Transaction, str]) -> Transaction:
+        tx, tx_hash = item
+
+        if self._executor is None:
+            valid = _verify_signature(tx.pub_key, tx.signature, tx_hash)
+        else:
+            valid = self._executor.submit(_verify_signature, tx.pub_key, tx.signature, tx_hash).result()
+
+        if not valid:
+            raise AdmissionRejected('signature', 'invalid signature')
+
+        return tx
+
+    def _check_stateful(self, tx: Transaction) -> Future:
+        # not waited for, so node worker admits everything queued meanwhile in one pass of its inbox
+        admitted = Future()
+
+        def resolve(done: Future) -> None:
+            try:
+                result = done.result()
+            except Exception as e:
+                admitted.set_exception(e)
+                return
+            if result:
+                admitted.set_result(True)
+            else:
+                admitted.set_exception(AdmissionRejected('stateful', 'rejected by pending state or mempool'))
+
+        self.node.submit_tx(tx, verified=True).add_done_callback(resolve)
+
+        return admitted
@@ -0,0 +1,246 @@
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Iterable
+
+from utils import LatencyStats, logger, handle_exception
+
+
+class EventType(Enum):
+    """Implemented node event types.
+
+        - new_block — block was added to blockchain, payload is Block
+        - mined_block — block was mined by this node (published before new_block), payload is Block
+        - new_tx — transaction was admitted to mempool, payload is Transaction
+        - reorg — canonical tip was switched to another branch, payload is dict with old and new tips
+    """
+    new_block = 'new_block'
+    mined_block = 'mined_block'
+    new_tx = 'new_tx'
+    reorg = 'reorg'
+
+
+class Event(object):
+    """Represents event published on EventBus.
+
+    Public attributes:
+        type — event type
+        payload — event payload, lookup EventType
+        timestamp — time of publication (time.monotonic)
+    """
+    __slots__ = ('type', 'payload', 'timestamp')
+
+    def __init__(self, event_type: EventType, payload: Any) -> None:
+        self.type = event_type
+        self.payload = payload
+        self.timestamp = time.monotonic()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.type.value}, {self.payload})'
+
+
+class Subscription(object):
+    """Represents subscriber of EventBus.
+
+    Public attributes:
+        id — unique id of subscription
+        name — human-readable name, used in stats
+        callback — callable receiving Event
+        event_types — event types subscriber is interested in
+        max_pending — maximum number of events queued for subscriber
+        latency — callback execution latency stats
+        delivered, dropped, timeouts, failures — counters
+
+    Events are delivered to subscriber one by one in publication order.
+    """
+
+    def __init__(self, _id: int, name: str, callback: Callable[[Event], Any], event_types: frozenset[EventType],
+                 max_pending: int) -> None:
+        self.id = _id
+        self.name = name
+        self.callback = callback
+        self.event_types = event_types
+        self.max_pending = max_pending
+        self.latency = LatencyStats()
+        self.delivered = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.active = True
+        self._queue: deque[Event] = deque()
+        self._running_since: float = None
+        self._scheduled = False
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.id}, {self.name}, {[t.value for t in self.event_types]})'
+
+    def stats(self) -> dict:
+        """Returns subscriber counters and callback latency, milliseconds.
+
+        :return: counters and latency summary
+        :rtype: dict
+        """
+        return {'pending': len(self._queue),
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+                'latency': self.latency.snapshot()}
+
+
+class EventBus(object):
+    """Delivers typed events to subscribers on bounded thread pool.
+
+    Public methods:
+        subscribe(...) — registers callback for event types
+        unsubscribe(...) — removes subscription
+        publish(...) — publishes event, never blocks on subscribers
+        stats(...) — returns per-subscriber counters and latency
+        shutdown(...) — stops thread pool
+
+    Every subscriber has bounded queue and occupies at most one pool thread at a time, so one slow subscriber
+    delays only itself. Event is dropped for subscriber (and counted) if its queue is full or if its callback
+    runs longer than timeout — stalled subscriber does not accumulate events.
+    Callbacks exceptions are logged and counted, they never reach publisher.
+    """
+
+    def __init__(self, workers: int = 4, timeout: float = 5., max_pending: int = 256) -> None:
+        """Initialization of bus.
+
+        :param workers: number of threads callbacks are run on
+        :type workers: int
+        :param timeout: callback running longer is considered stalled, seconds
+        :type timeout: float
+        :param max_pending: default maximum number of events queued for one subscriber
+        :type max_pending: int
+        """
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='event-bus')
+        self._subscriptions: dict[EventType, tuple[Subscription, ...]] = {t: () for t in EventType}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Event], Any], event_types: Iterable[EventType] = None,
+                  name: str = None, max_pending: int = None) -> Subscription:
+        """Registers callback for event types.
+
+        :param callback: callable receiving Event
+        :type callback: Callable[[Event], Any]
+        :param event_types: event types to subscribe to (optional, all by default)
+        :type event_types: Iterable[EventType]
+        :param name: name of subscriber for stats (optional)
+        :type name: str
+        :param max_pending: maximum number of events queued for subscriber (optional)
+        :type max_pending: int
+        :return: subscription, pass it to unsubscribe(...)
+        :rtype: Subscription
+        """
+        event_types = frozenset(event_types) if event_types is not None else frozenset(EventType)
+        _id = next(self._ids)
+        subscription = Subscription(_id, name or getattr(callback, '__name__', str(_id)), callback, event_types,
+                                    max_pending or self.max_pending)
+
+        with self._lock:
+            for event_type in event_types:
+                self._subscriptions[event_type] += (subscription,)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Removes subscription, events queued for it are discarded.
+
+        :param subscription: subscription returned by subscribe(...)
+        :type subscription: Subscription
+        :return: None
+        """
+        with self._lock:
+            subscription.active = False
+            subscription._queue.clear()
+            for event_type in subscription.event_types:
+                self._subscriptions[event_type] = tuple(s for s in self._subscriptions[event_type]
+                                                        if s is not subscription)
+
+    def publish(self, event_type: EventType, payload: Any = None) -> Event:
+        """Publishes event to subscribers of its type.
+
+        :param event_type: type of event
+        :type event_type: EventType
+        :param payload: event payload
+        :type payload: Any
+        :return: published event
+        :rtype: Event
+        """
+        event = Event(event_type, payload)
+        now = event.timestamp
+
+        for subscription in self._subscriptions[event_type]:
+            with self._lock:
+                running_since = subscription._running_since
+                if running_since is not None and now - running_since > self.timeout:
+                    subscription.dropped += 1
+                    continue
+                if len(subscription._queue) >= subscription.max_pending:
+                    subscription.dropped += 1
+                    continue
+
+                subscription._queue.append(event)
+                if subscription._scheduled:
+                    continue
+                subscription._scheduled = True
+
+            self._executor.submit(self._drain, subscription)
+
+        return event
+
+    def _drain(self, subscription: Subscription) -> None:
+        """Delivers queued events to subscriber until its queue is empty.
+
+        :param subscription: subscription
+        :type subscription: Subscription
+        :return: None
+        """
+        while True:
+            with self._lock:
+                if not subscription._queue or not subscription.active:
+                    subscription._scheduled = False
+                    return
+                event = subscription._queue.popleft()
+                subscription._running_since = time.monotonic()
+
+            try:
+                subscription.callback(event)
+            except Exception as e:
+                subscription.failures += 1
+                handle_exception(logger, e)
+            else:
+                subscription.delivered += 1
+            finally:
+                elapsed = time.monotonic() - subscription._running_since
+                subscription._running_since = None
+                subscription.latency.record(elapsed)
+                if elapsed > self.timeout:
+                    subscription.timeouts += 1
+
+    def stats(self) -> dict[str, dict]:
+        """Returns per-subscriber counters and callback latency.
+
+        :return: stats by subscriber name
+        :rtype: dict[str, dict]
+        """
+        with self._lock:
+            subscriptions = {s.id: s for group in self._subscriptions.values() for s in group}
+
+        return {f'{s.name}#{s.id}': s.stats() for s in subscriptions.values()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops thread pool, queued events are discarded.
+
+        :param wait: wait for running callbacks
+        :type wait: bool
+        :return: None
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
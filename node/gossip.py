@@ -0,0 +1,628 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Optional
+
+from node.events import Event, EventType, Subscription
+from node.writer import recv_frame, send_frame
+from primitives import Block, BlockHeader, Transaction
+from utils import logger, handle_exception
+
+
+class SeenFilter(object):
+    """Represents bounded set of recently seen hashes, the oldest ones are forgotten first.
+
+    Public attributes:
+        max_size — maximum number of remembered hashes
+    Public methods:
+        add(...) — remembers hash, tells if it is new
+    """
+
+    def __init__(self, max_size: int = 100_000) -> None:
+        self.max_size = max_size
+        self._hashes: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, _hash: str) -> bool:
+        return _hash in self._hashes
+
+    def add(self, _hash: str) -> bool:
+        """Remembers hash.
+
+        :param _hash: hash of transaction or block
+        :type _hash: str
+        :return: True if hash was not seen recently
+        :rtype: bool
+        """
+        with self._lock:
+            if _hash in self._hashes:
+                self._hashes.move_to_end(_hash)
+                return False
+            self._hashes[_hash] = None
+            if len(self._hashes) > self.max_size:
+                self._hashes.popitem(last=False)
+
+        return True
+
+
+def _open_socket(address: str) -> socket.socket:
+    """Connects to gossip address: "host:port" over TCP, anything else is Unix socket path.
+
+    :return: connected socket
+    :rtype: socket.socket
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit() and not address.startswith('/'):
+        return socket.create_connection((host, int(port)))
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+class GossipPeer(object):
+    """Represents connection to another node.
+
+    Public attributes:
+        address — address of peer, "host:port" or Unix socket path (peer address for inbound connections)
+        known — hashes peer has sent or was sent, they are never sent to it
+        greeted — peer has sent hello with the same genesis block, lookup Gossip
+        syncing — blocks are requested from peer, lookup Gossip
+        sent, received — message counters
+    Public methods:
+        send(...) — sends message, drops connection on failure
+        close(...) — closes connection
+        run(...) — receives messages until connection is closed
+    """
+
+    def __init__(self, gossip: Gossip, sock: socket.socket, address: str, known_size: int = 10_000) -> None:
+        self.address = address
+        self.known = SeenFilter(known_size)
+        self.greeted = False
+        self.syncing = False
+        self.sent = 0
+        self.received = 0
+        self._gossip = gossip
+        self._socket = sock
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.address})'
+
+    def send(self, message: dict) -> bool:
+        """Sends message, drops connection if it fails.
+
+        :param message: message, lookup Gossip
+        :type message: dict
+        :return: True if message was sent
+        :rtype: bool
+        """
+        try:
+            with self._send_lock:
+                send_frame(self._socket, message)
+        except OSError:
+            self.close()
+            return False
+
+        self.sent += 1
+        return True
+
+    def close(self) -> None:
+        """Closes connection, peer is forgotten by gossip.
+
+        :return: None
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._gossip._forget(self)
+
+    def run(self) -> None:
+        """Receives messages and passes them to gossip until connection is closed.
+
+        :return: None
+        """
+        try:
+            while not self._closed:
+                message = recv_frame(self._socket)
+                self.received += 1
+                try:
+                    self._gossip._handle(self, message)
+                except Exception as e:
+                    handle_exception(logger, e)
+        except (OSError, ValueError, AssertionError):
+            pass
+        finally:
+            self.close()
+
+
+class _GossipHandler(socketserver.BaseRequestHandler):
+
+    def handle(self) -> None:
+        # Unix socket clients have no address, they are numbered in order of connection
+        if isinstance(self.client_address, tuple):
+            address = ':'.join(map(str, self.client_address))
+        else:
+            address = f'unix#{next(self.server.accepted)}'
+        peer = GossipPeer(self.server.gossip, self.request, address)
+        self.server.gossip._register(peer)
+        peer.run()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class Gossip(object):
+    """Propagates transactions and blocks between nodes over local TCP or Unix sockets.
+
+    Public attributes:
+        node — node transactions and blocks are exchanged for
+        peers — connected peers
+        seen_txs, seen_blocks — hashes received recently, they are not processed again
+        counters — messages and compact blocks counters
+    Public methods:
+        listen(...) — accepts peers on address
+        connect(...) — connects to peer
+        start(...) — subscribes to node events, transactions and blocks are relayed from now on
+        stop(...) — closes listener and connections
+        stats(...) — returns peers and counters
+    Private attributes:
+        _pending — compact blocks waiting for missing transactions, block hash -> (header, transactions, peer)
+        _orphans — blocks waiting for parent, block hash -> (block, peer they came from)
+
+    Messages are length-prefixed JSON frames, lookup node.writer.send_frame(...):
+        - {"type": "tx", "tx": ...} — transaction dump
+        - {"type": "cmpct", "hash": ..., "header": ..., "tx_hashes": [...]} — compact block: header and hashes
+        - {"type": "gettxs", "hash": ..., "indexes": [...]} — request of block transactions missing in mempool
+        - {"type": "blocktxs", "hash": ..., "indexes": [...], "txs": [...]} — requested transactions
+        - {"type": "getblocks", "locator": [[height, hash], ...]} — request of canonical blocks following the
+          first locator block peer has in its canonical chain
+        - {"type": "blocks", "blocks": [...], "more": ...} — requested blocks, "more" if peer has next ones
+        - {"type": "hello", "genesis": ...} — first message of both sides, peers of another chain are dropped
+    Transactions admitted by node (from RPC or peers) are relayed to every peer which does not know them yet,
+    blocks added to canonical chain are announced as compact blocks. Received transactions go through admission
+    pipeline of node, received blocks are rebuilt from mempool, so block relay costs a header and 64 bytes per
+    transaction, and only transactions receiver has not seen are fetched. Blocks are relayed after node has
+    validated them. Hashes seen node-wide and per peer stop messages from circling.
+    Block with unknown parent (e.g. node has fallen behind) is kept as orphan and node syncs with peer which has
+    announced it: locator of own canonical chain (ten tip blocks, then exponentially sparser, down to block tree
+    base) is sent, peer finds the last common block and replies with batch of following blocks of its chain, next
+    batches are requested until peer has no more. One sync per peer is in flight, orphans are never evicted while
+    it lasts: when orphans limit is reached, new orphans are not kept, sync fetches them anyway. Orphans still
+    waiting for parent when sync has brought nothing new are dropped, so are orphans of disconnected peer. Blocks at
+    or below block tree base are not fetched: reorganizations do not go below it, so such branch can not be
+    connected.
+    Peers are not reconnected when connection is lost.
+    """
+    _subscription: Subscription = None
+    _server: Optional[socketserver.BaseServer] = None
+
+    def __init__(self, node, seen_size: int = 100_000, max_pending: int = 64, sync_batch: int = 64) -> None:
+        """Initialization of gossip.
+
+        :param node: node, it SHOULD have blockchain attached
+        :type node: Node
+        :param seen_size: number of remembered transactions and blocks hashes
+        :type seen_size: int
+        :param max_pending: maximum number of compact blocks waiting for transactions, and of orphan blocks
+        :type max_pending: int
+        :param sync_batch: maximum number of blocks sent in reply to one sync request
+        :type sync_batch: int
+        """
+        self.node = node
+        self.peers: tuple[GossipPeer, ...] = ()
+        self.seen_txs = SeenFilter(seen_size)
+        self.seen_blocks = SeenFilter(seen_size)
+        self.counters = {'txs': 0, 'blocks': 0, 'compact_complete': 0, 'compact_fetched': 0, 'fetched_txs': 0,
+                         'orphans': 0, 'unconnectable': 0, 'syncs': 0, 'synced_blocks': 0, 'rejected_blocks': 0,
+                         'genesis_mismatch': 0}
+        self.max_pending = max_pending
+        self.sync_batch = sync_batch
+        self._pending: OrderedDict[str, tuple[BlockHeader, list[Optional[Transaction]], GossipPeer]] = OrderedDict()
+        self._orphans: OrderedDict[str, tuple[Block, GossipPeer]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self.peers)} peers)'
+
+    def listen(self, address: str) -> None:
+        """Accepts peers on address in background thread.
+
+        :param address: "host:port" or Unix socket path (stale socket file is removed)
+        :type address: str
+        :return: None
+        """
+        assert self._server is None
+
+        host, _, port = address.rpartition(':')
+        if host and port.isdigit() and not address.startswith('/'):
+            self._server = _TCPServer((host, int(port)), _GossipHandler)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            self._server = _UnixServer(address, _GossipHandler)
+        self._server.gossip = self
+        self._server.accepted = itertools.count(1)
+
+        threading.Thread(target=self._server.serve_forever, name='gossip-listener', daemon=True).start()
+
+    def connect(self, address: str) -> GossipPeer:
+        """Connects to peer, messages of peer are received in background thread.
+
+        :param address: "host:port" or Unix socket path
+        :type address: str
+        :return: peer
+        :rtype: GossipPeer
+        """
+        peer = GossipPeer(self, _open_socket(address), address)
+        self._register(peer)
+        threading.Thread(target=peer.run, name=f'gossip-{address}', daemon=True).start()
+
+        return peer
+
+    def start(self) -> None:
+        """Subscribes to node events: admitted transactions and new blocks are relayed from now on.
+
+        :return: None
+        """
+        if self._subscription is None:
+            self._subscription = self.node.events.subscribe(self._on_event, (EventType.new_tx, EventType.new_block),
+                                                            'gossip', 4096)
+
+    def stop(self) -> None:
+        """Unsubscribes from node events, closes listener and connections.
+
+        :return: None
+        """
+        if self._subscription is not None:
+            self.node.events.unsubscribe(self._subscription)
+            self._subscription = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            if isinstance(self._server.server_address, str) and os.path.exists(self._server.server_address):
+                os.unlink(self._server.server_address)
+            self._server = None
+        for peer in self.peers:
+            peer.close()
+
+    def stats(self) -> dict[str, Any]:
+        """Returns peers and counters.
+
+        :return: peers with their message counters, counters, numbers of pending compact blocks and orphans
+        :rtype: dict[str, Any]
+        """
+        return dict(self.counters,
+                    peers={peer.address: {'sent': peer.sent, 'received': peer.received, 'greeted': peer.greeted,
+                                          'syncing': peer.syncing}
+                           for peer in self.peers},
+                    pending=len(self._pending),
+                    orphans_waiting=len(self._orphans))
+
+    def _register(self, peer: GossipPeer) -> None:
+        # hello goes first, nothing else is sent to peer until its hello is received
+        peer.send({'type': 'hello', 'genesis': self.node.blockchain.chain[0].hash})
+        with self._lock:
+            self.peers += (peer,)
+
+    def _forget(self, peer: GossipPeer) -> None:
+        with self._lock:
+            self.peers = tuple(p for p in self.peers if p is not peer)
+            # parents of orphans of peer would have been synced from it
+            for block_hash in [h for h, (_, p) in self._orphans.items() if p is peer]:
+                del self._orphans[block_hash]
+
+    def _broadcast(self, _hash: str, message: dict) -> None:
+        """Sends message to every peer which does not know hash yet.
+
+        :return: None
+        """
+        for peer in self.peers:
+            if peer.greeted and peer.known.add(_hash):
+                peer.send(message)
+
+    def _on_event(self, event: Event) -> None:
+        if event.type is EventType.new_tx:
+            tx: Transaction = event.payload
+            tx_hash = tx.hash
+            self.seen_txs.add(tx_hash)
+            self._broadcast(tx_hash, {'type': 'tx', 'tx': tx.dump()})
+        elif event.type is EventType.new_block:
+            block: Block = event.payload
+            self.seen_blocks.add(block.hash)
+            self._broadcast(block.hash, {'type': 'cmpct', 'hash': block.hash, 'header': block.header.dump(),
+                                         'tx_hashes': [tx.hash for tx in block.transactions]})
+
+    def _handle(self, peer: GossipPeer, message: dict) -> None:
+        """Handles message received from peer, lookup Gossip.
+
+        :return: None
+        """
+        kind = message['type']
+        if kind == 'hello':
+            if message['genesis'] != self.node.blockchain.chain[0].hash:
+                self.counters['genesis_mismatch'] += 1
+                logger.warning(f'gossip peer {peer.address} is dropped: it has another genesis block')
+                peer.close()
+                return
+            peer.greeted = True
+            return
+
+        if not peer.greeted:
+            return
+
+        if kind == 'tx':
+            tx = json.loads(message['tx'], object_hook=Transaction.json_parser_hook)
+            tx_hash = tx.hash
+            peer.known.add(tx_hash)
+            if self.seen_txs.add(tx_hash):
+                self.counters['txs'] += 1
+                # admitted transaction is relayed further on new_tx event
+                self.node.admission.submit(tx)
+
+        elif kind == 'cmpct':
+            block_hash = message['hash']
+            peer.known.add(block_hash)
+            if self.seen_blocks.add(block_hash):
+                self.counters['blocks'] += 1
+                header = json.loads(message['header'], object_hook=BlockHeader.json_parser_hook)
+                if self._has_work(header):
+                    self._rebuild(peer, header, message['tx_hashes'])
+
+        elif kind == 'gettxs':
+            block = self._known_block(message['hash'])
+            if block is not None:
+                indexes = [i for i in message['indexes'] if 0 <= i < len(block.transactions)]
+                peer.send({'type': 'blocktxs', 'hash': block.hash, 'indexes': indexes,
+                           'txs': [block.transactions[i].dump() for i in indexes]})
+
+        elif kind == 'blocktxs':
+            with self._lock:
+                pending = self._pending.pop(message['hash'], None)
+            if pending is not None:
+                header, txs, _ = pending
+                for index, dump in zip(message['indexes'], message['txs']):
+                    txs[index] = json.loads(dump, object_hook=Transaction.json_parser_hook)
+                self.counters['fetched_txs'] += len(message['txs'])
+                if all(tx is not None for tx in txs):
+                    self._submit_block(peer, Block(header, txs))
+
+        elif kind == 'getblocks':
+            blocks, more = self._blocks_after(message['locator'])
+            peer.send({'type': 'blocks', 'blocks': [block.dump() for block in blocks], 'more': more})
+
+        elif kind == 'blocks':
+            self._add_synced(peer, [json.loads(dump, object_hook=Block.json_parser_hook) for dump in message['blocks']],
+                             message['more'])
+
+    def _rebuild(self, peer: GossipPeer, header: BlockHeader, tx_hashes: list[str]) -> None:
+        """Rebuilds compact block from mempool, missing transactions are requested from peer.
+
+        :return: None
+        """
+        txs = [self.node.mempool.get(tx_hash) for tx_hash in tx_hashes]
+        missing = [i for i, tx in enumerate(txs) if tx is None]
+        if not missing:
+            self.counters['compact_complete'] += 1
+            self._submit_block(peer, Block(header, txs))
+            return
+
+        self.counters['compact_fetched'] += 1
+        with self._lock:
+            self._pending[header.hash] = (header, txs, peer)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+        peer.send({'type': 'gettxs', 'hash': header.hash, 'indexes': missing})
+
+    def _known_block(self, block_hash: str) -> Optional[Block]:
+        """Returns block by hash from block tree or canonical chain.
+
+        :return: block or None if it is unknown
+        :rtype: Optional[Block]
+        """
+        blockchain = self.node.blockchain
+        entry = blockchain.tree.get(block_hash)
+        if entry is not None:
+            return entry.block
+
+        get_by_hash = getattr(blockchain.chain, 'get_by_hash', None)
+        if get_by_hash is not None:
+            return get_by_hash(block_hash)
+
+        return next((block for block in blockchain.chain if block.hash == block_hash), None)
+
+    def _has_work(self, header: BlockHeader) -> bool:
+        """Checks proof of work of block header before anything is fetched or kept for it. Blockchain checks it again,
+        lookup BlockChain._validate_block(...)
+
+        :return: True if header hash meets target the chain expects
+        :rtype: bool
+        """
+        if int(header.hash, 16) <= header.target == self.node.blockchain.expected_target(header.heigth):
+            return True
+
+        self.counters['rejected_blocks'] += 1
+        logger.debug(f'gossiped block {header.hash} is rejected: invalid proof of work')
+        return False
+
+    def _submit_block(self, peer: GossipPeer, block: Block) -> None:
+        """Submits block to node, or keeps it until its parent is fetched from peer.
+
+        :return: None
+        """
+        tree = self.node.blockchain.tree
+        parent_hash = block.header.parent_hash
+        if tree.get(block.hash) is not None or not self._has_work(block.header):
+            return
+        if tree.get(parent_hash) is None:
+            if block.header.heigth - 1 <= tree.base.height:
+                # parent would be at or below tree base, yet it is not there: branch can not be connected
+                self.counters['unconnectable'] += 1
+                return
+
+            with self._lock:
+                if block.hash in self._orphans:
+                    return
+                # orphans kept already wait for sync in flight, so they are not evicted
+                if len(self._orphans) < self.max_pending:
+                    self._orphans[block.hash] = (block, peer)
+                    self.counters['orphans'] += 1
+            self._sync(peer)
+            return
+
+        self.node.submit_block(block).add_done_callback(lambda done: self._on_block_added(block, done))
+
+    def _sync(self, peer: GossipPeer, after: Block = None) -> None:
+        """Requests blocks following the last common block from peer, unless they are requested already.
+
+        :param after: the last block of previous batch, continues sync in flight (optional)
+        :type after: Block
+        :return: None
+        """
+        with self._lock:
+            if peer.syncing and after is None:
+                return
+            peer.syncing = True
+
+        if after is None:
+            self.counters['syncs'] += 1
+        if not peer.send({'type': 'getblocks', 'locator': self._locator(after)}):
+            peer.syncing = False
+
+    def _locator(self, after: Block = None) -> list[list]:
+        """Returns locator of canonical chain: ten tip blocks, then exponentially sparser, down to block tree base.
+
+        :param after: block to be found first, e.g. the last synced one on a side branch (optional)
+        :type after: Block
+        :return: [height, hash] pairs, higher blocks first
+        :rtype: list[list]
+        """
+        blockchain = self.node.blockchain
+        base = blockchain.tree.base.height
+        locator = [[after.header.heigth, after.hash]] if after is not None else []
+
+        snapshot = blockchain.pin()
+        try:
+            height, step = snapshot.height, 1
+            while height > base:
+                locator.append([height, snapshot.block(height).hash])
+                if len(locator) >= 10:
+                    step *= 2
+                height -= step
+            locator.append([base, snapshot.block(base).hash])
+        finally:
+            blockchain.unpin(snapshot)
+
+        return locator
+
+    def _blocks_after(self, locator: list[list]) -> tuple[list[Block], bool]:
+        """Returns batch of canonical blocks following the first locator block found in canonical chain.
+
+        :return: blocks and True if there are more after them
+        :rtype: tuple[list[Block], bool]
+        """
+        blockchain = self.node.blockchain
+        snapshot = blockchain.pin()
+        try:
+            fork = next((height for height, block_hash in locator
+                         if 0 <= height <= snapshot.height and snapshot.block(height).hash == block_hash), None)
+            if fork is None:
+                return [], False
+
+            last = min(snapshot.height, fork + self.sync_batch)
+            return [snapshot.block(height) for height in range(fork + 1, last + 1)], last < snapshot.height
+        finally:
+            blockchain.unpin(snapshot)
+
+    def _add_synced(self, peer: GossipPeer, blocks: list[Block], more: bool) -> None:
+        """Submits batch of synced blocks in order and requests the next batch once the last one is added.
+
+        :return: None
+        """
+        tree = self.node.blockchain.tree
+        new = []
+        for block in blocks:
+            peer.known.add(block.hash)
+            self.seen_blocks.add(block.hash)
+            if tree.get(block.hash) is None and self._has_work(block.header):
+                new.append(block)
+
+        if not new:
+            if more:
+                self._sync(peer, blocks[-1])
+            else:
+                self._synced(peer, False)
+            return
+
+        self.counters['synced_blocks'] += len(new)
+        # mining worker adds blocks in order of submission, so every parent is added before its child
+        for block in new:
+            future = self.node.submit_block(block)
+            future.add_done_callback(lambda done, block=block: self._on_block_added(block, done))
+
+        last = new[-1]
+
+        def next_batch(done: Future) -> None:
+            if more and tree.get(last.hash) is not None:
+                self._sync(peer, last)
+            else:
+                self._synced(peer, tree.get(last.hash) is not None)
+
+        future.add_done_callback(next_batch)
+
+    def _synced(self, peer: GossipPeer, progressed: bool) -> None:
+        """Ends sync with peer. Orphans of peer which still wait for parent are synced again if sync has brought new
+        blocks (peer may have moved on meanwhile), otherwise they are dropped.
+
+        :param progressed: the last batch has added blocks
+        :type progressed: bool
+        :return: None
+        """
+        tree = self.node.blockchain.tree
+        with self._lock:
+            waiting = [block_hash for block_hash, (orphan, p) in self._orphans.items()
+                       if p is peer and tree.get(orphan.header.parent_hash) is None]
+            if not progressed:
+                for block_hash in waiting:
+                    del self._orphans[block_hash]
+            peer.syncing = False
+
+        if progressed and waiting:
+            self._sync(peer)
+
+    def _on_block_added(self, block: Block, done: Future) -> None:
+        # block may be rejected as known already, e.g. it came from another peer meanwhile
+        if done.exception() is not None and self.node.blockchain.tree.get(block.hash) is None:
+            self.counters['rejected_blocks'] += 1
+            logger.debug(f'gossiped block {block.hash} is rejected: {done.exception()!r}')
+            return
+
+        with self._lock:
+            children = [(orphan, peer) for orphan, peer in self._orphans.values()
+                        if orphan.header.parent_hash == block.hash]
+            for orphan, _ in children:
+                del self._orphans[orphan.hash]
+        for orphan, peer in children:
+            self._submit_block(peer, orphan)
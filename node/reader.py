@@ -0,0 +1,315 @@
+import os
+import threading
+import time
+from typing import Callable, Optional, Union
+
+from jsonrpc.backend.flask import api
+
+from node.events import EventType
+from node.writer import WriterClient
+from primitives import Block, Reorg, WorldState
+from primitives.account_cache import AccountCache
+from storage import BlockStore, CheckpointManager, TxIndex
+from utils import config, logger, metrics, handle_exception
+
+# methods answered from memory of writer: mempool, holders index, admission and mining metrics
+FORWARDED_METHODS = ('mempool.stats', 'asset.holders', 'asset.top_holders')
+# forwarded methods writer answers at tip pinned by worker, so they agree with the rest of JSON-RPC batch request
+SNAPSHOT_METHODS = ('asset.holders', 'asset.top_holders')
+FOLLOW_INTERVAL = config.getfloat('deployment', 'follow_interval', fallback=0.2)
+
+
+class DiskSnapshot(object):
+    """Represents read view of blockchain pinned at tip published by writer process, lookup ChainSnapshot.
+
+    Public attributes:
+        tip — tip block
+        hash — tip hash
+        height — tip height
+        state — world state after tip, read-only and without holders index, read through fixed tries roots
+        state_roots_hash — roots hash of state
+    Public methods:
+        block(...) — returns block of canonical chain by height
+
+    State is immutable. Blocks below tip are read from block store, which follows writer: if writer has reorganized
+    chain since snapshot was pinned, they may belong to the new branch.
+    """
+    __slots__ = ('tip', 'hash', 'height', 'state', 'state_roots_hash', '_chain')
+
+    def __init__(self, tip: Block, head: dict, chain: BlockStore, storages: tuple[dict, dict],
+                 account_cache: AccountCache) -> None:
+        """Initialization of snapshot.
+
+        :param tip: tip block
+        :type tip: Block
+        :param head: head published by writer, lookup CheckpointManager.write_head(...)
+        :type head: dict
+        :param chain: block store
+        :type chain: BlockStore
+        :param storages: accounts and assets tries storages
+        :type storages: tuple[dict, dict]
+        :param account_cache: cache of materialized accounts shared by snapshots
+        :type account_cache: AccountCache
+        """
+        self.tip = tip
+        self.hash = tip.hash
+        self.height = tip.header.heigth
+        self.state = WorldState.from_indexes(head['state'], storages, account_cache, holders=False)
+        self.state_roots_hash = head['state_roots_hash']
+        self._chain = chain
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.height}, {self.hash})'
+
+    def block(self, height: int) -> Block:
+        """Returns block of canonical chain by height.
+
+        :param height: block height
+        :type height: int
+        :return: block
+        :rtype: Block
+        :raises IndexError: if there is no block at height in snapshot
+        """
+        if not 0 <= height <= self.height:
+            raise IndexError(height)
+        if height == self.height:
+            return self.tip
+
+        return self._chain[height]
+
+
+class ChainReader(object):
+    """Follows blockchain persisted by writer process and stands for node.blockchain in RPC worker process.
+
+    Public attributes:
+        chain — read-only block store
+        checkpoints — read-only checkpoint manager, its tries storages hold states
+        tx_index — transactions index, maintained by writer
+        tree — always None, side branches live in writer only
+        on_new_tip — callback executed with new tip and Reorg when reader moves to new tip (optional)
+        snapshot — snapshot of the last followed tip
+    Public methods:
+        pin(...) — follows writer if it has published new head and returns snapshot of tip
+        unpin(...) — does nothing, snapshots hold no resources
+
+    Writer publishes head after block and state nodes are written, lookup CheckpointManager.write_head(...), so
+    everything head refers to is readable once head is seen. Head is checked by one stat per pin(...); when it has
+    changed, one thread refreshes stores and publishes new snapshot by single assignment, others keep reading the
+    previous one meanwhile.
+    Reader sees only tips, not every block, and blocks of abandoned branch are overwritten in block store. So reader
+    remembers canonical blocks it has followed, max_reorg_depth of them: new tip which does not descend from previous
+    one is reported as Reorg from the highest remembered block still in block store, with blocks connected since it.
+    Reorganization deeper than that is reported from the lowest remembered block, with unknown ancestor.
+    """
+    tree = None
+    on_new_tip: Optional[Callable[[Block, Optional[Reorg]], None]] = None
+    _snapshot: Optional[DiskSnapshot] = None
+    _head_key: tuple = None
+    _followed: dict[int, Block] = None
+
+    @property
+    def snapshot(self) -> DiskSnapshot:
+        return self._snapshot
+
+    def __init__(self, data_dir: str, account_cache_size: int = 100_000, max_reorg_depth: int = 256) -> None:
+        """Initialization of reader, opens stores of data directory read-only and follows current head.
+
+        :param data_dir: data directory of writer, lookup run.open_blockchain(...)
+        :type data_dir: str
+        :param account_cache_size: maximum number of accounts cached by process
+        :type account_cache_size: int
+        :param max_reorg_depth: number of followed blocks remembered to report reorganizations, SHOULD cover block
+            tree depth of writer (2 * BlockTree.max_depth)
+        :type max_reorg_depth: int
+        """
+        self.max_reorg_depth = max_reorg_depth
+        self.chain = BlockStore(os.path.join(data_dir, 'blocks'), readonly=True)
+        self.checkpoints = CheckpointManager(os.path.join(data_dir, 'state'), readonly=True)
+        self.tx_index = TxIndex(os.path.join(data_dir, 'tx_index.sqlite'))
+        self._head_path = os.path.join(self.checkpoints.path, CheckpointManager.HEAD)
+        self._account_cache = AccountCache(account_cache_size)
+        self._lock = threading.Lock()
+
+        self._follow()
+        assert self._snapshot is not None, 'writer has not published head'
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._snapshot})'
+
+    def pin(self) -> DiskSnapshot:
+        """Follows writer if it has published new head and returns snapshot of tip. Never waits for another thread
+        following writer.
+
+        :return: snapshot of tip
+        :rtype: DiskSnapshot
+        """
+        if self._head_changed() and self._lock.acquire(blocking=False):
+            try:
+                self._follow()
+            finally:
+                self._lock.release()
+
+        return self._snapshot
+
+    def unpin(self, snapshot: DiskSnapshot) -> None:
+        """Does nothing, lookup BlockChain.unpin(...)
+
+        :return: None
+        """
+
+    def _head_changed(self) -> bool:
+        try:
+            stat = os.stat(self._head_path)
+        except OSError:
+            return False
+        # head is replaced by rename, so new head has new inode
+        return (stat.st_ino, stat.st_mtime_ns) != self._head_key
+
+    def _follow(self) -> None:
+        """Refreshes stores and publishes snapshot of head, unless writer has moved on from it meanwhile.
+
+        :return: None
+        """
+        try:
+            stat = os.stat(self._head_path)
+        except OSError:
+            return
+        head = self.checkpoints.read_head()
+        if head is None:
+            return
+
+        with metrics.latency('reader.follow').time():
+            self.chain.refresh()
+            for storage in self.checkpoints.storages:
+                storage.refresh()
+
+            height = head['height']
+            # head may be replaced by a newer one already, which is picked up by the next pin(...)
+            if self.chain.height_of(head['block_hash']) != height:
+                return
+
+            tip = self.chain[height]
+            previous = self._snapshot
+            reorg = None
+            if previous is None:
+                self._followed = {height: tip}
+            elif previous.hash != tip.hash:
+                reorg = self._reorg(tip)
+                if reorg is False:
+                    return
+            self._snapshot = DiskSnapshot(tip, head, self.chain, self.checkpoints.storages, self._account_cache)
+            self._head_key = (stat.st_ino, stat.st_mtime_ns)
+
+        if previous is None or previous.hash == tip.hash or self.on_new_tip is None:
+            return
+
+        self.on_new_tip(tip, reorg)
+
+    def _reorg(self, tip: Block) -> Union[Reorg, None, bool]:
+        """Finds how chain has changed since the last followed tip and remembers blocks of new one.
+
+        :return: Reorg, None if tip descends from previous one, False if block store was changed meanwhile
+        :rtype: Union[Reorg, None, bool]
+        """
+        followed = self._followed
+        height = tip.header.heigth
+        lowest = min(followed)
+        # the highest remembered block still in canonical chain is common ancestor
+        fork = next((h for h in range(min(height, max(followed)), lowest - 1, -1)
+                     if self.chain.height_of(followed[h].hash) == h), None)
+        start = lowest if fork is None else fork + 1
+
+        connected = [self.chain[h] for h in range(start, height)] + [tip]
+        parent = followed.get(start - 1)
+        for block in connected:
+            # writer may have switched branch again while blocks were read
+            if parent is not None and block.header.parent_hash != parent.hash:
+                return False
+            parent = block
+
+        disconnected = [followed[h] for h in range(start, max(followed) + 1)]
+        for h in range(start, max(followed) + 1):
+            del followed[h]
+        for block in connected:
+            followed[block.header.heigth] = block
+        for h in range(lowest, height - self.max_reorg_depth + 1):
+            followed.pop(h, None)
+
+        if not disconnected:
+            return None
+
+        return Reorg(followed.get(start - 1), disconnected, connected, 0.)
+
+
+def serve_reads(node, data_dir: str, socket_path: str) -> None:
+    """Turns node of RPC worker process into reader: reads are served from stores of data directory, writes and
+    methods answered from memory of writer are forwarded to writer process over Unix socket.
+
+    Node is not started: it neither mines nor admits transactions itself. Reader follows writer in background
+    thread too, so event stream of node gets new blocks (but not mempool additions) without requests.
+    Holders methods are answered by writer at tip pinned by worker for request, lookup SNAPSHOT_METHODS; they fail
+    if writer has pruned that block meanwhile. Mempool is not part of snapshot, so mempool.stats is current.
+
+    :param node: node of worker process
+    :type node: Node
+    :param data_dir: data directory of writer
+    :type data_dir: str
+    :param socket_path: Unix socket path of writer, lookup node.writer.WriterServer
+    :type socket_path: str
+    :return: None
+    """
+    from node import rpc
+
+    reader = ChainReader(data_dir)
+    writer = WriterClient(socket_path, timeout=rpc.SUBMIT_TIMEOUT)
+
+    node.blockchain = reader
+    node.admission = writer
+    node.responses.invalidate(reader.snapshot.tip)
+    followed = [reader.snapshot.height]
+
+    def on_new_tip(tip: Block, reorg: Optional[Reorg]) -> None:
+        node.responses.invalidate(tip, reorg)
+        # event stream of worker is fed with blocks reader has moved over, mempool additions stay in writer
+        if reorg is None:
+            connected = [reader.chain[skipped] for skipped in range(followed[0] + 1, tip.header.heigth)] + [tip]
+        else:
+            node.events.publish(EventType.reorg, {'old_tip': reorg.disconnected[-1], 'new_tip': tip, 'reorg': reorg})
+            connected = reorg.connected
+        for block in connected:
+            node.events.publish(EventType.new_block, block)
+        followed[0] = tip.header.heigth
+
+    def follow() -> None:
+        # streams are fed without requests pinning snapshots
+        while True:
+            time.sleep(FOLLOW_INTERVAL)
+            try:
+                reader.pin()
+            except Exception as e:
+                handle_exception(logger, e)
+
+    reader.on_new_tip = on_new_tip
+    threading.Thread(target=follow, name='reader-follow', daemon=True).start()
+
+    for name in FORWARDED_METHODS:
+        api.dispatcher[name] = writer.method(name, (lambda: node.pinned().hash) if name in SNAPSHOT_METHODS else None)
+
+    forwarded_tx_get = writer.method('tx.get')
+    forwarded_metrics = writer.method('node.metrics')
+
+    def tx_get(tx_hash):
+        confirmed = rpc.chain_tx(tx_hash)
+        if confirmed is not None:
+            return dict(confirmed, status='confirmed')
+        return forwarded_tx_get(tx_hash)
+
+    def node_metrics():
+        return dict(forwarded_metrics(),
+                    worker={'pid': os.getpid(), 'rpc': metrics.snapshot(), 'cache': node.responses.stats(),
+                            'streams': node.streams.stats()})
+
+    tx_get.__doc__ = rpc.tx_get.__doc__
+    node_metrics.__doc__ = rpc.node_metrics.__doc__
+    api.dispatcher['tx.get'] = tx_get
+    api.dispatcher['node.metrics'] = node_metrics
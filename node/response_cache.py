@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Callable, Optional
+
+from primitives import Block, Reorg
+
+
+class CachePolicy(Enum):
+    """Implemented caching policies of RPC methods.
+
+        - tip — result depends on chain tip, cached per tip hash and dropped when tip changes
+        - immutable — result never changes while canonical chain only grows (blocks, confirmed transactions),
+          cached until reorganization; None results are not cached, they may change as chain grows
+    """
+    tip = 'tip'
+    immutable = 'immutable'
+
+
+class ResponseCache(object):
+    """Caches results of RPC methods keyed by (method, params, tip hash) under memory bound.
+
+    Public attributes:
+        max_bytes — maximum total size of cached results, measured as length of their JSON dumps
+        hits, misses — lookup counters
+        saved — total time methods would have spent computing results served from cache, seconds
+    Public methods:
+        cached(...) — decorator caching results of RPC method
+        invalidate(...) — drops entries outdated by new chain tip
+        stats(...) — returns counters, hit ratio, saved latency and size
+    Private attributes:
+        _entries — LRU key -> (result, size, computing time)
+        _tip_keys — keys of entries of CachePolicy.tip
+        _tip — hash of current chain tip, lookup invalidate(...)
+
+    Cached results are shared between responses, they SHOULD NOT be modified.
+    Entries of tip-dependent methods are unreachable once tip changes, invalidate(...) frees them. Reorganization
+    drops everything. Only results computed at current tip are stored, so result of request pinned at an older tip
+    never outlives the invalidation it missed.
+    Thread-safe.
+    """
+
+    def __init__(self, tip_hash: Callable[[], str], max_bytes: int = 64 * 2 ** 20) -> None:
+        """Initialization of cache.
+
+        :param tip_hash: callable returning hash of chain tip request is answered at
+        :type tip_hash: Callable[[], str]
+        :param max_bytes: maximum total size of cached results, bytes of JSON
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.
+        self._tip_hash = tip_hash
+        self._entries: OrderedDict[tuple, tuple[Any, int, float]] = OrderedDict()
+        self._tip_keys: set[tuple] = set()
+        self._size = 0
+        self._tip: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self._entries)} entries, {self._size}/{self.max_bytes} bytes, ' \
+               f'{self.hits} hits, {self.misses} misses)'
+
+    def cached(self, name: str, policy: CachePolicy) -> Callable[[Callable], Callable]:
+        """Returns decorator caching results of RPC method.
+
+        :param name: name of method, part of cache key
+        :type name: str
+        :param policy: caching policy of method
+        :type policy: CachePolicy
+        :return: decorator
+        :rtype: Callable[[Callable], Callable]
+        """
+        def decorator(method: Callable) -> Callable:
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                params = json.dumps([args, kwargs], sort_keys=True)
+                tip = self._tip_hash()
+                key = (name, params, tip) if policy is CachePolicy.tip else (name, params)
+
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        self.saved += entry[2]
+                        return entry[0]
+                    self.misses += 1
+
+                started = time.perf_counter()
+                result = method(*args, **kwargs)
+                seconds = time.perf_counter() - started
+
+                if result is not None or policy is CachePolicy.tip:
+                    self._put(key, result, seconds, tip, policy is CachePolicy.tip)
+
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def _put(self, key: tuple, result: Any, seconds: float, tip_hash: str, tip: bool) -> None:
+        """Stores result if it was computed at current tip.
+
+        :return: None
+        """
+        size = len(json.dumps(result))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if tip_hash != self._tip or key in self._entries:
+                return
+
+            self._entries[key] = (result, size, seconds)
+            self._size += size
+            if tip:
+                self._tip_keys.add(key)
+
+            while self._size > self.max_bytes:
+                evicted, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._tip_keys.discard(evicted)
+
+    def invalidate(self, tip: Block, reorg: Optional[Reorg] = None) -> None:
+        """Drops entries outdated by new chain tip: tip-dependent ones, and all of them on reorganization.
+        Nothing is stored until it is called with the first tip.
+
+        :param tip: new chain tip
+        :type tip: Block
+        :param reorg: reorganization tip was switched by (optional)
+        :type reorg: Reorg
+        :return: None
+        """
+        with self._lock:
+            self._tip = tip.hash
+            if reorg is not None:
+                self._entries.clear()
+                self._tip_keys.clear()
+                self._size = 0
+                return
+
+            for key in self._tip_keys:
+                self._size -= self._entries.pop(key)[1]
+            self._tip_keys = set()
+
+    def stats(self) -> dict[str, Any]:
+        """Returns counters, hit ratio, saved latency and size.
+
+        :return: hits, misses, hit ratio, saved time (ms), number of entries, size and its bound (bytes)
+        :rtype: dict[str, Any]
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.,
+                'saved_ms': self.saved * 1000,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes}
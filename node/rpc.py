@@ -1,8 +1,147 @@
+import json
+import time
+from typing import Any, Iterator, Optional, Union
+
+from flask import Response, abort, g, request
 from jsonrpc.backend.flask import api
 
 from node import server
+from node.admission import admission_result
+from node.response_cache import CachePolicy
+from node.streams import StreamTopic
+from primitives import AssetOwnershipType, Block
+from utils import config, metrics
+
+SUBMIT_TIMEOUT = config.getfloat('rpc', 'submit_timeout', fallback=30.)
+MAX_SUBMIT_BATCH = 1000
+MAX_BALANCES = 1000
+STREAM_CHUNK = 64
+
+
+def _tx_key(raw: Union[str, dict]) -> str:
+    return json.dumps(raw, sort_keys=True) if isinstance(raw, dict) else str(raw)
+
+
+def _submit_batch_calls() -> None:
+    """Submits transactions of every tx.submit call of JSON-RPC batch request with one admission call.
+
+    Calls find futures of their transactions in g.submitted, so admission of the whole batch is pipelined instead
+    of being waited for call by call.
+
+    :return: None
+    """
+    calls = request.get_json(force=True, silent=True)
+    if not isinstance(calls, list):
+        return
+
+    raws = []
+    for call in calls:
+        if not isinstance(call, dict) or call.get('method') != 'tx.submit':
+            continue
+        params = call.get('params')
+        if isinstance(params, list) and len(params) == 1:
+            raws.append(params[0])
+        elif isinstance(params, dict) and 'tx' in params:
+            raws.append(params['tx'])
+
+    if len(raws) > 1:
+        g.submitted = {}
+        for raw, future in zip(raws, server.admission.submit_many(raws)):
+            g.submitted.setdefault(_tx_key(raw), []).append(future)
+
+
+def _block_by_hash(block_hash: str) -> tuple[Optional[Block], bool]:
+    """Returns block by hash from block tree (any branch) or canonical chain.
+
+    :return: block or None if it is unknown, whether block is in canonical chain of pinned snapshot
+    :rtype: tuple[Optional[Block], bool]
+    """
+    snapshot = server.pinned()
+
+    # reader processes have no block tree, lookup node.reader
+    tree = server.blockchain.tree
+    entry = tree.get(block_hash) if tree is not None else None
+    if entry is not None:
+        canonical = entry.height <= snapshot.height and snapshot.block(entry.height).hash == block_hash
+        return entry.block, canonical
 
-server.register_blueprint(api.as_blueprint())
+    height_of = getattr(server.blockchain.chain, 'height_of', None)
+    height = height_of(block_hash) if height_of is not None else None
+    if height is None or height > snapshot.height:
+        return None, False
+
+    found = snapshot.block(height)
+    return (found, True) if found.hash == block_hash else (None, False)
+
+
+def _block_summary(block: Block, canonical: bool = True) -> dict[str, Any]:
+    return dict(json.loads(block.header.dump()), canonical=canonical, tx_hashes=[tx.hash for tx in block.transactions])
+
+
+def _stream_block(block: Block) -> Iterator[str]:
+    """Yields JSON of block piece by piece, transactions in chunks of STREAM_CHUNK.
+
+    :return: pieces of {"hash": ..., "header": {...}, "transactions": [{...}, ...]}
+    :rtype: Iterator[str]
+    """
+    yield f'{{"hash": {json.dumps(block.hash)}, "header": {block.header.dump()}, "transactions": ['
+    txs = block.transactions
+    for begin in range(0, len(txs), STREAM_CHUNK):
+        yield (', ' if begin else '') + ', '.join(tx.dump() for tx in txs[begin:begin + STREAM_CHUNK])
+    yield ']}'
+
+
+blueprint = api.as_blueprint()
+blueprint.before_request(_submit_batch_calls)
+server.register_blueprint(blueprint)
+
+
+@server.route('/blocks/<ref>', methods=['GET'])
+def block(ref):
+    """
+    Streams block with full transactions by height or hash.
+
+    :param ref: block height or hash
+    :type ref: str
+    :return: {"hash": ..., "header": {...}, "transactions": [{...}, ...]}, 404 if block is unknown
+    :rtype: Response
+    """
+    if ref.isdigit():
+        try:
+            found = server.pinned().block(int(ref))
+        except IndexError:
+            abort(404)
+    else:
+        found, _ = _block_by_hash(ref)
+        if found is None:
+            abort(404)
+
+    return Response(_stream_block(found), mimetype='application/json')
+
+
+@server.route('/events', methods=['GET'])
+def events():
+    """
+    Streams new blocks and transactions as server-sent events.
+
+    Query parameters (optional): "topics" — comma-separated block, tx_confirmed, tx_pending, reorg (all by default),
+    "accounts" — comma-separated accounts transactions are filtered by (every transaction by default). Client which
+    does not keep up is dropped, lookup node.streams.EventStream.
+
+    :return: text/event-stream of events with JSON data, 400 if topic is unknown
+    :rtype: Response
+    """
+    topics = request.args.get('topics')
+    accounts = request.args.get('accounts')
+    try:
+        topics = [StreamTopic(topic) for topic in topics.split(',')] if topics else None
+    except ValueError:
+        abort(400)
+
+    client = server.streams.connect(topics, accounts.split(',') if accounts else None)
+
+    return Response(server.streams.stream(client), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @api.dispatcher.add_method(name='service.echo')
@@ -21,3 +160,279 @@ def echo(*args, **kwargs):
     return args, kwargs
 
 
+@api.dispatcher.add_method(name='mempool.stats')
+def mempool_stats():
+    """
+    Returns mempool counters for monitoring.
+
+    :return: number of transactions and senders, total size and caps
+    :rtype: Mapping[str, int]
+    """
+
+    return server.mempool.stats()
+
+
+@api.dispatcher.add_method(name='node.metrics')
+def node_metrics():
+    """
+    Returns node metrics: latencies of RPC requests and mining, counters, event bus subscribers stats, admission
+    pipeline stages stats, RPC response cache stats, event stream stats, gossip stats.
+
+    :return: latencies summaries (ms), counters, event subscribers stats, admission stages stats, cache stats,
+        event stream stats and gossip stats (null if gossip is off)
+    :rtype: Mapping[str, Mapping[]]
+    """
+
+    return dict(metrics.snapshot(), events=server.events.stats(), admission=server.admission.stats(),
+                cache=server.responses.stats(), streams=server.streams.stats(),
+                gossip=server.gossip.stats() if server.gossip is not None else None)
+
+
+@api.dispatcher.add_method(name='chain.tx')
+@server.responses.cached('chain.tx', CachePolicy.immutable)
+def chain_tx(tx_hash):
+    """
+    Returns transaction of canonical chain by hash with its location.
+
+    :param tx_hash: transaction hash
+    :type tx_hash: str
+    :return: height, index in block, block hash and transaction or None if transaction is not in chain
+    :rtype: Mapping[str, Any]
+    """
+    if server.blockchain.tx_index is None:
+        return None
+
+    location = server.blockchain.tx_index.get(tx_hash)
+    if location is None:
+        return None
+
+    height, index = location
+    try:
+        block = server.pinned().block(height)
+        tx = block.transactions[index]
+    except IndexError:
+        return None
+    # index follows the live chain, which may have been reorganized since snapshot was pinned
+    if tx.hash != tx_hash:
+        return None
+
+    return {'height': height, 'index': index, 'block_hash': block.hash, 'tx': json.loads(tx.dump())}
+
+
+@api.dispatcher.add_method(name='account.history')
+@server.responses.cached('account.history', CachePolicy.tip)
+def account_history(account, limit=100, before=None):
+    """
+    Returns page of transactions account is sender or recipient of, newest first.
+
+    :param account: account name
+    :type account: str
+    :param limit: page size
+    :type limit: int
+    :param before: [height, index] of last transaction of previous page, "next" of previous response (optional)
+    :type before: Set[int, int]
+    :return: transactions (height, index, hash) and "next" cursor, null on last page
+    :rtype: Mapping[str, Any]
+    """
+    assert 0 < limit <= 1000
+    locations = server.blockchain.tx_index.history(account, limit, tuple(before) if before else None)
+    snapshot = server.pinned()
+
+    txs = []
+    for height, index in locations:
+        try:
+            tx_hash = snapshot.block(height).transactions[index].hash
+        except IndexError:
+            continue
+        txs.append({'height': height, 'index': index, 'hash': tx_hash})
+
+    return {'txs': txs, 'next': list(locations[-1]) if len(locations) == limit else None}
+
+
+@api.dispatcher.add_method(name='asset.holders')
+@server.responses.cached('asset.holders', CachePolicy.tip)
+def asset_holders(asset, ownership_type='00', limit=100, after=None):
+    """
+    Returns page of accounts holding asset at chain tip with their balances, ordered by account name.
+
+    :param asset: asset name
+    :type asset: str
+    :param ownership_type: ownership type value
+    :type ownership_type: str
+    :param limit: page size
+    :type limit: int
+    :param after: last account of previous page, "next" of previous response (optional)
+    :type after: str
+    :return: holders [account, balance] and "next" cursor, null on last page
+    :rtype: Mapping[str, Any]
+    """
+    assert 0 < limit <= 1000
+    holders = server.pinned().state.holders(asset, AssetOwnershipType(ownership_type), limit, after)
+
+    return {'holders': holders, 'next': holders[-1][0] if len(holders) == limit else None}
+
+
+@api.dispatcher.add_method(name='asset.top_holders')
+@server.responses.cached('asset.top_holders', CachePolicy.tip)
+def asset_top_holders(asset, ownership_type='00', n=10):
+    """
+    Returns accounts with the largest balances of asset at chain tip.
+
+    :param asset: asset name
+    :type asset: str
+    :param ownership_type: ownership type value
+    :type ownership_type: str
+    :param n: number of holders
+    :type n: int
+    :return: [account, balance] pairs, the largest balance first
+    :rtype: Set[Set[str, int]]
+    """
+    assert 0 < n <= 1000
+
+    return server.pinned().state.top_holders(asset, AssetOwnershipType(ownership_type), n)
+
+
+@api.dispatcher.add_method(name='account.balance')
+@server.responses.cached('account.balance', CachePolicy.tip)
+def account_balance(account, asset, ownership_type='00'):
+    """
+    Returns amount of asset on account at chain tip.
+
+    :param account: account name
+    :type account: str
+    :param asset: asset name
+    :type asset: str
+    :param ownership_type: ownership type value
+    :type ownership_type: str
+    :return: amount
+    :rtype: int
+    """
+
+    return server.pinned().state.get_amount(account, asset, AssetOwnershipType(ownership_type))
+
+
+@api.dispatcher.add_method(name='account.balances')
+@server.responses.cached('account.balances', CachePolicy.tip)
+def account_balances(queries):
+    """
+    Returns amounts of many (account, asset) pairs at one chain tip.
+
+    :param queries: [account, asset] or [account, asset, ownership_type] lists
+    :type queries: Set[Set[str]]
+    :return: height and hash of chain tip and amounts, in order of queries
+    :rtype: Mapping[str, Any]
+    """
+    assert 0 < len(queries) <= MAX_BALANCES
+    snapshot = server.pinned()
+
+    balances = [snapshot.state.get_amount(account, asset, AssetOwnershipType(ownership_type[0] if ownership_type else '00'))
+                for account, asset, *ownership_type in queries]
+
+    return {'height': snapshot.height, 'block_hash': snapshot.hash, 'balances': balances}
+
+
+@api.dispatcher.add_method(name='chain.tip')
+def chain_tip():
+    """
+    Returns height and hash of chain tip.
+
+    :return: height, block hash and state roots hash
+    :rtype: Mapping[str, Any]
+    """
+    snapshot = server.pinned()
+
+    return {'height': snapshot.height, 'block_hash': snapshot.hash, 'state_roots_hash': snapshot.state_roots_hash}
+
+
+@api.dispatcher.add_method(name='chain.block')
+@server.responses.cached('chain.block', CachePolicy.immutable)
+def chain_block(height):
+    """
+    Returns header and transaction hashes of canonical chain block by height. Full block is streamed by
+    GET /blocks/<height>.
+
+    :param height: block height
+    :type height: int
+    :return: header fields, "canonical" flag and "tx_hashes" or None if there is no block at height
+    :rtype: Mapping[str, Any]
+    """
+    assert isinstance(height, int) and height >= 0
+    try:
+        return _block_summary(server.pinned().block(height))
+    except IndexError:
+        return None
+
+
+@api.dispatcher.add_method(name='chain.block_by_hash')
+@server.responses.cached('chain.block_by_hash', CachePolicy.immutable)
+def chain_block_by_hash(block_hash):
+    """
+    Returns header and transaction hashes of block by hash, side branches included. Full block is streamed by
+    GET /blocks/<hash>.
+
+    :param block_hash: block hash
+    :type block_hash: str
+    :return: header fields, "canonical" flag and "tx_hashes" or None if block is unknown
+    :rtype: Mapping[str, Any]
+    """
+    found, canonical = _block_by_hash(block_hash)
+    if found is None:
+        return None
+
+    return _block_summary(found, canonical)
+
+
+@api.dispatcher.add_method(name='tx.get')
+def tx_get(tx_hash):
+    """
+    Returns transaction by hash from canonical chain or mempool.
+
+    :param tx_hash: transaction hash
+    :type tx_hash: str
+    :return: chain.tx result with "status" "confirmed", or "status" "pending" and transaction, or None if unknown
+    :rtype: Mapping[str, Any]
+    """
+    confirmed = chain_tx(tx_hash)
+    if confirmed is not None:
+        return dict(confirmed, status='confirmed')
+
+    tx = server.mempool.get(tx_hash)
+    if tx is None:
+        return None
+
+    return {'status': 'pending', 'tx': json.loads(tx.dump())}
+
+
+@api.dispatcher.add_method(name='tx.submit')
+def tx_submit(tx):
+    """
+    Submits transaction to admission pipeline and waits for its admission. Transactions of all tx.submit calls of
+    JSON-RPC batch request are admitted together.
+
+    :param tx: transaction JSON dump or object
+    :type tx: Union[str, Mapping[str, Any]]
+    :return: "accepted" flag (null if admission did not finish in time), "stage" and "reason" of rejection
+    :rtype: Mapping[str, Any]
+    """
+    deadline = time.monotonic() + SUBMIT_TIMEOUT
+    futures = g.get('submitted', {}).get(_tx_key(tx))
+    future = futures.pop(0) if futures else server.admission.submit(tx)
+
+    return admission_result(future, deadline)
+
+
+@api.dispatcher.add_method(name='tx.submit_batch')
+def tx_submit_batch(txs):
+    """
+    Submits many transactions to admission pipeline with one call and waits for their admission.
+
+    :param txs: transactions JSON dumps or objects, in order of admission
+    :type txs: Set[Union[str, Mapping[str, Any]]]
+    :return: tx.submit results, in order of transactions
+    :rtype: Set[Mapping[str, Any]]
+    """
+    assert 0 < len(txs) <= MAX_SUBMIT_BATCH
+    deadline = time.monotonic() + SUBMIT_TIMEOUT
+    futures = server.admission.submit_many(txs)
+
+    return [admission_result(future, deadline) for future in futures]
@@ -0,0 +1,263 @@
+import json
+import threading
+from collections import deque
+from enum import Enum
+from typing import Iterable, Iterator, Optional
+
+from node.events import Event, EventBus, EventType, Subscription
+from primitives import Block, Transaction
+from storage.tx_index import involved_accounts
+
+
+class StreamTopic(Enum):
+    """Implemented topics of event stream.
+
+        - block — header of block added to canonical chain, with its hash
+        - tx_confirmed — hash and location of transaction of block added to canonical chain
+        - tx_pending — hash of transaction admitted to mempool
+        - reorg — canonical tip was switched to another branch: old and new tips and depth
+    Transactions topics are filtered by accounts (lookup storage.tx_index.involved_accounts), block and reorg topics
+    are delivered regardless of accounts.
+    """
+    block = 'block'
+    tx_confirmed = 'tx_confirmed'
+    tx_pending = 'tx_pending'
+    reorg = 'reorg'
+
+
+class StreamClient(object):
+    """Represents subscriber of EventStream, e.g. one server-sent events connection.
+
+    Public attributes:
+        topics — topics client receives
+        accounts — accounts transactions are filtered by, None for every transaction
+        max_buffer — maximum number of frames buffered for client
+        sent — number of frames sent to client
+        dropped — client was disconnected because its buffer was full
+        closed — stream of client ends once its buffer is sent
+    Public methods:
+        offer(...) — buffers frame if it passes filters
+        close(...) — wakes up and ends stream of client
+    """
+
+    def __init__(self, topics: frozenset[StreamTopic], accounts: Optional[frozenset[str]], max_buffer: int) -> None:
+        self.topics = topics
+        self.accounts = accounts
+        self.max_buffer = max_buffer
+        self.sent = 0
+        self.dropped = False
+        self.closed = False
+        self._buffer: deque[bytes] = deque()
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({[t.value for t in self.topics]}, {len(self._buffer)}/{self.max_buffer})'
+
+    def offer(self, topic: StreamTopic, accounts: Optional[set[str]], frame: bytes) -> bool:
+        """Buffers frame if it passes filters of client. Client is closed as dropped if its buffer is full.
+
+        :param topic: topic of frame
+        :type topic: StreamTopic
+        :param accounts: accounts frame concerns, None if it is not account-scoped
+        :type accounts: Optional[set[str]]
+        :param frame: encoded frame, shared by all clients
+        :type frame: bytes
+        :return: False if client is closed and SHOULD be disconnected
+        :rtype: bool
+        """
+        if topic not in self.topics:
+            return True
+        if accounts is not None and self.accounts is not None and self.accounts.isdisjoint(accounts):
+            return True
+
+        with self._condition:
+            if self.closed:
+                return False
+            if len(self._buffer) >= self.max_buffer:
+                # slow consumer would hold growing buffer, it is dropped instead and reconnects
+                self._buffer.clear()
+                self.dropped = True
+                self.closed = True
+            else:
+                self._buffer.append(frame)
+            self._condition.notify()
+
+        return not self.closed
+
+    def close(self) -> None:
+        """Wakes up and ends stream of client, buffered frames are still sent.
+
+        :return: None
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+    def _take(self, timeout: float) -> Optional[list[bytes]]:
+        """Waits for buffered frames.
+
+        :return: buffered frames, empty if timeout has passed, None if client is closed and has nothing buffered
+        :rtype: Optional[list[bytes]]
+        """
+        with self._condition:
+            if not self._buffer and not self.closed:
+                self._condition.wait(timeout)
+            if not self._buffer:
+                return None if self.closed else []
+            frames = list(self._buffer)
+            self._buffer.clear()
+
+        return frames
+
+
+class EventStream(object):
+    """Streams node events to clients as server-sent events with server-side filters.
+
+    Public attributes:
+        max_buffer — default maximum number of frames buffered for one client
+        keepalive — interval of keepalive comments sent to idle clients, seconds
+        published — number of events published to clients, id of the last one
+        dropped — number of clients dropped because they did not keep up
+    Public methods:
+        attach(...) — subscribes stream to event bus of node
+        connect(...) — registers client with filters
+        disconnect(...) — unregisters client
+        stream(...) — yields encoded frames of client, for streaming response
+        stats(...) — returns clients and counters
+
+    Every event is encoded once, into "id", "event" and "data" lines, and the same bytes are buffered for every
+    client whose filters it passes. Publisher never waits for clients: each client has bounded buffer and is
+    disconnected when it is full, so one slow consumer neither delays others nor holds growing memory.
+    """
+    _subscription: Subscription = None
+
+    def __init__(self, max_buffer: int = 1024, keepalive: float = 15.) -> None:
+        """Initialization of stream.
+
+        :param max_buffer: default maximum number of frames buffered for one client
+        :type max_buffer: int
+        :param keepalive: interval of keepalive comments sent to idle clients, seconds
+        :type keepalive: float
+        """
+        self.max_buffer = max_buffer
+        self.keepalive = keepalive
+        self.dropped = 0
+        self.published = 0
+        self._clients: tuple[StreamClient, ...] = ()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self._clients)} clients)'
+
+    def attach(self, events: EventBus, max_pending: int = 4096) -> None:
+        """Subscribes stream to new blocks, new transactions and reorganizations published on event bus.
+
+        :param events: event bus of node
+        :type events: EventBus
+        :param max_pending: maximum number of events queued for stream on event bus
+        :type max_pending: int
+        :return: None
+        """
+        assert self._subscription is None
+        self._subscription = events.subscribe(self._on_event, (EventType.new_block, EventType.new_tx, EventType.reorg),
+                                              'event-stream', max_pending)
+
+    def connect(self, topics: Iterable[StreamTopic] = None, accounts: Iterable[str] = None,
+                max_buffer: int = None) -> StreamClient:
+        """Registers client with filters.
+
+        :param topics: topics client receives (optional, all by default)
+        :type topics: Iterable[StreamTopic]
+        :param accounts: accounts transactions are filtered by (optional, every transaction by default)
+        :type accounts: Iterable[str]
+        :param max_buffer: maximum number of frames buffered for client (optional)
+        :type max_buffer: int
+        :return: client, pass it to stream(...)
+        :rtype: StreamClient
+        """
+        client = StreamClient(frozenset(topics) if topics is not None else frozenset(StreamTopic),
+                              frozenset(accounts) if accounts is not None else None,
+                              max_buffer or self.max_buffer)
+        with self._lock:
+            self._clients += (client,)
+
+        return client
+
+    def disconnect(self, client: StreamClient) -> None:
+        """Unregisters client and ends its stream.
+
+        :param client: client returned by connect(...)
+        :type client: StreamClient
+        :return: None
+        """
+        client.close()
+        with self._lock:
+            self._clients = tuple(c for c in self._clients if c is not client)
+
+    def stream(self, client: StreamClient) -> Iterator[bytes]:
+        """Yields encoded frames of client as they are published, keepalive comments while idle. Client is
+        disconnected when generator is closed (e.g. connection is gone) or client is dropped.
+
+        :param client: client returned by connect(...)
+        :type client: StreamClient
+        :return: text/event-stream chunks
+        :rtype: Iterator[bytes]
+        """
+        try:
+            yield f'retry: {int(self.keepalive * 1000)}\n\n'.encode('utf-8')
+            while True:
+                frames = client._take(self.keepalive)
+                if frames is None:
+                    if client.dropped:
+                        yield b': dropped, buffer is full\n\n'
+                    return
+                client.sent += len(frames)
+                yield b''.join(frames) if frames else b': keepalive\n\n'
+        finally:
+            self.disconnect(client)
+
+    def stats(self) -> dict:
+        """Returns clients and counters.
+
+        :return: number of connected clients, published events, dropped clients and event bus stats of stream
+        :rtype: dict
+        """
+        return {'clients': len(self._clients),
+                'published': self.published,
+                'dropped': self.dropped,
+                'subscription': self._subscription.stats() if self._subscription is not None else None}
+
+    def _on_event(self, event: Event) -> None:
+        if not self._clients:
+            return
+
+        if event.type is EventType.new_block:
+            block: Block = event.payload
+            self._publish(StreamTopic.block, dict(json.loads(block.header.dump()), hash=block.hash))
+            height = block.header.heigth
+            for index, tx in enumerate(block.transactions):
+                self._publish(StreamTopic.tx_confirmed,
+                              {'hash': tx.hash, 'height': height, 'index': index, 'block_hash': block.hash},
+                              involved_accounts(tx))
+        elif event.type is EventType.new_tx:
+            tx: Transaction = event.payload
+            self._publish(StreamTopic.tx_pending, {'hash': tx.hash, 'sender': tx.sender}, involved_accounts(tx))
+        elif event.type is EventType.reorg:
+            reorg = event.payload['reorg']
+            self._publish(StreamTopic.reorg, {'old_tip': event.payload['old_tip'].hash,
+                                              'new_tip': event.payload['new_tip'].hash,
+                                              'depth': reorg.depth})
+
+    def _publish(self, topic: StreamTopic, data: dict, accounts: Optional[set[str]] = None) -> None:
+        """Encodes event once and offers it to every client.
+
+        :return: None
+        """
+        clients = self._clients
+        self.published += 1
+        frame = f'id: {self.published}\nevent: {topic.value}\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
+        dropped = [client for client in clients if not client.offer(topic, accounts, frame)]
+        for client in dropped:
+            self.dropped += client.dropped
+            with self._lock:
+                self._clients = tuple(c for c in self._clients if c is not client)
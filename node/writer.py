@@ -0,0 +1,319 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Optional, Union
+
+from flask import g
+from jsonrpc import JSONRPCResponseManager
+from jsonrpc.backend.flask import api
+from jsonrpc.exceptions import JSONRPCDispatchException, JSONRPCServerError
+from jsonrpc.jsonrpc2 import JSONRPC20Response
+
+from node.admission import admission_result, resolve_with_result
+from primitives import Transaction
+from utils import logger, handle_exception
+
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME = 64 * 2 ** 20
+
+
+def send_frame(sock: socket.socket, message: Any) -> None:
+    """Sends JSON message prefixed by its length.
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    :param message: JSON-serializable message
+    :type message: Any
+    :return: None
+    """
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+def recv_frame(sock: socket.socket) -> Any:
+    """Receives JSON message sent by send_frame(...)
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    :return: message
+    :rtype: Any
+    :raises ConnectionError: if peer has closed connection
+    """
+    def recv_exactly(size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = sock.recv(min(size, 2 ** 20))
+            if not chunk:
+                raise ConnectionError('connection closed')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    size, = FRAME_HEADER.unpack(recv_exactly(FRAME_HEADER.size))
+    assert size <= MAX_FRAME, 'frame is too large'
+
+    return json.loads(recv_exactly(size))
+
+
+class _WriterHandler(socketserver.BaseRequestHandler):
+
+    def handle(self) -> None:
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                reply = self.server.serve(message)
+            except Exception as e:
+                handle_exception(logger, e)
+                reply = {'error': f'{type(e).__name__}: {e}'}
+
+            try:
+                send_frame(self.request, reply)
+            except OSError:
+                return
+
+
+class WriterServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves writes of RPC worker processes over local Unix socket, runs in the process which owns the node.
+
+    Public attributes:
+        node — node which produces blocks and owns state
+    Public methods:
+        serve(...) — answers one message
+        serve_forever(...) — serves until shutdown(...), inherited
+
+    Messages are length-prefixed JSON frames, lookup send_frame(...):
+        - {"op": "submit", "txs": [...], "timeout": seconds} — transactions go through admission pipeline of node
+          together, reply is {"results": [...]} of node.admission.admission_result(...), in order
+        - {"op": "call", "method": ..., "params": ..., "tip": ...} — JSON-RPC method is called on node, reply is
+          {"response": ...} with JSON-RPC response object. Method reads chain at block "tip" (optional, current tip
+          by default), so worker gets answers consistent with its own snapshot; the call is refused with error
+          response if the block is not in block tree of node (e.g. it has been pruned)
+    Every connection is served by its own thread, so slow admission of one worker does not delay others.
+    """
+    daemon_threads = True
+
+    def __init__(self, node, path: str) -> None:
+        """Initialization of server, binds socket (stale socket file is removed).
+
+        :param node: node writes are forwarded to, it SHOULD be started
+        :type node: Node
+        :param path: Unix socket path
+        :type path: str
+        """
+        self.node = node
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _WriterHandler)
+
+    def serve(self, message: dict) -> dict:
+        """Answers one message, lookup WriterServer.
+
+        :param message: message of worker
+        :type message: dict
+        :return: reply
+        :rtype: dict
+        """
+        if message['op'] == 'submit':
+            deadline = time.monotonic() + message['timeout']
+            futures = self.node.admission.submit_many(message['txs'])
+            return {'results': [admission_result(future, deadline) for future in futures]}
+
+        if message['op'] == 'call':
+            request = {'jsonrpc': '2.0', 'method': message['method'], 'params': message['params'], 'id': 0}
+            # app context gives method its own pinned snapshot, released when context is popped
+            with self.node.app_context():
+                if message.get('tip') is not None:
+                    snapshot = self.node.blockchain.pin_block(message['tip'])
+                    if snapshot is None:
+                        error = f'block {message["tip"]} is not in block tree'
+                        data = {'type': 'AssertionError', 'args': [error], 'message': error}
+                        return {'response': JSONRPC20Response(error=JSONRPCServerError(data=data)._data, _id=0).data}
+                    g.snapshot = snapshot
+                response = JSONRPCResponseManager.handle(json.dumps(request), api.dispatcher)
+            return {'response': response.data}
+
+        return {'error': f'unknown op: {message["op"]}'}
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class WriterClient(object):
+    """Forwards writes of RPC worker process to WriterServer. Stands for node.admission in worker process.
+
+    Public attributes:
+        path — Unix socket path of writer
+        timeout — how long writer waits for admission, seconds
+    Public methods:
+        submit(...) — forwards transaction to admission pipeline of writer
+        submit_many(...) — forwards many transactions with one message
+        call(...) — calls JSON-RPC method on writer
+        method(...) — returns JSON-RPC method forwarding calls to writer
+        start(...), stop(...) — lifecycle of AdmissionPipeline, stop(...) closes connections
+        stats(...) — returns admission stats of writer
+
+    Every thread has its own connection, which is reopened once if message could not be sent over it. Futures
+    returned by submit(...) and submit_many(...) are resolved before return: writer replies when admission is
+    finished.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.) -> None:
+        """Initialization of client, connections are opened on demand.
+
+        :param path: Unix socket path of writer
+        :type path: str
+        :param timeout: how long writer waits for admission, seconds
+        :type timeout: float
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sockets: list[socket.socket] = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path})'
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'socket', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout + 10.)
+            sock.connect(self.path)
+            self._local.socket = sock
+            with self._lock:
+                self._sockets.append(sock)
+        return sock
+
+    def _close_connection(self) -> None:
+        sock = getattr(self._local, 'socket', None)
+        self._local.socket = None
+        if sock is not None:
+            with self._lock:
+                if sock in self._sockets:
+                    self._sockets.remove(sock)
+            sock.close()
+
+    def _request(self, message: dict) -> dict:
+        for attempt in range(2):
+            try:
+                send_frame(self._connection(), message)
+                break
+            except OSError:
+                # connection was dropped by writer (e.g. restarted), message was not sent
+                self._close_connection()
+                if attempt:
+                    raise
+
+        try:
+            reply = recv_frame(self._local.socket)
+        except OSError:
+            # reply may be lost mid-frame, connection is not reused then
+            self._close_connection()
+            raise
+        assert 'error' not in reply, reply['error']
+
+        return reply
+
+    def submit(self, raw: Union[str, bytes, dict, Transaction]) -> Future:
+        """Forwards transaction to admission pipeline of writer and waits for admission.
+
+        :param raw: transaction JSON dump, parsed dump or transaction itself
+        :type raw: Union[str, bytes, dict, Transaction]
+        :return: resolved future, lookup AdmissionPipeline.submit(...)
+        :rtype: Future
+        """
+        return self.submit_many([raw])[0]
+
+    def submit_many(self, raws: Iterable[Union[str, bytes, dict, Transaction]]) -> list[Future]:
+        """Forwards many transactions to admission pipeline of writer with one message and waits for admission.
+
+        :param raws: transactions JSON dumps, parsed dumps or transactions
+        :type raws: Iterable[Union[str, bytes, dict, Transaction]]
+        :return: resolved futures, lookup AdmissionPipeline.submit_many(...)
+        :rtype: list[Future]
+        """
+        txs = [raw.dump() if isinstance(raw, Transaction) else raw.decode('utf-8') if isinstance(raw, bytes) else raw
+               for raw in raws]
+        results = self._request({'op': 'submit', 'txs': txs, 'timeout': self.timeout})['results']
+
+        futures = []
+        for result in results:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            resolve_with_result(future, result)
+            futures.append(future)
+
+        return futures
+
+    def call(self, method: str, params: Union[list, dict] = None, tip: Optional[str] = None) -> dict:
+        """Calls JSON-RPC method on writer.
+
+        :param method: method name
+        :type method: str
+        :param params: positional or keyword params (optional)
+        :type params: Union[list, dict]
+        :param tip: hash of block chain is read at, lookup WriterServer (optional, current tip of writer by default)
+        :type tip: Optional[str]
+        :return: JSON-RPC response object, with "result" or "error"
+        :rtype: dict
+        """
+        return self._request({'op': 'call', 'method': method, 'params': params or [], 'tip': tip})['response']
+
+    def method(self, name: str, tip: Callable[[], str] = None) -> Callable:
+        """Returns JSON-RPC method forwarding calls to writer, errors of writer are raised as they are.
+
+        :param name: method name
+        :type name: str
+        :param tip: returns hash of block chain is read at, called on every call (optional, current tip of writer
+            by default)
+        :type tip: Callable[[], str]
+        :return: method
+        :rtype: Callable
+        """
+        def forwarded(*args, **kwargs):
+            response = self.call(name, kwargs if kwargs else list(args), tip() if tip is not None else None)
+            if 'error' in response:
+                error = response['error']
+                raise JSONRPCDispatchException(error['code'], error['message'], error.get('data'))
+            return response['result']
+
+        forwarded.__name__ = name
+        return forwarded
+
+    def start(self) -> None:
+        """Does nothing, connections are opened on demand.
+
+        :return: None
+        """
+
+    def stop(self, timeout: float = None) -> None:
+        """Closes connections of all threads.
+
+        :param timeout: unused, for compatibility with AdmissionPipeline.stop(...)
+        :type timeout: float
+        :return: None
+        """
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            sock.close()
+
+    def stats(self) -> dict[str, dict]:
+        """Returns admission stats of writer.
+
+        :return: stage name -> stats, lookup AdmissionPipeline.stats(...)
+        :rtype: dict[str, dict]
+        """
+        return self.method('node.metrics')()['admission']
@@ -1,7 +1,11 @@
 from primitives.accounts import Account
 from primitives.assets import Asset, AssetType, AssetOwnershipType, UPDATE_ASSET, CREATE_ASSET, \
     CURRENCY_ASSET
+from primitives.block_builder import BlockBuilder
+from primitives.block_tree import BlockTree, ChainSnapshot, Reorg
 from primitives.blockchain import BlockChain
 from primitives.blocks import Block, BlockHeader
+from primitives.mempool import Mempool, MempoolEntry
+from primitives.merkle import MerkleTree
 from primitives.transactions import Transaction, TransactionType
 from primitives.world_state import WorldState, WorldStateModificationType
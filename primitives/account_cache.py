@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Iterator, Optional
+
+from mpt import MerklePatriciaTrie
+from primitives.accounts import Account
+from primitives.tries import root_ref, trie_items
+
+
+class AccountCache(object):
+    """Represents bounded LRU of materialized accounts, shared by world states built on the same storage.
+
+    Public attributes:
+        max_size — maximum number of cached accounts
+        hits, misses — lookup counters
+    Public methods:
+        get(...) — returns cached account
+        put(...) — caches account, evicting least recently used one
+
+    Accounts are keyed by (name, account trie root hash), so one cached account is valid for every state it has
+    this root in, regardless of fork. Cached accounts SHOULD NOT be modified — states copy them on modification.
+    """
+
+    def __init__(self, max_size: int = 100_000) -> None:
+        """Initialization of cache.
+
+        :param max_size: maximum number of cached accounts
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._accounts: OrderedDict[tuple[bytes, bytes], Account] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self._accounts)}/{self.max_size}, {self.hits} hits, {self.misses} misses)'
+
+    def get(self, key: tuple[bytes, bytes]) -> Optional[Account]:
+        """Returns cached account.
+
+        :param key: account name and account trie root hash
+        :type key: tuple[bytes, bytes]
+        :return: account or None if it is not cached
+        :rtype: Optional[Account]
+        """
+        with self._lock:
+            try:
+                self._accounts.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._accounts[key]
+
+    def put(self, key: tuple[bytes, bytes], account: Account) -> None:
+        """Caches account, evicting least recently used one if cache is full.
+
+        :param key: account name and account trie root hash
+        :type key: tuple[bytes, bytes]
+        :param account: account
+        :type account: Account
+        :return: None
+        """
+        with self._lock:
+            self._accounts[key] = account
+            self._accounts.move_to_end(key)
+            if len(self._accounts) > self.max_size:
+                self._accounts.popitem(last=False)
+
+
+class AccountsView(Mapping):
+    """Represents read-only mapping account name -> Account over accounts trie at fixed root.
+
+    Accounts are materialized on demand from their root hashes stored in accounts trie, through AccountCache.
+    Iteration walks the whole trie.
+    """
+
+    def __init__(self, storage: dict, root: Optional[bytes], cache: AccountCache) -> None:
+        """Initialization of view.
+
+        :param storage: storage of accounts trie and accounts tries
+        :type storage: dict
+        :param root: root node reference of accounts trie
+        :type root: Optional[bytes]
+        :param cache: cache of materialized accounts
+        :type cache: AccountCache
+        """
+        self._storage = storage
+        self._root = root
+        self._trie = MerklePatriciaTrie(storage, root=root)
+        self._cache = cache
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self._root.hex() if self._root else None})'
+
+    def __getitem__(self, name: bytes) -> Account:
+        root_hash = self._trie.get(name)
+
+        account = self._cache.get((name, root_hash))
+        if account is None:
+            account = Account(name, self._storage, root_ref(root_hash))
+            self._cache.put((name, root_hash), account)
+
+        return account
+
+    def __contains__(self, name) -> bool:
+        try:
+            self._trie.get(name)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[bytes]:
+        for name, _ in trie_items(self._storage, self._root):
+            yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from typing import Union
 
 from crypto.hashing import dsha256
@@ -18,15 +20,27 @@ class Account(object):
         add_asset(...) - add arbitrary asset of arbitrary value to account
         sub_asset(...) - substract arbitrary asset of arbitrary value from account
         check_asset(...) - check if amount of arbitrary asset on account >= arbitrary amount
+        get_amount(...) - returns amount of arbitrary asset on account
+        copy(...) - returns independent copy of account sharing the storage
+        defer_writes(...) - switches account to writing trie only on flush
+        flush(...) - writes deferred amounts to trie
 
     Account state is represented by keyword structure dsha256('asset.name' + 'ownership_type'): 'value'(int)
     and encoded in merkle patricia
     trie.
+    Reads are served by flat layer (asset name, ownership type) -> amount, which is written together with the trie,
+    so trie is touched only for writes and root hashes. Flat layer of new account is complete, account loaded from
+    existing trie root fills it on first read of every key unless amounts are provided.
+    With deferred writes amounts go to flat layer only and trie gets one write per changed key on flush(...), which
+    happens at the latest when root hash is requested.
     Account state SHOULD BE modified only with class methods.
     """
     name: str = ''
     _storage: dict[bytes, bytes] = {}
     _trie: MerklePatriciaTrie = None
+    _amounts: dict[tuple[str, str], int] = None
+    _amounts_complete: bool = False
+    _dirty: set[tuple[str, str]] = None
 
     @property
     def root_hash(self) -> bytes:
@@ -37,9 +51,11 @@ class Account(object):
         :return: hash of current account state root
         :rtype: bytes
         """
+        self.flush()
         return self._trie.root_hash()
 
-    def __init__(self, name: Union[str, bytes], storage: dict = None) -> None:
+    def __init__(self, name: Union[str, bytes], storage: dict = None, root: bytes = None,
+                 amounts: dict[tuple[str, str], int] = None) -> None:
         """Initialization of object.
 
         Basic type assertions. If storage is undefined — assume is is a new account.
@@ -48,15 +64,108 @@ class Account(object):
         :type name: Union[str, bytes]
         :param storage: storage for Merkle Patricia trie (if exists)
         :type storage: dict
+        :param root: root node reference of existing account trie in storage, lookup MerklePatriciaTrie.root(...)
+        :type root: bytes
+        :param amounts: all non-zero amounts of existing account, (asset name, ownership type value) -> amount
+        :type amounts: dict[tuple[str, str], int]
         """
         assert isinstance(name, (str, bytes))
         if isinstance(name, bytes):
             name = name.decode('utf-8')
         self.name = name
-        if storage:
+        if storage is not None:
             self._storage = storage
 
-        self._trie = MerklePatriciaTrie(self._storage)
+        self._trie = MerklePatriciaTrie(self._storage, root=root)
+        self._amounts = dict(amounts) if amounts is not None else {}
+        self._amounts_complete = root is None or amounts is not None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name}, {self.root_hash.hex()})'
+
+    def copy(self) -> Account:
+        """Returns independent copy of account.
+
+        Trie nodes are immutable and content-addressed, so copy shares the storage and only the root and the flat
+        layer are copied.
+
+        :return: copy of account
+        :rtype: Account
+        """
+        account = Account(self.name, self._storage, self._trie.root())
+        account._amounts = self._amounts.copy()
+        account._amounts_complete = self._amounts_complete
+        if self._dirty is not None:
+            account._dirty = self._dirty.copy()
+
+        return account
+
+    def defer_writes(self) -> None:
+        """Switches account to deferred writes: amounts are written to flat layer only until flush(...)
+
+        :return: None
+        """
+        if self._dirty is None:
+            self._dirty = set()
+
+    def flush(self) -> None:
+        """Writes amounts changed since last flush to trie, one write per changed key.
+
+        :return: None
+        """
+        if not self._dirty:
+            return
+
+        for asset_name, ownership_value in self._dirty:
+            key = self._trie_key(asset_name, ownership_value)
+            value = self._amounts.get((asset_name, ownership_value), 0)
+            if value:
+                self._trie.update(key, value.to_bytes(32, 'big'))
+            else:
+                try:
+                    self._trie.delete(key)
+                except KeyError:
+                    # amount was created and spent since last flush
+                    pass
+        self._dirty.clear()
+
+    @staticmethod
+    def _trie_key(asset_name: str, ownership_value: str) -> bytes:
+        return dsha256(asset_name + ownership_value).encode('utf-8')
+
+    def _trie_amount(self, asset: Asset, ownership_type: AssetOwnershipType) -> int:
+        """Returns amount of asset read from trie, bypassing flat layer.
+
+        :return: amount, 0 if account has no such asset
+        :rtype: int
+        """
+        try:
+            return int.from_bytes(self._trie.get(self._trie_key(asset.name, ownership_type.value)), 'big')
+        except KeyError:
+            return 0
+
+    def _set_amount(self, asset: Asset, ownership_type: AssetOwnershipType, value: int) -> None:
+        """Writes amount of asset to flat layer and trie (or marks it for flush(...) if writes are deferred).
+
+        :return: None
+        """
+        amounts_key = (asset.name, ownership_type.value)
+        if value:
+            self._amounts[amounts_key] = value
+        elif self._amounts_complete:
+            self._amounts.pop(amounts_key, None)
+        else:
+            self._amounts[amounts_key] = 0
+
+        if self._dirty is not None:
+            self._dirty.add(amounts_key)
+            return
+
+        key = self._trie_key(*amounts_key)
+        if value:
+            self._trie.update(key, value.to_bytes(32, 'big'))
+        else:
+            self._trie.delete(key)
 
     def add_asset(self, asset: Asset, ownership_type: AssetOwnershipType, amount: int) -> None:
         """Adds arbitrary asset of arbitrary value to account.
@@ -74,18 +183,13 @@ class Account(object):
         assert isinstance(asset, Asset)
         assert isinstance(ownership_type, AssetOwnershipType)
 
-        key = dsha256(asset.name + ownership_type.value).encode('utf-8')
-
-        try:
-            prev_value = int.from_bytes(self._trie.get(key), 'big')
-        except KeyError:
-            prev_value = 0
+        prev_value = self.get_amount(asset, ownership_type)
 
         value = prev_value + amount
         assert not (asset.type == AssetType.boolean and value != 1)
         assert value >= 1
 
-        self._trie.update(key, value.to_bytes(32, 'big'))
+        self._set_amount(asset, ownership_type, value)
 
     def sub_asset(self, asset: Asset, ownership_type: AssetOwnershipType, amount: int) -> None:
         """Substracts arbitrary asset of arbitrary value from account.
@@ -102,19 +206,38 @@ class Account(object):
         assert isinstance(asset, Asset)
         assert isinstance(ownership_type, AssetOwnershipType)
 
-        key = dsha256(asset.name + ownership_type.value).encode('utf-8')
-
         assert self.check_asset(asset, ownership_type, amount)
 
-        prev_value = int.from_bytes(self._trie.get(key), 'big')
+        prev_value = self.get_amount(asset, ownership_type)
 
         value = prev_value - amount
-        if value == 0:
-            self._trie.delete(key)
-            return
+        assert not (asset.type == AssetType.boolean and value != 0)
+
+        self._set_amount(asset, ownership_type, value)
+
+    def get_amount(self, asset: Asset, ownership_type: AssetOwnershipType) -> int:
+        """Returns amount of arbitrary asset on account.
 
-        assert not (asset.type == AssetType.boolean)
-        self._trie.update(key, value.to_bytes(32, 'big'))
+        :param asset: arbitrary asset
+        :type asset: Asset
+        :param ownership_type: selected ownership type for asset
+        :type ownership_type: AssetOwnershipType
+        :returns: amount, 0 if account has no such asset
+        :rtype: int
+        """
+        assert isinstance(asset, Asset)
+        assert isinstance(ownership_type, AssetOwnershipType)
+
+        key = (asset.name, ownership_type.value)
+        try:
+            return self._amounts[key]
+        except KeyError:
+            if self._amounts_complete:
+                return 0
+
+        amount = self._amounts[key] = self._trie_amount(asset, ownership_type)
+
+        return amount
 
     def check_asset(self, asset: Asset, ownership_type: AssetOwnershipType, amount: int = 1) -> bool:
         """Checks if amount of arbitrary asset on account >= arbitrary amount.
@@ -130,18 +253,11 @@ class Account(object):
         :returns: True if value on account is sufficient for 'amount'. False if not.
         :rtype: bool
         """
-        assert isinstance(asset, Asset)
-        assert isinstance(ownership_type, AssetOwnershipType)
-
-        key = dsha256(asset.name + ownership_type.value).encode('utf-8')
-
-        try:
-            value = int.from_bytes(self._trie.get(key), 'big')
-        except KeyError:
+        value = self.get_amount(asset, ownership_type)
+        if not value:
             return False
 
         if value >= amount:
             return True
 
         return False
-
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import datetime
+from typing import Optional
+
+from primitives.blockchain import BLOCK_REWARD, BlockChain
+from primitives.blocks import Block, BlockHeader
+from primitives.merkle import MerkleTree
+from primitives.parallel_execution import touched_accounts
+from primitives.transactions import Transaction
+from primitives.world_state import WorldState
+
+
+class BlockBuilder(object):
+    """Builds block templates incrementally on pending state over chain tip.
+
+    Public attributes:
+        tip — block pending state is built on
+        transactions — transactions applied to pending state, in inclusion order
+    Public methods:
+        add(...) — validates and applies transaction to pending state
+        rebase(...) — moves pending state onto new chain tip
+        template(...) — returns block template for pending state
+    Private attributes:
+        _state — pending world state, fork of chain state
+        _tree — Merkle tree of pending transactions
+        _hashes, _hash_set — hashes of pending transactions
+        _accounts — accounts touched by each pending transaction
+
+    Every transaction is validated and executed once, when it is added. Producing template costs O(1) state work.
+    On new chain tip only transactions sharing accounts (transitively) with the new block are replayed,
+    accounts of other transactions are carried over to the new pending state as they are.
+    Only account-level modifications are tracked, so asset modifications in new block require full replay.
+    """
+    blockchain: BlockChain = None
+    beneficiary: str = ''
+    target: int = 0
+    tip: Block = None
+    transactions: list[Transaction] = None
+    _state: WorldState = None
+    _tree: MerkleTree = None
+    _hashes: list[str] = None
+    _hash_set: set[str] = None
+    _accounts: list[set[bytes]] = None
+
+    def __init__(self, blockchain: BlockChain, beneficiary: str, target: int) -> None:
+        """Initialization of builder on current tip of blockchain.
+
+        :param blockchain: blockchain to build on
+        :type blockchain: BlockChain
+        :param beneficiary: account to receive block reward
+        :type beneficiary: str
+        :param target: proof of work target for templates
+        :type target: int
+        """
+        assert isinstance(blockchain, BlockChain)
+
+        self.blockchain = blockchain
+        self.beneficiary = beneficiary
+        self.target = target
+        self._reset()
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    def __contains__(self, tx_hash: str) -> bool:
+        return tx_hash in self._hash_set
+
+    def _reset(self) -> None:
+        """Starts empty pending state on current chain tip.
+
+        :return: None
+        """
+        self.tip = self.blockchain.last
+        self.transactions = []
+        self._state = self.blockchain.state.fork()
+        self._tree = MerkleTree()
+        self._hashes = []
+        self._hash_set = set()
+        self._accounts = []
+
+    def _apply(self, tx: Transaction, tx_hash: str, accounts: set[bytes], verified: bool = False) -> bool:
+        """Validates transaction, executes it on pending state and appends to pending transactions.
+
+        :return: True if transaction was applied
+        :rtype: bool
+        """
+        try:
+            BlockChain.check_tx(tx, self._state, check_signature=not verified)
+            self._state.apply_tx(tx)
+        except Exception:
+            return False
+
+        self._append(tx, tx_hash, accounts)
+        self._tree.append(tx_hash)
+
+        return True
+
+    def _append(self, tx: Transaction, tx_hash: str, accounts: set[bytes]) -> None:
+        self.transactions.append(tx)
+        self._hashes.append(tx_hash)
+        self._hash_set.add(tx_hash)
+        self._accounts.append(accounts)
+
+    def add(self, tx: Transaction, verified: bool = False) -> bool:
+        """Validates transaction against pending state and applies it.
+
+        Failed transaction leaves pending state untouched.
+
+        :param tx: transaction to be added
+        :type tx: Transaction
+        :param verified: signature was already verified (e.g. by admission pipeline)
+        :type verified: bool
+        :return: True if transaction was applied, False if it failed (and was dropped)
+        :rtype: bool
+        """
+        assert isinstance(tx, Transaction)
+
+        tx_hash = tx.hash
+        if tx_hash in self._hash_set:
+            return True
+
+        try:
+            accounts = touched_accounts(tx)
+        except Exception:
+            return False
+
+        return self._apply(tx, tx_hash, accounts, verified)
+
+    def rebase(self, confirmed: set[str] = None) -> list[Transaction]:
+        """Moves pending state onto current chain tip.
+
+        Transactions included in new tip are forgotten. Connected components of pending transactions (linked by
+        shared accounts) which touch accounts modified by new tip are replayed in original order, accounts of
+        other components are carried over. If new tip is not a child of previous one, everything is replayed.
+
+        :param confirmed: hashes of transactions included in new branch, if new tip is not a child of previous one
+        :type confirmed: set[str]
+        :return: transactions dropped because they failed on new state
+        :rtype: list[Transaction]
+        """
+        tip = self.blockchain.last
+        if tip.hash == self.tip.hash:
+            return []
+
+        previous_state = self._state
+        pending = list(zip(self.transactions, self._hashes, self._accounts))
+
+        if tip.header.parent_hash == self.tip.hash:
+            confirmed = {tx.hash for tx in tip.transactions}
+            affected = {tip.header.beneficiary.encode('utf-8')}
+            for tx in tip.transactions:
+                affected |= touched_accounts(tx)
+            pending = [item for item in pending if item[1] not in confirmed]
+        else:
+            affected = None
+            if confirmed:
+                pending = [item for item in pending if item[1] not in confirmed]
+
+        replayed = self._components_to_replay(pending, affected)
+
+        self._reset()
+
+        carried = set()
+        for i, (_, _, accounts) in enumerate(pending):
+            if i not in replayed:
+                carried |= accounts
+        self._state.import_accounts(previous_state, carried)
+
+        dropped = []
+        for i, (tx, tx_hash, accounts) in enumerate(pending):
+            if i in replayed:
+                # signatures were verified when transactions were added
+                if not self._apply(tx, tx_hash, accounts, verified=True):
+                    dropped.append(tx)
+            else:
+                self._append(tx, tx_hash, accounts)
+
+        # positions of transactions have changed, tree is rebuilt from cached hashes
+        self._tree = MerkleTree.from_hashes(self._hashes)
+
+        return dropped
+
+    @staticmethod
+    def _components_to_replay(pending: list[tuple[Transaction, str, set[bytes]]],
+                              affected: Optional[set[bytes]]) -> set[int]:
+        """Returns indexes of pending transactions which belong to components touching affected accounts.
+
+        :param pending: pending transactions with their hashes and accounts
+        :type pending: list[tuple[Transaction, str, set[bytes]]]
+        :param affected: accounts modified by new tip or None if everything is affected
+        :type affected: Optional[set[bytes]]
+        :return: indexes of transactions to be replayed
+        :rtype: set[int]
+        """
+        if affected is None:
+            return set(range(len(pending)))
+
+        parents = {}
+
+        def find(account: bytes) -> bytes:
+            root = account
+            while parents.setdefault(root, root) != root:
+                root = parents[root]
+            while parents[account] != root:
+                parents[account], account = root, parents[account]
+            return root
+
+        for _, _, accounts in pending:
+            first, *rest = accounts
+            for account in rest:
+                parents[find(account)] = find(first)
+
+        dirty = {find(account) for account in affected if account in parents}
+
+        return {i for i, (_, _, accounts) in enumerate(pending) if find(next(iter(accounts))) in dirty}
+
+    def template(self, timestamp: datetime.datetime = None, comment: str = None) -> Block:
+        """Returns block template for pending state.
+
+        Uses cached Merkle tree and state roots, no transaction is revalidated.
+
+        :param timestamp: block timestamp (optional, now or parent timestamp + 1s by default)
+        :type timestamp: datetime.datetime
+        :param comment: block comment (optional)
+        :type comment: str
+        :return: block to be mined
+        :rtype: Block
+        """
+        height = self.tip.header.heigth + 1
+        if timestamp is None:
+            # timestamps have one second resolution and must grow
+            timestamp = max(datetime.datetime.now(datetime.timezone.utc),
+                            self.tip.header.timestamp + datetime.timedelta(seconds=1))
+
+        # pending changes are written to tries once, so rewarded fork commits only the reward
+        self._state.commit()
+
+        # header commits state after block reward, fork is dropped before pending state is modified again
+        rewarded_state = self._state.fork()
+        rewarded_state.execute_reward_modification(self.beneficiary, BLOCK_REWARD)
+
+        return Block(
+            BlockHeader(
+                parent_hash=self.tip.hash,
+                beneficiary=self.beneficiary,
+                target=self.target,
+                height=height,
+                timestamp=timestamp,
+                state_root=rewarded_state.state_roots_hash,
+                tx_root=self._tree.root,
+                comment=comment if comment is not None else f'height {height}'
+            ),
+            self.transactions[:],
+            self._tree.copy()
+        )
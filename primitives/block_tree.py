@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import threading
+from typing import Optional, Sequence
+
+from primitives.blocks import Block
+from primitives.world_state import WorldState
+
+
+def block_work(target: int) -> int:
+    """Returns expected number of hashes needed to find block with target.
+
+    :param target: proof of work target
+    :type target: int
+    :return: work of block
+    :rtype: int
+    """
+    return 2 ** 256 // (target + 1)
+
+
+class TreeEntry(object):
+    """Represents block in BlockTree.
+
+    Public attributes:
+        block — block
+        hash — block hash
+        parent — entry of parent block, None for base of tree
+        height — block height
+        work — cumulative work since base of tree (inclusive)
+        state — world state after block, never modified
+    """
+    __slots__ = ('block', 'hash', 'parent', 'height', 'work', 'state')
+
+    def __init__(self, block: Block, parent: Optional[TreeEntry], state: WorldState) -> None:
+        self.block = block
+        self.hash = block.hash
+        self.parent = parent
+        self.height = block.header.heigth
+        self.work = (parent.work if parent is not None else 0) + block_work(block.header.target)
+        self.state = state
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.height}, {self.hash})'
+
+
+class ChainSnapshot(object):
+    """Represents read view of blockchain pinned at one tip.
+
+    Public attributes:
+        entry — block tree entry of tip
+        tip — tip block
+        hash — tip hash
+        height — tip height
+        state — world state after tip, committed and never modified, so it is read through fixed tries roots
+        state_roots_hash — roots hash of state
+    Public methods:
+        block(...) — returns block of snapshot branch by height
+
+    Snapshot is immutable: blocks added later (reorganizations included) are not visible through it.
+    """
+    __slots__ = ('entry', 'tip', 'hash', 'height', 'state', 'state_roots_hash', '_chain')
+
+    def __init__(self, entry: TreeEntry, chain: Sequence[Block]) -> None:
+        """Initialization of snapshot.
+
+        :param entry: block tree entry of tip
+        :type entry: TreeEntry
+        :param chain: canonical chain, blocks below block tree base are read from it
+        :type chain: Sequence[Block]
+        """
+        self.entry = entry
+        self.tip = entry.block
+        self.hash = entry.hash
+        self.height = entry.height
+        self.state = entry.state
+        self.state_roots_hash = entry.state.state_roots_hash
+        self._chain = chain
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.height}, {self.hash})'
+
+    def block(self, height: int) -> Block:
+        """Returns block of snapshot branch by height.
+
+        Blocks above block tree base are found by parent links, which pinned entries keep, lower ones are read from
+        chain, since reorganizations never go below tree base.
+
+        :param height: block height
+        :type height: int
+        :return: block
+        :rtype: Block
+        :raises IndexError: if there is no block at height in snapshot
+        """
+        if not 0 <= height <= self.height:
+            raise IndexError(height)
+
+        entry = self.entry
+        while entry.height > height and entry.parent is not None:
+            entry = entry.parent
+        if entry.height == height:
+            return entry.block
+
+        return self._chain[height]
+
+
+class Reorg(object):
+    """Represents switch of canonical tip to another branch.
+
+    Public attributes:
+        ancestor — common ancestor of old and new tips
+        disconnected — blocks removed from canonical chain, from ancestor up
+        connected — blocks added to canonical chain, from ancestor up
+        depth — number of disconnected blocks
+        seconds — wall time of switch
+    """
+
+    def __init__(self, ancestor: Block, disconnected: list[Block], connected: list[Block], seconds: float) -> None:
+        self.ancestor = ancestor
+        self.disconnected = disconnected
+        self.connected = connected
+        self.depth = len(disconnected)
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f'{type(self).__name__}(depth {self.depth}, +{len(self.connected)} blocks, {self.seconds:.6f}s)'
+
+
+class BlockTree(object):
+    """Keeps recent blocks of all branches keyed by hash, with world state after every block.
+
+    Public attributes:
+        base — oldest kept entry, every other entry descends from it
+        tip — entry of canonical tip
+        max_depth — entries deeper than this below tip are pruned
+    Public methods:
+        get(...) — returns entry by block hash
+        add(...) — adds validated block on top of known parent
+        best(...) — fork choice: entry with the most cumulative work
+        path(...) — returns common ancestor and branches between two entries
+        prune(...) — drops entries too deep below tip
+        pin(...) — protects entry and its ancestors from pruning
+        unpin(...) — releases entry pinned with pin(...)
+
+    Blocks arriving on any branch are executed once, on the state of their parent, and their states are kept,
+    so switching branches costs only moving the tip. States are forks sharing tries storages and unchanged
+    objects with their parents, so every entry costs about as much as changes of its block.
+    Forks starting deeper than max_depth below tip are not guaranteed to be accepted.
+    Pinned entries (read snapshots in use) are never pruned: base is kept at or below the lowest of them, so
+    parent links of every pinned entry stay intact.
+    """
+    base: TreeEntry = None
+    tip: TreeEntry = None
+    max_depth: int = 0
+    _entries: dict[str, TreeEntry] = None
+    _pins: dict[str, tuple[TreeEntry, int]] = None
+    _lock: threading.Lock = None
+
+    def __init__(self, base: Block, state: WorldState, max_depth: int = 100) -> None:
+        """Initialization of tree on its base block.
+
+        :param base: block tree starts from, usually canonical tip
+        :type base: Block
+        :param state: world state after base block
+        :type state: WorldState
+        :param max_depth: entries deeper than this below tip are pruned
+        :type max_depth: int
+        """
+        self.base = self.tip = TreeEntry(base, None, state)
+        self.max_depth = max_depth
+        self._entries = {self.base.hash: self.base}
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self._entries
+
+    def get(self, block_hash: str) -> Optional[TreeEntry]:
+        """Returns entry by block hash.
+
+        :param block_hash: block hash
+        :type block_hash: str
+        :return: entry or None if block is not in tree
+        :rtype: Optional[TreeEntry]
+        """
+        return self._entries.get(block_hash)
+
+    def add(self, block: Block, state: WorldState) -> TreeEntry:
+        """Adds validated block on top of its parent, which must be in tree.
+
+        :param block: block
+        :type block: Block
+        :param state: world state after block
+        :type state: WorldState
+        :return: new entry
+        :rtype: TreeEntry
+        """
+        parent = self._entries[block.header.parent_hash]
+        entry = TreeEntry(block, parent, state)
+        self._entries[entry.hash] = entry
+
+        return entry
+
+    def best(self, candidate: TreeEntry) -> TreeEntry:
+        """Returns entry canonical tip should be at after candidate was added.
+
+        Entry with more cumulative work wins, current tip is kept on ties (first seen).
+
+        :param candidate: newly added entry
+        :type candidate: TreeEntry
+        :return: tip or candidate
+        :rtype: TreeEntry
+        """
+        return candidate if candidate.work > self.tip.work else self.tip
+
+    @staticmethod
+    def path(old: TreeEntry, new: TreeEntry) -> tuple[TreeEntry, list[TreeEntry], list[TreeEntry]]:
+        """Returns common ancestor of two entries and branches from it to both of them.
+
+        :param old: first entry
+        :type old: TreeEntry
+        :param new: second entry
+        :type new: TreeEntry
+        :return: ancestor, entries above it up to old, entries above it up to new (both from ancestor up)
+        :rtype: tuple[TreeEntry, list[TreeEntry], list[TreeEntry]]
+        """
+        disconnected, connected = [], []
+        while old is not new:
+            if old.height >= new.height:
+                disconnected.append(old)
+                old = old.parent
+            else:
+                connected.append(new)
+                new = new.parent
+            assert old is not None and new is not None, 'entries are not in one tree'
+
+        return old, disconnected[::-1], connected[::-1]
+
+    def prune(self) -> None:
+        """Drops entries deeper than max_depth below tip and branches growing from them.
+
+        Pruning is done in batches, when base gets 2 * max_depth below tip, so its cost is amortized over blocks.
+
+        :return: None
+        """
+        if self.tip.height - self.base.height <= 2 * self.max_depth:
+            return
+
+        with self._lock:
+            min_height = min([self.tip.height - self.max_depth] + [e.height for e, _ in self._pins.values()])
+            if min_height <= self.base.height:
+                return
+
+            base = self.tip
+            while base.height > min_height:
+                base = base.parent
+
+            self._entries = {h: e for h, e in self._entries.items()
+                             if e.height >= min_height and self._descends(e, base)}
+            base.parent = None
+            self.base = base
+
+    def pin(self, entry: TreeEntry) -> bool:
+        """Protects entry and its ancestors from pruning until it is unpinned. Entry may be pinned many times.
+
+        :param entry: entry
+        :type entry: TreeEntry
+        :return: True if entry was pinned, False if it has already been pruned
+        :rtype: bool
+        """
+        with self._lock:
+            if entry.hash not in self._entries:
+                return False
+            _, count = self._pins.get(entry.hash, (entry, 0))
+            self._pins[entry.hash] = (entry, count + 1)
+
+        return True
+
+    def unpin(self, entry: TreeEntry) -> None:
+        """Releases entry pinned with pin(...).
+
+        :param entry: entry
+        :type entry: TreeEntry
+        :return: None
+        """
+        with self._lock:
+            _, count = self._pins.get(entry.hash, (entry, 0))
+            if count > 1:
+                self._pins[entry.hash] = (entry, count - 1)
+            else:
+                self._pins.pop(entry.hash, None)
+
+    @staticmethod
+    def _descends(entry: TreeEntry, ancestor: TreeEntry) -> bool:
+        while entry is not None and entry.height > ancestor.height:
+            entry = entry.parent
+        return entry is ancestor
@@ -1,29 +1,61 @@
-import copy
 import datetime
-from typing import Optional
+import time
+from typing import Callable, Optional, Sequence
 
 from crypto import dsha256, check_signature_ecdsa
+from primitives.block_tree import BlockTree, ChainSnapshot, Reorg
 from primitives.blocks import Block, BlockHeader, Transaction
+from primitives.chain_validation import ChainValidator
+from primitives.parallel_execution import ParallelExecutor
 from primitives.world_state import WorldState
 
+BLOCK_REWARD = 500
+GENESIS_ACCOUNT = '82be969bdeb6216e89a0e80fdf0c93c2e64b120af0b50abd3d9f6d4a09b395cd'  # for testing purpose
+GENESIS_TARGET = 28269553036454149273332760011886696253239742350009903329945699220681916415
+
 
 class BlockChain(object):
     """Represents blockchain.
 
     Public attributes:
-        chain — chain of blocks
+        chain — chain of blocks (list or storage.BlockStore)
         last — last block
+        state — current world state (read-only, fork it to modify)
+        snapshot — read view of current tip, lookup ChainSnapshot
+        tree — recent blocks of all branches, lookup BlockTree
+        tx_index — index of canonical chain transactions, maintained by add_block(...) (optional)
+        target — proof of work target every block MUST have, difficulty is not adjusted
+        executor — parallel executor of block transactions, serial execution if not set (optional)
+        on_new_tip — callable receiving new tip and Reorg (or None) whenever canonical tip changes (optional)
     Private attributes:
         _state — current world state
+        _snapshot — read view of current tip, replaced as a whole when tip changes
     Public methods:
-        add_block(...) — validates and adds new block to chain
+        add_block(...) — validates and adds new block to block tree, switches chain to the best branch
+        attach_tx_index(...) — syncs transactions index with chain and maintains it from now on
+        expected_target(...) — returns proof of work target of block at height
+        pin(...) — returns read view of current tip protected from pruning
+        pin_block(...) — returns read view of block of block tree protected from pruning
+        unpin(...) — releases read view returned by pin(...)
     Private methods:
         _add_genesis_block(...) — adds first block to chain
+        _reorg(...) — switches chain to another branch
 
     New blocks SHOULD BE added only with add_block(...).
+    chain is the canonical branch of tree: chain[i] is block at height i. Tree starts at the tip blockchain was
+    initialized on, so reorganizations never go below it.
+    add_block(...) runs in one writer thread. Readers in other threads SHOULD read through snapshot (or pin(...)),
+    not through chain and state: new state is built aside and snapshot is published by single assignment once
+    chain, state and tree are updated, so readers never see half-applied block and never wait for the writer.
     """
-    chain: list[Block] = []
+    chain: Sequence[Block] = None
+    tree: BlockTree = None
+    tx_index = None
+    target: int = GENESIS_TARGET
+    executor: Optional[ParallelExecutor] = None
+    on_new_tip: Optional[Callable[[Block, Optional[Reorg]], None]] = None
     _state: WorldState = None
+    _snapshot: ChainSnapshot = None
 
     @property
     def last(self) -> Optional[Block]:
@@ -37,6 +69,26 @@ class BlockChain(object):
         except IndexError:
             return None
 
+    @property
+    def state(self) -> WorldState:
+        """Returns current world state.
+
+        State SHOULD NOT be modified, use state.fork() to build on top of it.
+
+        :return: current world state
+        :rtype: WorldState
+        """
+        return self._state
+
+    @property
+    def snapshot(self) -> ChainSnapshot:
+        """Returns read view of current tip.
+
+        :return: snapshot of tip, state after it and its roots
+        :rtype: ChainSnapshot
+        """
+        return self._snapshot
+
     @property
     def height(self) -> int:
         """Returns current chain height.
@@ -47,28 +99,42 @@ class BlockChain(object):
 
         return len(self.chain)
 
-    def __init__(self, chain: list[Block] = None, state: WorldState = None) -> None:
+    def __init__(self, chain: Sequence[Block] = None, state: WorldState = None, height: int = None) -> None:
         """Initialization of blockchain.
 
-        :param chain: list if blocks to initialize blockchain on (optional)
-        :type chain: list[Block]
+        :param chain: list of blocks or block store to initialize blockchain on (optional)
+        :type chain: Sequence[Block]
         :param state: world state to initialize blockchain on (optional)
         :type state: WorldState
-
-        Initializes blockchain from existing world state and chain, checks that last block represents given world state
-        and validates whole chain.
-        If not provided, creates new blockchain, adds genesis block.
+        :param height: height of block state represents (optional, last block by default)
+        :type height: int
+
+        Initializes blockchain from existing world state and chain, checks that block at height represents given
+        world state. If height is not provided, validates whole chain, otherwise blocks after height are fully
+        validated and executed on top of state (restart from checkpoint), earlier ones are trusted.
+        If chain is not provided, creates new blockchain, adds genesis block. Empty block store may be provided to
+        persist new blockchain, empty world state — to keep its tries storages.
         """
-        if not all((chain, state)):
-            self._state = WorldState()
+        if not chain:
+            assert state is None or state.state_roots_hash == WorldState().state_roots_hash, 'state is not empty'
+            self.chain = chain if chain is not None else []
+            self._state = state if state is not None else WorldState()
             self._add_genesis_block()
         else:
             assert isinstance(state, WorldState), TypeError
-            assert state.state_roots_hash == chain[-1].header.state_root_hash
-            assert self._validate_chain(chain)
+            if height is None:
+                assert state.state_roots_hash == chain[-1].header.state_root_hash
+                assert self._validate_chain(chain)
+            else:
+                assert 0 <= height < len(chain)
+                assert state.state_roots_hash == chain[height].header.state_root_hash, 'state does not match block'
+                for i in range(height + 1, len(chain)):
+                    state = self._validate_block(chain[i], chain[i - 1], state)
 
             self.chain = chain
             self._state = state
+            self.tree = BlockTree(chain[-1], state)
+            self._snapshot = ChainSnapshot(self.tree.tip, self.chain)
 
     def __getitem__(self, item):
         assert isinstance(item, int)
@@ -82,20 +148,21 @@ class BlockChain(object):
         :return: None
         """
 
-        # for testing purpose
-        me = '82be969bdeb6216e89a0e80fdf0c93c2e64b120af0b50abd3d9f6d4a09b395cd'
-
         transactions = []
-        self._state.prepare_for_genesis(me)
+        self._state.prepare_for_genesis(GENESIS_ACCOUNT)
+
+        # header commits state after block reward
+        rewarded_state = self._state.fork()
+        rewarded_state.execute_reward_modification(GENESIS_ACCOUNT, BLOCK_REWARD)
 
         gb = Block(
             BlockHeader(
                 parent_hash='0' * 64,
-                beneficiary=me,  # FIXME: ...
-                target=28269553036454149273332760011886696253239742350009903329945699220681916415,
+                beneficiary=GENESIS_ACCOUNT,  # FIXME: ...
+                target=GENESIS_TARGET,
                 height=0,
                 timestamp=datetime.datetime.utcnow(),
-                state_root=self._state.state_roots_hash,
+                state_root=rewarded_state.state_roots_hash,
                 comment='init'
             ),
             transactions
@@ -106,68 +173,184 @@ class BlockChain(object):
         self.add_block(gb)
         print(gb.hash)
 
-    def add_block(self, new_block: Block) -> None:
-        """ Validates block and adds to blockchain.
+    def attach_tx_index(self, tx_index) -> None:
+        """Syncs transactions index with chain, index is maintained by add_block(...) from now on.
+
+        :param tx_index: index with sync(chain), add_block(block) and rollback(height) methods, e.g. storage.TxIndex
+        :return: None
+        """
+        tx_index.sync(self.chain)
+        self.tx_index = tx_index
+
+    def pin(self) -> ChainSnapshot:
+        """Returns read view of current tip, which is protected from block tree pruning until unpin(...).
+
+        :return: snapshot of tip
+        :rtype: ChainSnapshot
+        """
+        while True:
+            snapshot = self._snapshot
+            # tip may have moved on and old one may have been pruned meanwhile, then the new one is taken
+            if self.tree.pin(snapshot.entry):
+                return snapshot
+
+    def pin_block(self, block_hash: str) -> Optional[ChainSnapshot]:
+        """Returns read view of block of block tree, which is protected from block tree pruning until unpin(...).
+
+        :param block_hash: block hash
+        :type block_hash: str
+        :return: snapshot of block or None if block is not in tree (e.g. it has been pruned)
+        :rtype: Optional[ChainSnapshot]
+        """
+        entry = self.tree.get(block_hash)
+        if entry is None or not self.tree.pin(entry):
+            return None
+
+        return ChainSnapshot(entry, self.chain)
+
+    def unpin(self, snapshot: ChainSnapshot) -> None:
+        """Releases read view returned by pin(...) or pin_block(...).
+
+        :param snapshot: snapshot
+        :type snapshot: ChainSnapshot
+        :return: None
+        """
+        self.tree.unpin(snapshot.entry)
+
+    def _append(self, block: Block) -> None:
+        self.chain.append(block)
+        if self.tx_index is not None:
+            self.tx_index.add_block(block)
+
+    def add_block(self, new_block: Block) -> Optional[Reorg]:
+        """ Validates block and adds to block tree, switching chain to the best branch.
+
+        Block is executed on the state of its parent, which must be in block tree. Block on top of the tip extends
+        chain. Block on another branch is kept in tree and, if its branch gets more cumulative work than canonical
+        one, chain is reorganized onto it.
 
         :param new_block: block to be added in blockchain
         :type new_block: Block
-        :return: None
+        :return: reorganization if chain was switched to another branch, None otherwise
+        :rtype: Optional[Reorg]
         """
         assert isinstance(new_block, Block)
+
+        if self.tree is None:
+            # genesis block
+            new_state = self._validate_block(new_block, None, self._state)
+            self._append(new_block)
+            self._state = new_state
+            self.tree = BlockTree(new_block, new_state)
+            self._snapshot = ChainSnapshot(self.tree.tip, self.chain)
+            return None
+
+        assert new_block.hash not in self.tree, 'block is already known'
+        parent = self.tree.get(new_block.header.parent_hash)
+        assert parent is not None, 'parent block is unknown'
+
         try:
-            new_state = self._validate_block(new_block, self.last, self._state)
+            new_state = self._validate_block(new_block, parent.block, parent.state)
         except Exception:
             raise
 
-        self.chain.append(new_block)
-        self._state = new_state
+        entry = self.tree.add(new_block, new_state)
+        if self.tree.best(entry) is not entry:
+            return None
+
+        if entry.parent is self.tree.tip:
+            self._append(new_block)
+            self._state = new_state
+            self.tree.tip = entry
+            self._snapshot = ChainSnapshot(entry, self.chain)
+            self.tree.prune()
+            if self.on_new_tip is not None:
+                self.on_new_tip(new_block, None)
+            return None
+
+        reorg = self._reorg(entry)
+        if self.on_new_tip is not None:
+            self.on_new_tip(new_block, reorg)
+
+        return reorg
+
+    def _reorg(self, entry) -> Reorg:
+        """Switches chain to branch ending with entry.
+
+        Chain is cut down to common ancestor and blocks of new branch are appended, state of new tip is taken from
+        block tree, so no block is re-executed.
+
+        :param entry: block tree entry of new tip
+        :type entry: TreeEntry
+        :return: reorganization
+        :rtype: Reorg
+        """
+        started = time.perf_counter()
+
+        ancestor, disconnected, connected = self.tree.path(self.tree.tip, entry)
+
+        truncate = getattr(self.chain, 'truncate', None)
+        if truncate is not None:
+            truncate(ancestor.height + 1)
+        else:
+            del self.chain[ancestor.height + 1:]
+        if self.tx_index is not None:
+            self.tx_index.rollback(ancestor.height + 1)
+        for connected_entry in connected:
+            self._append(connected_entry.block)
+
+        self._state = entry.state
+        self.tree.tip = entry
+        self._snapshot = ChainSnapshot(entry, self.chain)
+        self.tree.prune()
+
+        return Reorg(ancestor.block, [e.block for e in disconnected], [e.block for e in connected],
+                     time.perf_counter() - started)
 
     @staticmethod
-    def _validate_chain(chain: list[Block]):
+    def _validate_chain(chain: Sequence[Block], progress: Callable[[int, int, float], None] = None) -> bool:
         """Quickly validates chain.
 
-        Checks next:
-            - all items in chain are Blocks
-            - first block is at height 0
-            - every next block has block.height == prev_block.height + 1
-            - every next block has block.header.parent_hash == prev_block.hash
-            - every next block has block.header.timestamp > prev_block.header.timestamp
-            - every next block has block.header.timestamp <= prev_block.header.timestamp + 60 min
-            - every block has block.header.tx_root_hash == merkle_hash(block.transactions)
-            - target check ... (not implemented) # TODO
+        Streams chain in chunks, per-block work is done on process pool, lookup ChainValidator for checks.
 
         Does not validates transactions in block — just assumes that it is ok.
 
         :param chain: chain of blocks to be validated
-        :type chain: list[Block]
-        :return: None
+        :type chain: Sequence[Block]
+        :param progress: callable receiving (validated blocks, total blocks, blocks/sec) (optional)
+        :type progress: Callable[[int, int, float], None]
+        :return: True
         """
-        header_pairs = tuple((it[1].header, chain[it[0]].header) for it in enumerate(chain[1:]))
-        timedelta = datetime.timedelta(hours=1)
-
-        assert isinstance(chain, list)
         assert len(chain) > 1
-        assert all((isinstance(i, Block) for i in chain))
-        assert chain[0].header.heigth == 0
-        assert all((pair[0].heigth - pair[1].heigth == 1 for pair in header_pairs))
-        assert all((pair[0].parent_hash == pair[1].hash for pair in header_pairs))
-        assert all((pair[0].timestamp > pair[1].timestamp for pair in header_pairs))
-        assert all((pair[0].timestamp <= pair[1].timestamp + timedelta for pair in header_pairs))
-        assert all(block.header.tx_root_hash == block.tx_root for block in chain)
+
+        ChainValidator(progress=progress).validate(chain)
+
+        return True
+
+    def expected_target(self, height: int) -> int:
+        """Returns proof of work target block at height MUST have.
+
+        :param height: block height
+        :type height: int
+        :return: target, the same for every height
+        :rtype: int
+        """
+        return self.target
 
     def _validate_block(self, block: Block, prev_block: Block, world_state: WorldState) -> WorldState:
         """Validates arbitraty block on some arbitraty parent block and arbitraty state of blockchain.
 
         Checks:
             - block.header.height > 1
-            - block.header.height == prev_block.header.height - 1
+            - block.header.height == prev_block.header.height + 1
             - block.header.parent_hash == prev_block.hash
             - block.header.timestamp > prev_block.header.timestamp
             - block.header.timestamp <= prev_block.header.timestamp + 60 min
-            - target check ... (not implemented) # TODO
+            - block.hash <= block.header.target
+            - block.header.target == expected_target(block.header.height)
             - block.header.tx_root_hash == merkle_hash(block.transactions)
             - validate all txs <there all txs are executed and new state calculated>
-            - state_after_txs.state_roots_hash = block.header.state_roots_hash
+            - state_after_txs_and_reward.state_roots_hash = block.header.state_roots_hash
 
         :param block: block to be validated
         :type block: Block
@@ -179,36 +362,65 @@ class BlockChain(object):
         :return: modified world state
         :rtype: WorldState
         """
+        # cumulative work of branch is summed from targets, so they are checked before block gets into tree
+        assert int(block.hash, 16) <= block.header.target, 'invalid proof of work'
+        assert block.header.target == self.expected_target(block.header.heigth), 'unexpected target'
         if not block.header.heigth == 0:
             assert block.header.heigth >= 1
-            assert block.header.heigth == prev_block.header.heigth - 1
+            assert block.header.heigth == prev_block.header.heigth + 1
             assert block.header.parent_hash == prev_block.hash
             assert block.header.timestamp > prev_block.header.timestamp
             assert block.header.timestamp <= prev_block.header.timestamp + datetime.timedelta(hours=1)
         assert block.header.tx_root_hash == block.tx_root
 
         try:
-            new_state = self._validate_txs(block.transactions, world_state)
+            if self.executor is not None:
+                new_state = self.executor.execute(block.transactions, world_state, self.check_tx)
+            else:
+                new_state = self._validate_txs(block.transactions, world_state)
         except Exception:
             raise
 
+        new_state.execute_reward_modification(block.header.beneficiary, BLOCK_REWARD)
         assert new_state.state_roots_hash == block.header.state_root_hash
-        new_state.execute_reward_modification(block.header.beneficiary, 500)
 
         return new_state
 
     @staticmethod
-    def _validate_txs(txs: list[Transaction], world_state: WorldState) -> WorldState:
-        """Validates sequence of transactions and calculates modified world state.
+    def check_tx(tx: Transaction, world_state: WorldState, check_signature: bool = True) -> None:
+        """Validates arbitrary transaction before execution on arbitrary state.
 
         Checks:
             - tx.sender is in world state account trie
             - tx.pubkey matches tx.sender
             - tx.signature is valid
             - tx.payload valid for used tx.type
+
+        :param tx: Transaction to be validated
+        :type tx: Transaction
+        :param world_state: world state to be validated against
+        :type world_state: WorldState
+        :param check_signature: verify signature, False if it was verified before
+        :type check_signature: bool
+        :return: None
+        :raises: AssertionError if any check fails
+        """
+        assert world_state.account_exists(tx.sender)
+        assert dsha256(tx.pub_key) == tx.sender
+        if check_signature:
+            assert check_signature_ecdsa(tx.pub_key, tx.signature, tx.hash)
+        assert tx.tx_type.payload_is_valid(tx.payload)
+
+    @staticmethod
+    def _validate_txs(txs: list[Transaction], world_state: WorldState) -> WorldState:
+        """Validates sequence of transactions and calculates modified world state.
+
+        Checks:
+            - lookup check_tx(...)
             - state modification can be executed <there new state is trying to be calculated>
 
-        Every next transaction will be validated on and will modify new world state.
+        Every next transaction will be validated on and will modify new world state. Tries are written once for the
+        whole sequence, when state roots hash is requested, lookup WorldState.commit(...)
 
         :param txs: list of Transactions
         :type txs: list[Transaction]
@@ -218,40 +430,14 @@ class BlockChain(object):
         :return: modified world state
         :rtype: WorldState
         """
-
-        def validate_tx(tx: Transaction, _state: WorldState) -> WorldState:
-            """Validates arbitrary transaction on arbitrary state.
-
-            Lookup docsting for _validate_txs(...)
-
-            :param tx: Transaction to be validated
-            :type tx: Transaction
-            :param _state: world state to be cvalidated against
-            :type _state: WorldState
-            :return: modified world state
-            :rtype: WorldState
-            :raises: # TODO: document exceptions
-            """
-            assert _state.account_exists(tx.sender)
-            assert dsha256(tx.pub_key) == tx.sender
-            assert check_signature_ecdsa(tx.pub_key, tx.signature, tx.hash)
-            assert tx.tx_type.payload_is_valid(tx.payload)
-            assert ...
-
-            try:
-                _new_state = _state.execute_tx(tx)
-            except Exception:
-                raise
-
-            return _new_state
-
         assert all(isinstance(tx, Transaction) for tx in txs)
         assert isinstance(world_state, WorldState)
 
-        new_world_state = copy.deepcopy(world_state)
+        new_world_state = world_state.fork()
         for tx in txs:
             try:
-                new_world_state = validate_tx(tx, new_world_state)
+                BlockChain.check_tx(tx, new_world_state)
+                new_world_state.apply_tx(tx)
             except Exception:
                 raise
 
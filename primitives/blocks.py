@@ -1,6 +1,7 @@
 import datetime
 import json
 
+from primitives.merkle import MerkleTree
 from primitives.transactions import Transaction
 from crypto.hashing import dsha256, keccak_hash
 
@@ -50,7 +51,7 @@ class BlockHeader(object):
         more_args = {}
         for arg in ('state_root', 'tx_root', 'comment', 'nonce'):
             try:
-                value = dump['state_root']
+                value = dump[arg]
             except KeyError:
                 value = None
             more_args[arg] = value
@@ -65,6 +66,24 @@ class BlockHeader(object):
                            comment=more_args['comment'],
                            nonce=more_args['nonce'])
 
+    def fields(self) -> dict:
+        """Returns header fields in the order they are hashed.
+
+        :return: header fields
+        :rtype: dict
+        """
+        return {
+            'parent_hash': self.parent_hash,
+            'beneficiary': self.beneficiary,
+            'target': self.target,
+            'height': self.heigth,
+            'timestamp': int(self.timestamp.timestamp()),
+            'state_root': self.state_root_hash,
+            'tx_root': self.tx_root_hash,
+            'comment': self.comment,
+            'nonce': self.nonce
+        }
+
     def dump(self, dump_format: str = 'json'):
         if dump_format == 'json':
             return json.dumps({
@@ -80,17 +99,7 @@ class BlockHeader(object):
                 'nonce': self.nonce
             })
         elif dump_format == 'json_raw':  # TODO: replace by bytes-like dump
-            return json.dumps({
-                'parent_hash': self.parent_hash,
-                'beneficiary': self.beneficiary,
-                'target': self.target,
-                'height': self.heigth,
-                'timestamp': int(self.timestamp.timestamp()),
-                'state_root': self.state_root_hash,
-                'tx_root': self.tx_root_hash,
-                'comment': self.comment,
-                'nonce': self.nonce
-            })
+            return json.dumps(self.fields())
         else:
             raise NotImplementedError
 
@@ -98,6 +107,7 @@ class BlockHeader(object):
 class Block(object):
     header: BlockHeader
     transactions: list[Transaction]
+    _tx_tree: MerkleTree = None
 
     @property
     def hash(self):
@@ -105,36 +115,38 @@ class Block(object):
 
     @property
     def tx_root(self):
+        if self._tx_tree is not None:
+            return self._tx_tree.root
         return self._compute_tx_merkle_root(self.transactions)
 
     def mine(self):
         while int(self.hash, 16) > self.header.target:
             self.header.nonce = self.header.nonce + 1
 
-    @staticmethod
-    def _compute_tx_merkle_root(txs: list[Transaction]) -> str:
-        def compute_merkle_nodes(_hashes: list[str]) -> list[str]:
-            if not len(_hashes) % 2:
-                _hashes.append(_hashes[-1])
-            _hashes = [dsha256(i[0] + i[1]) for i in zip([v for i, v in enumerate(_hashes) if not i % 2],
-                                                         [v for i, v in enumerate(_hashes) if i % 2])]
-            return _hashes
-
-        if not txs:
-            return '0' * 64
+    def tx_proof(self, index: int) -> list[tuple[str, bool]]:
+        """Returns inclusion proof for transaction at index against header.tx_root_hash.
 
-        hashes = [tx.hash for tx in txs]
-        while len(hashes) != 1:
-            hashes = compute_merkle_nodes(hashes)
+        :param index: index of transaction in block
+        :type index: int
+        :return: inclusion proof, lookup MerkleTree.proof(...)
+        :rtype: list[tuple[str, bool]]
+        """
+        return MerkleTree.from_hashes(tx.hash for tx in self.transactions).proof(index)
 
-        return hashes[0]
+    @staticmethod
+    def _compute_tx_merkle_root(txs: list[Transaction]) -> str:
+        return MerkleTree.from_hashes(tx.hash for tx in txs).root
 
-    def __init__(self, header: BlockHeader, transactions: list[Transaction]):
+    def __init__(self, header: BlockHeader, transactions: list[Transaction], tx_tree: MerkleTree = None):
         assert isinstance(header, BlockHeader)
         assert all(isinstance(tx, Transaction) for tx in transactions)
 
         self.header = header
         self.transactions = transactions
+        if tx_tree is not None:
+            # trusted tree built by block producer from the very same transactions, saves rehashing
+            assert len(tx_tree) == len(transactions)
+            self._tx_tree = tx_tree
 
         if self.header.tx_root_hash:
             assert self.header.tx_root_hash == self.tx_root
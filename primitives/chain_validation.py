@@ -0,0 +1,190 @@
+import datetime
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterator, Sequence, Union
+
+from crypto import dsha256, check_signature_ecdsa
+from primitives.blocks import Block, BlockHeader
+from primitives.merkle import MerkleTree
+from primitives.transactions import Transaction
+
+# (block hash, parent hash, height, timestamp, target, tx root is valid, signatures are valid)
+BlockSummary = tuple[str, str, int, int, int, bool, bool]
+
+
+def _summarize_block(item: Union[Block, tuple[bytes, bytes]], check_signatures: bool) -> BlockSummary:
+    """Does independent (not depending on other blocks) work of block validation.
+
+    Runs in worker process. Accepts either Block or raw (header, body) pair from storage.BlockStore.raw(...).
+
+    :param item: block or its raw header and body
+    :type item: Union[Block, tuple[bytes, bytes]]
+    :param check_signatures: verify public keys and signatures of transactions
+    :type check_signatures: bool
+    :return: summary of block for linkage checks
+    :rtype: BlockSummary
+    """
+    if isinstance(item, Block):
+        header, txs = item.header, item.transactions
+    else:
+        header = json.loads(item[0], object_hook=BlockHeader.json_parser_hook)
+        txs = [json.loads(tx, object_hook=Transaction.json_parser_hook) for tx in json.loads(item[1])]
+
+    tx_hashes = [tx.hash for tx in txs]
+    tx_root_is_valid = MerkleTree.from_hashes(tx_hashes).root == header.tx_root_hash
+
+    signatures_are_valid = True
+    if check_signatures:
+        try:
+            signatures_are_valid = all(dsha256(tx.pub_key) == tx.sender
+                                       and check_signature_ecdsa(tx.pub_key, tx.signature, tx_hash)
+                                       for tx, tx_hash in zip(txs, tx_hashes))
+        except Exception:
+            signatures_are_valid = False
+
+    return (header.hash, header.parent_hash, header.heigth, int(header.timestamp.timestamp()), header.target,
+            tx_root_is_valid, signatures_are_valid)
+
+
+def _summarize_chunk(items: list, check_signatures: bool) -> list[BlockSummary]:
+    return [_summarize_block(item, check_signatures) for item in items]
+
+
+class ValidationReport(object):
+    """Represents result of chain validation.
+
+    Public attributes:
+        blocks — number of validated blocks
+        seconds — wall time of validation
+        blocks_per_sec — validation throughput
+    """
+
+    def __init__(self, blocks: int, seconds: float) -> None:
+        self.blocks = blocks
+        self.seconds = seconds
+        self.blocks_per_sec = blocks / seconds if seconds else float('inf')
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.blocks} blocks, {self.seconds:.3f}s, {self.blocks_per_sec:.1f} blocks/s)'
+
+
+class ChainValidator(object):
+    """Validates chain of blocks, streaming it in chunks.
+
+    Public methods:
+        validate(...) — validates chain, raises AssertionError on first invalid block
+
+    Independent per-block work (header hashes, tx merkle roots, signatures) is done on process pool, chunks are
+    submitted in bounded window, so memory does not depend on chain length. Linkage, timestamps and proof of work
+    targets are checked in one pass in submission order.
+    Blocks are read from storage.BlockStore as raw bytes, so they are parsed only in workers.
+
+    Checks:
+        - first block is at height 0
+        - every next block has block.height == prev_block.height + 1
+        - every next block has block.header.parent_hash == prev_block.hash
+        - every next block has block.header.timestamp > prev_block.header.timestamp
+        - every next block has block.header.timestamp <= prev_block.header.timestamp + 60 min
+        - every block has block.hash <= block.header.target
+        - every block has block.header.tx_root_hash == merkle_hash(block.transactions)
+        - every transaction has valid public key and signature (optional)
+
+    Does not validate execution of transactions — just assumes that it is ok.
+    """
+    MAX_TIMESTAMP_STEP = int(datetime.timedelta(hours=1).total_seconds())
+
+    def __init__(self, workers: int = None, chunk_size: int = 256, check_signatures: bool = True,
+                 progress: Callable[[int, int, float], None] = None) -> None:
+        """Initialization of validator.
+
+        :param workers: number of worker processes, 0 to validate in current process (optional, CPUs by default)
+        :type workers: int
+        :param chunk_size: number of blocks in one task
+        :type chunk_size: int
+        :param check_signatures: verify public keys and signatures of transactions
+        :type check_signatures: bool
+        :param progress: callable receiving (validated blocks, total blocks, blocks/sec) after every chunk (optional)
+        :type progress: Callable[[int, int, float], None]
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_size = chunk_size
+        self.check_signatures = check_signatures
+        self.progress = progress
+
+    def validate(self, chain: Sequence[Block], start: int = 0) -> ValidationReport:
+        """Validates chain.
+
+        :param chain: list of blocks or storage.BlockStore
+        :type chain: Sequence[Block]
+        :param start: height to start from, previous block is used only for linkage (optional)
+        :type start: int
+        :return: validation report
+        :rtype: ValidationReport
+        :raises AssertionError: if chain is invalid
+        """
+        assert len(chain) > start
+
+        started = time.perf_counter()
+        total = len(chain) - start
+        validated = 0
+        previous = _summarize_block(self._item(chain, start - 1), False) if start else None
+
+        executor = ProcessPoolExecutor(self.workers) if self.workers else None
+        try:
+            for summaries in self._summaries(chain, start, executor):
+                for summary in summaries:
+                    self._check_linkage(summary, previous)
+                    previous = summary
+
+                validated += len(summaries)
+                if self.progress:
+                    elapsed = time.perf_counter() - started
+                    self.progress(validated, total, validated / elapsed if elapsed else float('inf'))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        return ValidationReport(validated, time.perf_counter() - started)
+
+    def _check_linkage(self, summary: BlockSummary, previous: BlockSummary) -> None:
+        block_hash, parent_hash, height, timestamp, target, tx_root_is_valid, signatures_are_valid = summary
+
+        assert tx_root_is_valid, f'invalid tx root of block {height}'
+        assert signatures_are_valid, f'invalid signature in block {height}'
+        assert int(block_hash, 16) <= target, f'invalid proof of work of block {height}'
+
+        if previous is None:
+            assert height == 0, 'first block is not at height 0'
+            return
+
+        assert height == previous[2] + 1, f'invalid height of block {height}'
+        assert parent_hash == previous[0], f'invalid parent hash of block {height}'
+        assert previous[3] < timestamp <= previous[3] + self.MAX_TIMESTAMP_STEP, f'invalid timestamp of block {height}'
+
+    def _summaries(self, chain: Sequence[Block], start: int, executor: Executor) -> Iterator[list[BlockSummary]]:
+        """Yields summaries of chunks in chain order, keeping bounded number of chunks in flight."""
+        chunks = (
+            [self._item(chain, height) for height in range(begin, min(begin + self.chunk_size, len(chain)))]
+            for begin in range(start, len(chain), self.chunk_size)
+        )
+
+        if executor is None:
+            for chunk in chunks:
+                yield _summarize_chunk(chunk, self.check_signatures)
+            return
+
+        window = deque()
+        for chunk in chunks:
+            window.append(executor.submit(_summarize_chunk, chunk, self.check_signatures))
+            if len(window) >= 2 * self.workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+    @staticmethod
+    def _item(chain: Sequence[Block], height: int) -> Union[Block, tuple[bytes, bytes]]:
+        raw = getattr(chain, 'raw', None)
+        return raw(height) if raw is not None else chain[height]
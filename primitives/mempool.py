@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+from typing import Callable, Iterator, Optional
+
+from primitives.transactions import Transaction
+
+
+class MempoolEntry(object):
+    """Represents transaction stored in mempool together with its bookkeeping.
+
+    Public attributes:
+        tx — stored transaction
+        hash — transaction hash (computed once on admission)
+        size — size of raw transaction dump, bytes
+        priority — priority of transaction, greater is better
+        seq — admission sequence number, used as tie breaker (earlier is better)
+    """
+    __slots__ = ('tx', 'hash', 'size', 'priority', 'seq')
+
+    def __init__(self, tx: Transaction, tx_hash: str, size: int, priority: int, seq: int) -> None:
+        self.tx = tx
+        self.hash = tx_hash
+        self.size = size
+        self.priority = priority
+        self.seq = seq
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.hash}, {self.size}, {self.priority}, {self.seq})'
+
+
+class Mempool(object):
+    """Represents pool of pending (not yet included in chain) transactions.
+
+    Public attributes:
+        count — number of transactions in pool
+        size — total size of transactions in pool, bytes
+    Public methods:
+        add(...) — adds transaction to pool, evicting worst ones if caps are exceeded
+        get(...) — returns transaction by hash
+        remove(...) — removes transaction by hash
+        remove_confirmed(...) — removes transactions included in block
+        select(...) — yields transactions in block inclusion order
+        stats(...) — returns counters for monitoring
+    Private attributes:
+        _by_hash — hash index of entries
+        _by_sender — per-sender nonce queues (nonce -> hash)
+        _eviction — lazy min-heap of (priority, -seq, hash), worst entry on top
+
+    Transactions of one sender are always selected in nonce order, senders are interleaved by priority of their
+    next transaction. Eviction removes the worst transaction along with the transactions of the same sender
+    with greater nonce, because they can not be included without it.
+
+    By default priority is admission order (FIFO), pass priority callable to override it.
+    All methods are thread-safe.
+    """
+    max_count: int = 0
+    max_size: int = 0
+    _priority: Callable[[Transaction], int] = None
+    _by_hash: dict[str, MempoolEntry] = None
+    _by_sender: dict[str, dict[int, str]] = None
+    _eviction: list[tuple[int, int, str]] = None
+    _size: int = 0
+
+    @property
+    def count(self) -> int:
+        """Returns number of transactions in pool.
+
+        :return: number of transactions
+        :rtype: int
+        """
+        return len(self._by_hash)
+
+    @property
+    def size(self) -> int:
+        """Returns total size of transactions in pool.
+
+        :return: size, bytes
+        :rtype: int
+        """
+        return self._size
+
+    def __init__(self, max_count: int = 10_000, max_size: int = 16 * 2 ** 20,
+                 priority: Callable[[Transaction], int] = None) -> None:
+        """Initialization of mempool.
+
+        :param max_count: maximum number of transactions in pool
+        :type max_count: int
+        :param max_size: maximum total size of transactions in pool, bytes
+        :type max_size: int
+        :param priority: callable returning priority of transaction, greater is better (optional)
+        :type priority: Callable[[Transaction], int]
+        """
+        assert max_count > 0 and max_size > 0
+
+        self.max_count = max_count
+        self.max_size = max_size
+        self._priority = priority
+        self._by_hash = {}
+        self._by_sender = {}
+        self._eviction = []
+        self._size = 0
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._by_hash)
+
+    def __contains__(self, tx_hash: str) -> bool:
+        return tx_hash in self._by_hash
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.count} txs, {self.size} bytes)'
+
+    def add(self, tx: Transaction) -> bool:
+        """Adds transaction to pool.
+
+        Duplicates (by hash or by (sender, nonce)) are rejected. If caps are exceeded after admission, worst
+        transactions are evicted, which may be the admitted transaction itself.
+
+        :param tx: transaction to be added
+        :type tx: Transaction
+        :return: True if transaction stays in pool, False if it was rejected or evicted
+        :rtype: bool
+        """
+        assert isinstance(tx, Transaction)
+
+        raw = tx.dump('json-raw')
+        entry = MempoolEntry(tx, tx.hash, len(raw.encode('utf-8')),
+                             self._priority(tx) if self._priority else 0, next(self._seq))
+
+        with self._lock:
+            if entry.hash in self._by_hash:
+                return False
+
+            queue = self._by_sender.setdefault(tx.sender, {})
+            if tx.nonce in queue:
+                return False
+
+            queue[tx.nonce] = entry.hash
+            self._by_hash[entry.hash] = entry
+            self._size += entry.size
+            heapq.heappush(self._eviction, (entry.priority, -entry.seq, entry.hash))
+
+            while self.count > self.max_count or self._size > self.max_size:
+                self._evict_worst()
+
+            return entry.hash in self._by_hash
+
+    def get(self, tx_hash: str) -> Optional[Transaction]:
+        """Returns transaction by hash.
+
+        :param tx_hash: transaction hash
+        :type tx_hash: str
+        :return: transaction or None if it is not in pool
+        :rtype: Optional[Transaction]
+        """
+        entry = self._by_hash.get(tx_hash)
+        return entry.tx if entry else None
+
+    def remove(self, tx_hash: str) -> Optional[Transaction]:
+        """Removes transaction by hash in O(1).
+
+        :param tx_hash: transaction hash
+        :type tx_hash: str
+        :return: removed transaction or None if it was not in pool
+        :rtype: Optional[Transaction]
+        """
+        with self._lock:
+            try:
+                entry = self._by_hash.pop(tx_hash)
+            except KeyError:
+                return None
+
+            queue = self._by_sender[entry.tx.sender]
+            del queue[entry.tx.nonce]
+            if not queue:
+                del self._by_sender[entry.tx.sender]
+            self._size -= entry.size
+
+            if len(self._eviction) > 2 * len(self._by_hash) + 64:
+                self._compact()
+
+            return entry.tx
+
+    def remove_confirmed(self, txs: list[Transaction]) -> int:
+        """Removes transactions included in block.
+
+        Pending transactions which reuse (sender, nonce) of confirmed transaction are removed too.
+
+        :param txs: transactions of added block
+        :type txs: list[Transaction]
+        :return: number of removed transactions
+        :rtype: int
+        """
+        removed = 0
+        with self._lock:
+            for tx in txs:
+                queue = self._by_sender.get(tx.sender)
+                if not queue or tx.nonce not in queue:
+                    continue
+                if self.remove(queue[tx.nonce]) is not None:
+                    removed += 1
+
+        return removed
+
+    def select(self, max_count: int = None, max_size: int = None) -> Iterator[Transaction]:
+        """Yields transactions in block inclusion order.
+
+        Every sender contributes its transactions in nonce order, senders are interleaved by priority of their
+        next transaction. Selection works on a snapshot, so pool may be modified while iterating.
+
+        :param max_count: maximum number of transactions to yield (optional)
+        :type max_count: int
+        :param max_size: maximum total size of transactions to yield, bytes (optional)
+        :type max_size: int
+        :return: iterator over transactions
+        :rtype: Iterator[Transaction]
+        """
+        with self._lock:
+            queues = [[self._by_hash[queue[nonce]] for nonce in sorted(queue)] for queue in self._by_sender.values()]
+
+        heap = [(-q[0].priority, q[0].seq, i, 0) for i, q in enumerate(queues)]
+        heapq.heapify(heap)
+
+        count = size = 0
+        while heap and (max_count is None or count < max_count):
+            _, _, i, position = heapq.heappop(heap)
+            entry = queues[i][position]
+
+            if max_size is not None and size + entry.size > max_size:
+                continue
+
+            count += 1
+            size += entry.size
+            yield entry.tx
+
+            position += 1
+            if position < len(queues[i]):
+                heapq.heappush(heap, (-queues[i][position].priority, queues[i][position].seq, i, position))
+
+    def stats(self) -> dict[str, int]:
+        """Returns counters for monitoring.
+
+        :return: number of transactions and senders, total size and caps
+        :rtype: dict[str, int]
+        """
+        with self._lock:
+            return {'count': self.count,
+                    'size': self._size,
+                    'senders': len(self._by_sender),
+                    'max_count': self.max_count,
+                    'max_size': self.max_size}
+
+    def _evict_worst(self) -> None:
+        """Evicts worst transaction and transactions of the same sender with greater nonce.
+
+        :return: None
+        """
+        while self._eviction:
+            _, neg_seq, tx_hash = heapq.heappop(self._eviction)
+            entry = self._by_hash.get(tx_hash)
+            if entry is None or entry.seq != -neg_seq:
+                continue
+
+            queue = self._by_sender[entry.tx.sender]
+            for nonce in [n for n in queue if n >= entry.tx.nonce]:
+                self.remove(queue[nonce])
+            return
+
+    def _compact(self) -> None:
+        """Drops stale items of lazy eviction heap.
+
+        :return: None
+        """
+        self._eviction = [(e.priority, -e.seq, e.hash) for e in self._by_hash.values()]
+        heapq.heapify(self._eviction)
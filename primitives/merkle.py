@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from crypto.hashing import dsha256
+
+
+class MerkleTree(object):
+    """Represents Merkle tree over transaction hashes.
+
+    Public attributes:
+        root — current root hash of the tree
+    Public methods:
+        append(...) — adds one transaction hash to the tree
+        extend(...) — adds sequence of transaction hashes to the tree
+        proof(...) — returns inclusion proof for transaction at index
+        verify(...) — checks inclusion proof against root
+        from_hashes(...) — builds tree for full block at once
+        copy(...) — returns copy of tree
+    Private attributes:
+        _levels — cached levels of the tree, leaves first
+
+    Roots are compatible with historical Block._compute_tx_merkle_root: every level is built from pairs
+    (2i, 2i + 1) with dsha256(left + right), the unpaired tail of odd-sized level is not carried to the next level,
+    and the root is the first level consisting of single hash. Transaction hash, which ended up in such unpaired
+    tail, is not committed by root, so no proof exists for it.
+
+    Appending is O(log n): only the right edge of the tree is recomputed.
+    """
+    EMPTY_ROOT: str = '0' * 64
+
+    _levels: list[list[str]] = None
+
+    @property
+    def root(self) -> str:
+        """Returns current root hash of the tree.
+
+        :return: root hash or EMPTY_ROOT for empty tree
+        :rtype: str
+        """
+        for level in self._levels:
+            if len(level) == 1:
+                return level[0]
+
+        return self.EMPTY_ROOT
+
+    def __init__(self, hashes: Iterable[str] = None) -> None:
+        """Initialization of tree.
+
+        :param hashes: transaction hashes to be appended one by one (optional)
+        :type hashes: Iterable[str]
+        """
+        self._levels = [[]]
+
+        if hashes:
+            self.extend(hashes)
+
+    def __len__(self) -> int:
+        return len(self._levels[0])
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self)} leaves, {self.root})'
+
+    @classmethod
+    def from_hashes(cls, hashes: Iterable[str]) -> MerkleTree:
+        """Builds tree for full block level by level.
+
+        Cheaper than appending hashes one by one when all of them are known beforehand.
+
+        :param hashes: transaction hashes
+        :type hashes: Iterable[str]
+        :return: built tree
+        :rtype: MerkleTree
+        """
+        tree = cls()
+
+        level = list(hashes)
+        tree._levels = [level]
+        while len(level) > 1:
+            level = [dsha256(left + right) for left, right in zip(level[0::2], level[1::2])]
+            tree._levels.append(level)
+
+        return tree
+
+    def copy(self) -> MerkleTree:
+        """Returns copy of tree, no hashes are recomputed.
+
+        :return: copy of tree
+        :rtype: MerkleTree
+        """
+        tree = MerkleTree()
+        tree._levels = [level[:] for level in self._levels]
+
+        return tree
+
+    def append(self, tx_hash: str) -> None:
+        """Adds transaction hash to the tree.
+
+        Computes parent hash only when appended hash completes a pair, so at most one hash per level is computed.
+
+        :param tx_hash: transaction hash
+        :type tx_hash: str
+        :return: None
+        """
+        assert isinstance(tx_hash, str)
+
+        node = tx_hash
+        height = 0
+        self._levels[height].append(node)
+
+        while not len(self._levels[height]) % 2:
+            node = dsha256(self._levels[height][-2] + node)
+            height += 1
+            if height == len(self._levels):
+                self._levels.append([])
+            self._levels[height].append(node)
+
+    def extend(self, hashes: Iterable[str]) -> None:
+        """Adds sequence of transaction hashes to the tree.
+
+        :param hashes: transaction hashes
+        :type hashes: Iterable[str]
+        :return: None
+        """
+        for tx_hash in hashes:
+            self.append(tx_hash)
+
+    def proof(self, index: int) -> list[tuple[str, bool]]:
+        """Returns inclusion proof for transaction at index.
+
+        Proof is a list of (sibling hash, sibling is left) pairs from leaf up to the root.
+
+        :param index: index of transaction in block
+        :type index: int
+        :return: inclusion proof
+        :rtype: list[tuple[str, bool]]
+        :raises IndexError: if index is out of range
+        :raises ValueError: if transaction at index is not committed by root
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        proof = []
+        for level in self._levels:
+            if len(level) == 1:
+                return proof
+
+            sibling = index ^ 1
+            if sibling >= len(level):
+                raise ValueError(f'transaction {index} is not committed by root')
+
+            proof.append((level[sibling], bool(index % 2)))
+            index //= 2
+
+        raise ValueError(f'transaction {index} is not committed by root')
+
+    @staticmethod
+    def verify(root: str, tx_hash: str, proof: list[tuple[str, bool]]) -> bool:
+        """Checks that transaction hash is committed by root.
+
+        :param root: expected root hash (e.g. block.header.tx_root_hash)
+        :type root: str
+        :param tx_hash: transaction hash
+        :type tx_hash: str
+        :param proof: inclusion proof from proof(...)
+        :type proof: list[tuple[str, bool]]
+        :return: True if proof is valid
+        :rtype: bool
+        """
+        node = tx_hash
+        for sibling, sibling_is_left in proof:
+            node = dsha256(sibling + node) if sibling_is_left else dsha256(node + sibling)
+
+        return node == root
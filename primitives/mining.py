@@ -0,0 +1,111 @@
+import json
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Optional
+
+from crypto.hashing import dsha256
+from primitives.blocks import Block
+
+
+def _search_nonce(fields: dict, target: int, start: int, count: int) -> Optional[int]:
+    """Searches nonce in [start, start + count) for header fields.
+
+    Runs in worker process, so it works on plain header fields instead of Block.
+
+    :param fields: header fields, lookup BlockHeader.fields(...)
+    :type fields: dict
+    :param target: proof of work target
+    :type target: int
+    :param start: first nonce to try
+    :type start: int
+    :param count: number of nonces to try
+    :type count: int
+    :return: found nonce or None
+    :rtype: Optional[int]
+    """
+    for nonce in range(start, start + count):
+        fields['nonce'] = nonce
+        if int(dsha256(json.dumps(fields)), 16) <= target:
+            return nonce
+
+    return None
+
+
+class ProcessPoolMiner(object):
+    """Searches proof of work nonce on pool of worker processes.
+
+    Public methods:
+        mine(...) — searches nonce for block, may be interrupted between chunks
+        shutdown(...) — stops worker processes
+    Private attributes:
+        _executor — pool of worker processes, started lazily
+        _workers — number of worker processes
+        _chunk — number of nonces searched by one task
+
+    Nonce space is split in chunks starting from random offset, every worker has a chunk in flight and
+    one more queued. Interruption is checked every poll_interval while waiting for chunks.
+    """
+    _executor: ProcessPoolExecutor = None
+    _workers: int = 0
+    _chunk: int = 0
+
+    def __init__(self, workers: int = None, chunk: int = 20_000, poll_interval: float = 0.05) -> None:
+        """Initialization of miner.
+
+        :param workers: number of worker processes (optional, number of CPUs by default)
+        :type workers: int
+        :param chunk: number of nonces searched by one task
+        :type chunk: int
+        :param poll_interval: how often interruption is checked, seconds
+        :type poll_interval: float
+        """
+        self._workers = workers or os.cpu_count() or 1
+        self._chunk = chunk
+        self._poll_interval = poll_interval
+
+    def mine(self, block: Block, interrupted: Callable[[], bool] = None) -> bool:
+        """Searches nonce satisfying block target and sets it to block header.
+
+        :param block: block to be mined
+        :type block: Block
+        :param interrupted: callable telling that search should be abandoned (optional)
+        :type interrupted: Callable[[], bool]
+        :return: True if nonce was found, False if search was interrupted
+        :rtype: bool
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self._workers)
+
+        fields = block.header.fields()
+        target = block.header.target
+        next_start = random.getrandbits(48)
+        in_flight: set[Future] = set()
+
+        try:
+            while True:
+                while len(in_flight) < 2 * self._workers:
+                    in_flight.add(self._executor.submit(_search_nonce, fields, target, next_start, self._chunk))
+                    next_start += self._chunk
+
+                done, in_flight = wait(in_flight, timeout=self._poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    nonce = future.result()
+                    if nonce is not None:
+                        block.header.nonce = nonce
+                        return True
+
+                if interrupted is not None and interrupted():
+                    return False
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        """Stops worker processes.
+
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Mapping
+
+
+class OverlayDict(MutableMapping):
+    """Represents dict layered over read-only parent mapping.
+
+    Public methods:
+        fork(...) — returns new overlay on top of this one in O(1)
+        is_local(...) — checks if key was set in this layer
+        local_items(...) — returns items set in this layer
+        apply(...) — copies changes of child overlay into this layer
+        rebase(...) — puts this layer on another parent holding the same items
+    Private attributes:
+        _parent — mapping this layer is put on
+        _local — items set in this layer
+        _deleted — keys deleted in this layer
+        _depth — number of layers beneath
+
+    Reads fall through to parent, writes and deletions stay in the layer, so forks share unchanged items.
+    Parent SHOULD NOT be modified while there are forks on top of it.
+    Layers beneath are squashed into single dict when depth exceeds MAX_DEPTH, so lookups stay O(MAX_DEPTH).
+    """
+    MAX_DEPTH: int = 16
+
+    _parent: Mapping = None
+    _local: dict = None
+    _deleted: set = None
+    _depth: int = 0
+
+    def __init__(self, parent: Mapping = None) -> None:
+        """Initialization of overlay.
+
+        :param parent: mapping to be layered over (optional)
+        :type parent: Mapping
+        """
+        self._parent = parent if parent is not None else {}
+        self._local = {}
+        self._deleted = set()
+        self._depth = parent._depth + 1 if isinstance(parent, OverlayDict) else 0
+
+    def __getitem__(self, key) -> Any:
+        try:
+            return self._local[key]
+        except KeyError:
+            pass
+
+        if key in self._deleted:
+            raise KeyError(key)
+
+        return self._parent[key]
+
+    def __setitem__(self, key, value) -> None:
+        self._local[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+
+        self._local.pop(key, None)
+        if key in self._parent:
+            self._deleted.add(key)
+
+    def __contains__(self, key) -> bool:
+        if key in self._local:
+            return True
+        if key in self._deleted:
+            return False
+        return key in self._parent
+
+    def __iter__(self) -> Iterator:
+        yield from self._local
+        for key in self._parent:
+            if key not in self._local and key not in self._deleted:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({len(self._local)} local, depth {self._depth})'
+
+    def fork(self) -> OverlayDict:
+        """Returns new overlay on top of this one.
+
+        :return: new overlay
+        :rtype: OverlayDict
+        """
+        if self._depth >= self.MAX_DEPTH:
+            self._squash()
+
+        return OverlayDict(self)
+
+    def _squash(self) -> None:
+        """Replaces layers beneath with single dict holding the same items.
+
+        View of this layer does not change, so it is safe for layers on top of it.
+
+        :return: None
+        """
+        self._parent = dict(self._parent.items())
+        self._depth = 0
+
+    def rebase(self, parent: Mapping) -> None:
+        """Puts this layer on another parent, which must hold the same items as layers beneath.
+
+        Like _squash(...), but items are not copied, so it is O(1) when equivalent parent is known.
+
+        :param parent: mapping to be layered over
+        :type parent: Mapping
+        :return: None
+        """
+        self._parent = parent
+        self._depth = parent._depth + 1 if isinstance(parent, OverlayDict) else 0
+
+    def is_local(self, key) -> bool:
+        """Checks if key was set in this layer.
+
+        :param key: key to be checked
+        :return: True if value for key is owned by this layer
+        :rtype: bool
+        """
+        return key in self._local
+
+    def local_items(self) -> dict:
+        """Returns items set in this layer.
+
+        :return: items set in this layer
+        :rtype: dict
+        """
+        return self._local
+
+    def apply(self, child: OverlayDict) -> None:
+        """Copies changes of child overlay into this layer.
+
+        Cost is proportional to the number of changes in child.
+
+        :param child: overlay forked from this one
+        :type child: OverlayDict
+        :return: None
+        """
+        assert isinstance(child, OverlayDict)
+
+        for key in child._deleted:
+            if key in self:
+                del self[key]
+        self._local.update(child._local)
+        self._deleted.difference_update(child._local)
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from primitives.accounts import Account
+from primitives.assets import Asset, AssetOwnershipType
+from primitives.transactions import Transaction
+from primitives.world_state import WorldState
+from primitives.world_state_modifications import WorldStateModificationType
+
+# (account name, asset name, ownership type value)
+BalanceKey = tuple[bytes, str, str]
+
+
+def touched_accounts(tx: Transaction) -> set[bytes]:
+    """Returns names of accounts which transaction reads or modifies.
+
+    :param tx: transaction
+    :type tx: Transaction
+    :return: names of accounts
+    :rtype: set[bytes]
+    """
+    accounts = {tx.sender.encode('utf-8')}
+    for _, kwargs in tx.atomize():
+        account = kwargs['account']
+        accounts.add(account.encode('utf-8') if isinstance(account, str) else account)
+
+    return accounts
+
+
+def touched_balances(tx: Transaction) -> set[BalanceKey]:
+    """Returns balances which transaction reads or modifies.
+
+    :param tx: transaction
+    :type tx: Transaction
+    :return: (account name, asset name, ownership type) keys
+    :rtype: set[BalanceKey]
+    """
+    balances = set()
+    for _, kwargs in tx.atomize():
+        account, asset = kwargs['account'], kwargs['asset']
+        balances.add((account.encode('utf-8') if isinstance(account, str) else account,
+                      asset.decode('utf-8') if isinstance(asset, bytes) else asset,
+                      kwargs['ownership_type'].value))
+
+    return balances
+
+
+def _execute_group(txs: list[Transaction], accounts: set[bytes], existing: set[bytes],
+                   balances: dict[BalanceKey, int], assets: dict[str, Asset],
+                   check_tx: Callable[[Transaction, WorldState], None]) -> tuple[dict[BalanceKey, int], set[bytes]]:
+    """Executes group of transactions on state view built from shipped balances.
+
+    Runs in worker process. View is scratch WorldState holding only shipped accounts and balances, transactions
+    are executed on it with the same checks and modifications as on real state.
+
+    :param txs: transactions, in block order
+    :type txs: list[Transaction]
+    :param accounts: names of accounts transactions are expected to touch
+    :type accounts: set[bytes]
+    :param existing: names of those accounts which exist in real state
+    :type existing: set[bytes]
+    :param balances: current values of balances transactions are expected to touch
+    :type balances: dict[BalanceKey, int]
+    :param assets: assets transactions refer to
+    :type assets: dict[str, Asset]
+    :param check_tx: transaction validation, lookup BlockChain.check_tx(...)
+    :type check_tx: Callable[[Transaction, WorldState], None]
+    :return: new values of shipped balances, names of accounts touched beyond shipped ones
+    :rtype: tuple[dict[BalanceKey, int], set[bytes]]
+    :raises AssertionError: if any transaction is invalid
+    """
+    view = WorldState()
+    for name, asset in assets.items():
+        view._assets[name.encode('utf-8')] = asset
+
+    amounts = {name: {} for name in existing}
+    for (name, asset_name, ownership_type), amount in balances.items():
+        if name in amounts and amount:
+            amounts[name][(asset_name, ownership_type)] = amount
+    for name, account_amounts in amounts.items():
+        view._accounts[name] = Account(name, view._accounts_storage, None, account_amounts)
+
+    for tx in txs:
+        check_tx(tx, view)
+        view.apply_tx(tx)
+
+    unexpected = {name for name in view._accounts.local_items() if name not in accounts}
+
+    written = {}
+    for key in balances:
+        name, asset_name, ownership_type = key
+        if view._accounts.is_local(name):
+            written[key] = view._accounts[name].get_amount(assets[asset_name], AssetOwnershipType(ownership_type))
+
+    return written, unexpected
+
+
+class ExecutionReport(object):
+    """Represents result of parallel execution of block transactions.
+
+    Public attributes:
+        transactions — number of executed transactions
+        waves — number of waves of non-conflicting transactions executed one after another
+        parallelism — average number of transactions executed concurrently
+        serial — number of transactions executed serially after unexpected conflict
+        seconds — wall time of execution
+    """
+
+    def __init__(self, transactions: int, waves: int, serial: int, seconds: float) -> None:
+        self.transactions = transactions
+        self.waves = waves
+        self.parallelism = transactions / waves if waves else 0.
+        self.serial = serial
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.transactions} txs, {self.waves} waves, ' \
+               f'parallelism {self.parallelism:.2f}, {self.serial} serial, {self.seconds:.3f}s)'
+
+
+class ParallelExecutor(object):
+    """Executes transactions of block optimistically in parallel, producing the same state as serial execution.
+
+    Public attributes:
+        workers — number of worker processes
+        min_wave — waves smaller than this are executed in current process
+        on_report — callable receiving ExecutionReport of every executed block (optional)
+    Public methods:
+        schedule(...) — splits transactions into waves of non-conflicting ones
+        execute(...) — validates and executes transactions, returns new state
+        shutdown(...) — stops worker processes
+    Private attributes:
+        _executor — pool of worker processes, started lazily
+
+    Read/write set of transaction is the accounts its atomized modifications touch (sender and recipients).
+    Transactions are scheduled in waves: transaction goes to the wave after the last one touching any of its
+    accounts, so transactions of one wave are independent and conflicting ones keep block order between waves.
+    Wave is split between workers, every worker executes its group on view holding only touched balances and
+    returns new values of them, which are applied to the state as balance deltas. Balances of different accounts
+    commute and tries are canonical, so state roots hash is exactly the one of serial execution.
+    Conflicts are detected after execution: if worker touched an account outside of predicted set, results of the
+    wave are discarded and the rest of block is executed serially.
+    """
+    _executor: ProcessPoolExecutor = None
+
+    def __init__(self, workers: int = None, min_wave: int = 16,
+                 on_report: Callable[[ExecutionReport], None] = None) -> None:
+        """Initialization of executor.
+
+        :param workers: number of worker processes (optional, number of CPUs by default)
+        :type workers: int
+        :param min_wave: waves smaller than this are executed in current process
+        :type min_wave: int
+        :param on_report: callable receiving ExecutionReport of every executed block (optional)
+        :type on_report: Callable[[ExecutionReport], None]
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_wave = min_wave
+        self.on_report = on_report
+
+    def shutdown(self) -> None:
+        """Stops worker processes.
+
+        :return: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def schedule(txs: list[Transaction]) -> tuple[list[list[int]], list[set[bytes]]]:
+        """Splits transactions into waves of non-conflicting ones.
+
+        :param txs: transactions, in block order
+        :type txs: list[Transaction]
+        :return: indexes of transactions of every wave (in block order), touched accounts of every transaction
+        :rtype: tuple[list[list[int]], list[set[bytes]]]
+        """
+        waves: list[list[int]] = []
+        accounts = []
+        last_wave: dict[bytes, int] = {}
+        for i, tx in enumerate(txs):
+            touched = touched_accounts(tx)
+            wave = 1 + max((last_wave.get(name, -1) for name in touched), default=-1)
+            for name in touched:
+                last_wave[name] = wave
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(i)
+            accounts.append(touched)
+
+        return waves, accounts
+
+    def execute(self, txs: list[Transaction], world_state: WorldState,
+                check_tx: Callable[[Transaction, WorldState], None]) -> WorldState:
+        """Validates sequence of transactions and calculates modified world state.
+
+        :param txs: list of Transactions
+        :type txs: list[Transaction]
+        :param world_state: world state first transaction to be validated against
+        :type world_state: WorldState
+        :param check_tx: transaction validation, lookup BlockChain.check_tx(...)
+        :type check_tx: Callable[[Transaction, WorldState], None]
+        :return: modified world state
+        :rtype: WorldState
+        :raises AssertionError: if any transaction is invalid
+        """
+        started = time.perf_counter()
+        new_state = world_state.fork()
+        waves, accounts = self.schedule(txs)
+
+        serial = 0
+        for n, wave in enumerate(waves):
+            if len(wave) < self.min_wave:
+                for i in wave:
+                    check_tx(txs[i], new_state)
+                    new_state.apply_tx(txs[i])
+                continue
+
+            if not self._execute_wave([txs[i] for i in wave], [accounts[i] for i in wave], new_state, check_tx):
+                # unpredicted access: waves are not independent, block order is the only safe one
+                rest = sorted(i for later in waves[n:] for i in later)
+                for i in rest:
+                    check_tx(txs[i], new_state)
+                    new_state.apply_tx(txs[i])
+                serial = len(rest)
+                waves = waves[:n] + [[i] for i in rest]
+                break
+
+        if self.on_report is not None:
+            self.on_report(ExecutionReport(len(txs), len(waves), serial, time.perf_counter() - started))
+
+        return new_state
+
+    def _execute_wave(self, txs: list[Transaction], accounts: list[set[bytes]], state: WorldState,
+                      check_tx: Callable[[Transaction, WorldState], None]) -> bool:
+        """Executes wave of independent transactions on worker processes and applies their writes to state.
+
+        :return: True if wave was executed, False if worker touched unpredicted account (state is untouched)
+        :rtype: bool
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+
+        size = -(-len(txs) // self.workers)
+        futures = []
+        for begin in range(0, len(txs), size):
+            group = txs[begin:begin + size]
+            names = set().union(*accounts[begin:begin + size])
+            existing = {name for name in names if state.account_exists(name)}
+            balances = {}
+            for tx in group:
+                for key in touched_balances(tx):
+                    name, asset_name, ownership_type = key
+                    balances[key] = state.get_amount(name, asset_name, AssetOwnershipType(ownership_type))
+            assets = {asset_name: state._assets[asset_name.encode('utf-8')] for _, asset_name, _ in balances}
+            futures.append(self._executor.submit(_execute_group, group, names, existing, balances, assets, check_tx))
+
+        results = [future.result() for future in futures]
+        if any(unexpected for _, unexpected in results):
+            return False
+
+        wave_state = state.fork()
+        for written, _ in results:
+            for (name, asset_name, ownership_type), amount in written.items():
+                delta = amount - wave_state.get_amount(name, asset_name, AssetOwnershipType(ownership_type))
+                if delta > 0:
+                    modification = WorldStateModificationType.add_asset_to_account
+                elif delta < 0:
+                    modification = WorldStateModificationType.sub_asset_from_account
+                else:
+                    continue
+                wave_state._execute_state_modification(modification, account=name, asset=asset_name,
+                                                       ownership_type=AssetOwnershipType(ownership_type),
+                                                       amount=abs(delta))
+        state._merge(wave_state)
+
+        return True
@@ -6,10 +6,15 @@ from crypto.hashing import dsha256
 from primitives.world_state_modifications import WorldStateModificationType
 from primitives.assets import AssetOwnershipType
 
+# maximal number of transfers in one batch transfer
+MAX_BATCH_TRANSFERS = 10_000
+
 
 class TransactionType(Enum):
     # simple transfer
     transfer = '00'
+    # transfer to many recipients, payload['transfers'] is list of [recipient, asset, ownership_type, amount]
+    batch_transfer = '01'
 
     # transfer with confirmation
     transfer_with_confirmation = '10'
@@ -29,6 +34,16 @@ class TransactionType(Enum):
         # TODO: switch to Structural Pattern Matching as soon as python3.10 released
         if self.value in ['00', '11']:  # transfer
             return all(k in payload for k in ['asset', 'amount'])
+        elif self.value == '01':  # batch transfer
+            transfers = payload.get('transfers')
+            ownership_types = {t.value for t in AssetOwnershipType}
+            return isinstance(transfers, list) and 0 < len(transfers) <= MAX_BATCH_TRANSFERS and all(
+                isinstance(transfer, list) and len(transfer) == 4
+                and isinstance(transfer[0], str) and isinstance(transfer[1], str)
+                and transfer[2] in ownership_types
+                and type(transfer[3]) is int and transfer[3] > 0
+                for transfer in transfers
+            )
         else:
             raise NotImplementedError
 
@@ -63,14 +78,18 @@ class Transaction(object):
 
     @staticmethod
     def json_parser_hook(dump: dict):
+        if 'tx_type' not in dump:
+            # nested objects of payload are parsed before transaction itself
+            return dump
+
         assert all(k in dump for k in ('hash', 'tx_type', 'sender', 'receiver',
                                        'payload', 'signature', 'pub_key', 'nonce'))
 
         tx = Transaction(
-            TransactionType(int(dump['tx_type'], 16)),
+            TransactionType(dump['tx_type']),
             dump['sender'],
-            dump['reciever'],
-            json.loads(dump['payload']),
+            dump['receiver'],
+            dump['payload'],
             dump['signature'],
             dump['pub_key'],
             dump['nonce']
@@ -104,6 +123,8 @@ class Transaction(object):
     def atomize(self) -> tuple[tuple[WorldStateModificationType, dict[str, Union[str, int]]], ...]:
         """Split transaction into sequence of world state modification types, and key-value dict to execute em'.
 
+        Batch transfer is split into one debit of sender per asset and ownership type (of the total amount) followed
+        by credit of every recipient, so sender balance is checked once for the whole batch.
 
         # TODO: switch to Structural Pattern Matching as soon as python3.10 released
 
@@ -132,5 +153,36 @@ class Transaction(object):
                     }
                 )
             )
+        elif self.tx_type.name == TransactionType.batch_transfer.name:
+            assert all(k in ('transfers',) for k in self.payload)
+            totals = {}
+            for _, asset, ownership_type, amount in self.payload['transfers']:
+                totals[(asset, ownership_type)] = totals.get((asset, ownership_type), 0) + amount
+
+            debits = tuple(
+                (
+                    WorldStateModificationType.sub_asset_from_account,
+                    {
+                        'account': self.sender,
+                        'asset': asset,
+                        'ownership_type': AssetOwnershipType(ownership_type),
+                        'amount': total
+                    }
+                )
+                for (asset, ownership_type), total in totals.items()
+            )
+            credits = tuple(
+                (
+                    WorldStateModificationType.add_asset_to_account,
+                    {
+                        'account': recipient,
+                        'asset': asset,
+                        'ownership_type': AssetOwnershipType(ownership_type),
+                        'amount': amount
+                    }
+                )
+                for recipient, asset, ownership_type, amount in self.payload['transfers']
+            )
+            return debits + credits
         else:
             raise NotImplementedError
@@ -0,0 +1,85 @@
+from typing import Iterator, Optional
+
+from mpt.node import Node
+
+HASH_SIZE = 32
+
+
+def _child_refs(node) -> list[bytes]:
+    if isinstance(node, Node.Branch):
+        return [ref for ref in node.branches if ref]
+    if isinstance(node, Node.Extension):
+        return [node.next_ref]
+    return []
+
+
+def _nibbles_to_bytes(nibbles: tuple[int, ...]) -> bytes:
+    assert len(nibbles) % 2 == 0
+    return bytes(nibbles[i] * 16 + nibbles[i + 1] for i in range(0, len(nibbles), 2))
+
+
+def trie_nodes(storage, root: Optional[bytes], seen: set[bytes]) -> Iterator[tuple[bytes, bytes]]:
+    """Yields stored (key, encoded node) pairs reachable from root, skipping keys in seen and adding yielded ones.
+
+    :param storage: storage of Merkle Patricia trie
+    :param root: root node reference of trie, lookup MerklePatriciaTrie.root(...)
+    :type root: Optional[bytes]
+    :param seen: keys of nodes which are not yielded
+    :type seen: set[bytes]
+    :return: iterator over stored nodes
+    :rtype: Iterator[tuple[bytes, bytes]]
+    :raises KeyError: if some node is missing in storage
+    """
+    stack = [root] if root else []
+    while stack:
+        ref = stack.pop()
+        if len(ref) == HASH_SIZE:
+            if ref in seen:
+                continue
+            seen.add(ref)
+            raw = storage[ref]
+            yield ref, raw
+        else:
+            raw = ref
+        stack.extend(_child_refs(Node.decode(raw)))
+
+
+def trie_items(storage, root: Optional[bytes]) -> Iterator[tuple[bytes, bytes]]:
+    """Yields (key, value) pairs of trie leaves.
+
+    :param storage: storage of Merkle Patricia trie
+    :param root: root node reference of trie, lookup MerklePatriciaTrie.root(...)
+    :type root: Optional[bytes]
+    :return: iterator over trie items
+    :rtype: Iterator[tuple[bytes, bytes]]
+    :raises KeyError: if some node is missing in storage
+    """
+    stack = [(root, ())] if root else []
+    while stack:
+        ref, prefix = stack.pop()
+        node = Node.decode(storage[ref] if len(ref) == HASH_SIZE else ref)
+
+        if isinstance(node, Node.Branch):
+            if node.data:
+                yield _nibbles_to_bytes(prefix), node.data
+            stack.extend((branch, prefix + (i,)) for i, branch in enumerate(node.branches) if branch)
+        else:
+            path = prefix + tuple(node.path.at(i) for i in range(len(node.path)))
+            if isinstance(node, Node.Leaf):
+                yield _nibbles_to_bytes(path), node.data
+            else:
+                stack.append((node.next_ref, path))
+
+
+def root_ref(root_hash: bytes) -> Optional[bytes]:
+    """Returns root node reference of trie by its root hash, as stored for account tries in accounts trie.
+
+    Root nodes of account tries always have hashed references, so hash is the reference unless trie is empty.
+
+    :param root_hash: root hash of trie
+    :type root_hash: bytes
+    :return: root node reference, None for empty trie
+    :rtype: Optional[bytes]
+    """
+    assert len(root_hash) == HASH_SIZE
+    return None if root_hash == Node.EMPTY_HASH else root_hash
@@ -1,53 +1,481 @@
 from __future__ import annotations
 
-import copy
-from typing import Union
+import heapq
+from typing import Optional, Union
 
 from crypto.hashing import dsha256, keccak_hash
 from mpt import MerklePatriciaTrie
+from primitives.account_cache import AccountCache, AccountsView
 from primitives.accounts import Account
-from primitives.assets import Asset, AssetOwnershipType, CREATE_ASSET, CURRENCY_ASSET, AssetStatus, UPDATE_ASSET
+from primitives.assets import Asset, AssetOwnershipType, AssetStatus, AssetType, CREATE_ASSET, CURRENCY_ASSET, \
+    UPDATE_ASSET
+from primitives.overlay import OverlayDict
 from primitives.transactions import Transaction
 from primitives.world_state_modifications import WorldStateModificationType
 
 
 class WorldState(object):
+    """Represents world state: accounts with their assets and assets themselves.
+
+    Public attributes:
+        state_roots_hash — hash of accounts and assets tries roots
+    Public methods:
+        fork(...) — returns copy-on-write copy of state in O(1)
+        apply_tx(...) — atomically executes transaction on self
+        execute_tx(...) — executes transaction on a fork and returns it
+        dump_indexes(...) — returns tries roots and indexes for checkpoint
+        from_indexes(...) — restores state from tries storages and dumped indexes
+        get_amount(...) — returns amount of asset on account from holders index
+        check_consistency(...) — verifies flat balances against tries
+        holders(...) — returns page of asset holders with balances, ordered by account name
+        top_holders(...) — returns holders with the largest balances
+        rebuild_holders(...) — rebuilds holders index from accounts tries
+        commit(...) — writes changed accounts and assets to tries
+    Private attributes:
+        _accounts_trie, _assets_trie — Merkle Patricia tries of state
+        _accounts_storage, _assets_storage — content-addressed storages of tries nodes, shared between forks
+        _accounts, _assets — materialized objects, layered between forks
+        _holders — (asset name, ownership type) -> account name -> balance, both levels layered between forks
+        _account_cache — LRU of accounts materialized from accounts trie, shared between forks
+        _dirty_accounts, _dirty_assets — names of objects changed since last commit, layered between forks
+        _roots_hash — cached state roots hash, None if state was changed since it was computed
+
+    Forked state shares everything with its parent until modified, account is copied on its first modification in
+    the fork. State SHOULD NOT be modified while there are forks on top of it.
+    Holders index mirrors balances in accounts tries and is updated by every asset modification of account, so it
+    is also flat (account, asset, ownership type) -> amount layer for balance reads. Tries stay authoritative for
+    root hashes, lookup check_consistency(...)
+    Accounts are not loaded up front: the lowest layer of _accounts is a view of accounts trie, which materializes
+    account from its trie root on first access through _account_cache. When layers get too deep, the ones beneath
+    are written back into the cache and replaced by view at current accounts trie root, lookup fork(...)
+    Holders index is not bounded that way: it is kept whole in memory, one entry per non-zero balance, so memory of
+    state with holders index still grows with the number of balances. It is dumped whole into every checkpoint and
+    rebuilt by walking every account when checkpoint has none. Read-only states restored without it (reader
+    processes) are bounded by _account_cache only, lookup from_indexes(...)
+    Tries are written lazily: modifications change materialized objects only (balances — flat layers of accounts),
+    so every check sees effect of previous modifications, and changed objects are remembered as dirty. Net result is
+    written on commit(...), which state_roots_hash does: one trie write per changed balance, one accounts trie
+    update per changed account and one assets trie update per changed asset, however many transactions touched
+    them. Roots hash is cached until the next modification. Forks inherit dirty objects of their parent.
+    """
     _accounts_trie: MerklePatriciaTrie = None
-    _accounts_storage: dict[bytes, bytes] = {}
-    _accounts: dict[bytes, Account] = {}
+    _accounts_storage: dict[bytes, bytes] = None
+    _accounts: OverlayDict = None
     _assets_trie: MerklePatriciaTrie = None
-    _assets_storage: dict[bytes, bytes] = {}
-    _assets: dict[bytes, Asset] = {}
+    _assets_storage: dict[bytes, bytes] = None
+    _assets: OverlayDict = None
+    _holders: OverlayDict = None
+    _account_cache: AccountCache = None
+    _dirty_accounts: OverlayDict = None
+    _dirty_assets: OverlayDict = None
+    _roots_hash: Optional[str] = None
 
     @property
-    def state_roots_hash(self):
-        return dsha256(self._accounts_trie.root_hash().hex() + self._assets_trie.root_hash().hex())
+    def state_roots_hash(self) -> str:
+        if self._roots_hash is None:
+            self.commit()
+            self._roots_hash = dsha256(self._accounts_trie.root_hash().hex() + self._assets_trie.root_hash().hex())
 
-    def __init__(self, storages: tuple[dict, dict] = None) -> None:
+        return self._roots_hash
+
+    def __init__(self, storages: tuple[dict, dict] = None, account_cache: AccountCache = None) -> None:
         if storages:
             self._accounts_storage = storages[0]
             self._assets_storage = storages[1]
+        else:
+            self._accounts_storage = {}
+            self._assets_storage = {}
 
         self._accounts_trie = MerklePatriciaTrie(self._accounts_storage)
         self._assets_trie = MerklePatriciaTrie(self._assets_storage)
+        self._account_cache = account_cache if account_cache is not None else AccountCache()
+        self._accounts = OverlayDict(AccountsView(self._accounts_storage, None, self._account_cache))
+        self._assets = OverlayDict()
+        self._holders = OverlayDict()
+        self._dirty_accounts = OverlayDict()
+        self._dirty_assets = OverlayDict()
+
+    def dump_indexes(self, holders: bool = True) -> dict:
+        """Returns JSON-serializable tries roots and indexes of assets and holders.
+
+        Together with tries storages it is enough to restore the state, lookup from_indexes(...) Accounts are not
+        dumped — they are materialized from accounts trie on demand.
+
+        :param holders: dump holders index, it is dumped whole and its size is proportional to the number of
+            non-zero balances
+        :type holders: bool
+        :return: tries roots, asset name -> (type, status), holders index (if dumped)
+        :rtype: dict
+        """
+        def ref(root: bytes):
+            return root.hex() if root else None
+
+        self.commit()
+
+        indexes = {
+            'accounts_root': ref(self._accounts_trie.root()),
+            'assets_root': ref(self._assets_trie.root()),
+            'assets': {name.decode('utf-8'): (asset.type.value, asset.status.value)
+                       for name, asset in self._assets.items()},
+        }
+        if holders:
+            indexes['holders'] = [(asset_name, ownership_type, dict(holders))
+                                  for (asset_name, ownership_type), holders in self._holders.items()]
+
+        return indexes
+
+    @classmethod
+    def from_indexes(cls, indexes: dict, storages: tuple[dict, dict], account_cache: AccountCache = None,
+                     holders: bool = True) -> WorldState:
+        """Restores state from tries storages and indexes returned by dump_indexes(...)
+
+        Tries are not replayed — only roots are set, so storages must contain every node of the state.
+        Accounts are materialized from accounts trie on first access. Holders index is rebuilt from accounts tries
+        if indexes do not have it, unless holders is False: then state is read-only view, amounts are read from
+        accounts tries and holders(...) and top_holders(...) are not available.
+
+        :param indexes: dumped indexes
+        :type indexes: dict
+        :param storages: accounts and assets tries storages
+        :type storages: tuple[dict, dict]
+        :param account_cache: cache of materialized accounts (optional, new one by default)
+        :type account_cache: AccountCache
+        :param holders: load or rebuild holders index
+        :type holders: bool
+        :return: world state
+        :rtype: WorldState
+        """
+        def ref(root: str):
+            return bytes.fromhex(root) if root else None
+
+        state = cls(storages, account_cache)
+        state._accounts_trie = MerklePatriciaTrie(state._accounts_storage, root=ref(indexes['accounts_root']))
+        state._assets_trie = MerklePatriciaTrie(state._assets_storage, root=ref(indexes['assets_root']))
+        state._accounts = OverlayDict(AccountsView(state._accounts_storage, state._accounts_trie.root(),
+                                                   state._account_cache))
+        for name, (_type, status) in indexes['assets'].items():
+            state._assets[name.encode('utf-8')] = Asset(name, AssetType(_type), AssetStatus(status))
+
+        if not holders:
+            state._holders = None
+        elif 'holders' in indexes:
+            for asset_name, ownership_type, asset_holders in indexes['holders']:
+                state._holders[(asset_name, ownership_type)] = OverlayDict(asset_holders)
+        else:
+            state.rebuild_holders()
+
+        return state
+
+    def rebuild_holders(self) -> None:
+        """Rebuilds holders index from accounts tries.
+
+        Costs one trie lookup per account, asset and ownership type, and walks every account: rebuilt index is held
+        whole in memory.
+
+        :return: None
+        """
+        self._holders = OverlayDict()
+        for account_name, account in self._accounts.items():
+            for asset in self._assets.values():
+                for ownership_type in AssetOwnershipType:
+                    amount = account.get_amount(asset, ownership_type)
+                    if amount:
+                        self._update_holders(account_name, asset.name, ownership_type, amount)
+
+    def get_amount(self, account_name: Union[str, bytes], asset_name: str,
+                   ownership_type: AssetOwnershipType = AssetOwnershipType.owner) -> int:
+        """Returns amount of asset on account from holders index, without touching tries (unless state was restored
+        without holders index, lookup from_indexes(...)).
+
+        :param account_name: name of account
+        :type account_name: Union[str, bytes]
+        :param asset_name: name of asset
+        :type asset_name: str
+        :param ownership_type: ownership type of holding
+        :type ownership_type: AssetOwnershipType
+        :return: amount, 0 if account has no such asset
+        :rtype: int
+        """
+        if self._holders is None:
+            name = account_name if isinstance(account_name, bytes) else account_name.encode('utf-8')
+            asset = self._assets.get(asset_name.encode('utf-8'))
+            if asset is None or name not in self._accounts:
+                return 0
+            return self._accounts[name].get_amount(asset, ownership_type)
+
+        if isinstance(account_name, bytes):
+            account_name = account_name.decode('utf-8')
+
+        return self._holders.get((asset_name, ownership_type.value), {}).get(account_name, 0)
+
+    def check_consistency(self) -> list[tuple[str, str, str, int, int, int]]:
+        """Verifies flat balances (flat layers of accounts and holders index) against accounts tries.
+
+        Every account is checked for every asset and ownership type, so it costs one trie lookup per each.
+
+        :return: mismatches (account, asset, ownership type, flat layer amount, holders index amount, trie amount)
+        :rtype: list[tuple[str, str, str, int, int, int]]
+        """
+        self.commit()
+
+        mismatches = []
+        for account_name, account in self._accounts.items():
+            for asset in self._assets.values():
+                for ownership_type in AssetOwnershipType:
+                    trie_amount = account._trie_amount(asset, ownership_type)
+                    flat_amount = account.get_amount(asset, ownership_type)
+                    index_amount = self.get_amount(account_name, asset.name, ownership_type)
+                    if not trie_amount == flat_amount == index_amount:
+                        mismatches.append((account.name, asset.name, ownership_type.value, flat_amount,
+                                           index_amount, trie_amount))
+
+        for (asset_name, ownership_type), holders in self._holders.items():
+            for name, amount in holders.items():
+                if name.encode('utf-8') not in self._accounts:
+                    mismatches.append((name, asset_name, ownership_type, 0, amount, 0))
+
+        return mismatches
+
+    def holders(self, asset_name: str, ownership_type: AssetOwnershipType = AssetOwnershipType.owner,
+                limit: int = 100, after: str = None) -> list[tuple[str, int]]:
+        """Returns page of accounts holding asset with their balances, ordered by account name.
+
+        :param asset_name: name of asset
+        :type asset_name: str
+        :param ownership_type: ownership type of holding
+        :type ownership_type: AssetOwnershipType
+        :param limit: maximum number of holders
+        :type limit: int
+        :param after: account name to continue after — last holder of previous page (optional)
+        :type after: str
+        :return: (account name, balance) pairs
+        :rtype: list[tuple[str, int]]
+        """
+        assert self._holders is not None, 'holders index is not loaded'
+
+        holders = self._holders.get((asset_name, ownership_type.value), {})
+        names = sorted(name for name in holders if after is None or name > after)[:limit]
+
+        return [(name, holders[name]) for name in names]
+
+    def top_holders(self, asset_name: str, ownership_type: AssetOwnershipType = AssetOwnershipType.owner,
+                    n: int = 10) -> list[tuple[str, int]]:
+        """Returns accounts with the largest balances of asset.
+
+        :param asset_name: name of asset
+        :type asset_name: str
+        :param ownership_type: ownership type of holding
+        :type ownership_type: AssetOwnershipType
+        :param n: number of holders
+        :type n: int
+        :return: (account name, balance) pairs, the largest balance first
+        :rtype: list[tuple[str, int]]
+        """
+        assert self._holders is not None, 'holders index is not loaded'
+
+        holders = self._holders.get((asset_name, ownership_type.value), {})
+
+        return heapq.nlargest(n, holders.items(), key=lambda item: (item[1], item[0]))
+
+    def _update_holders(self, account_name: bytes, asset_name: str, ownership_type: AssetOwnershipType,
+                        delta: int) -> None:
+        """Changes balance of account in holders index, holders of asset are forked on first change in this state.
+
+        :param account_name: name of account
+        :type account_name: bytes
+        :param asset_name: name of asset
+        :type asset_name: str
+        :param ownership_type: ownership type of holding
+        :type ownership_type: AssetOwnershipType
+        :param delta: change of balance
+        :type delta: int
+        :return: None
+        """
+        key = (asset_name, ownership_type.value)
+        holders: Optional[OverlayDict] = self._holders.get(key)
+        if holders is None:
+            holders = self._holders[key] = OverlayDict()
+        elif not self._holders.is_local(key):
+            holders = self._holders[key] = holders.fork()
+
+        name = account_name.decode('utf-8')
+        amount = holders.get(name, 0) + delta
+        if amount:
+            holders[name] = amount
+        else:
+            del holders[name]
+
+    def commit(self) -> None:
+        """Writes objects changed since last commit to tries.
+
+        Does not change contents of state, so it is safe for forks on top of it.
+
+        :return: None
+        """
+        if self._dirty_accounts:
+            for key in self._dirty_accounts:
+                # root hash flushes changed balances of account to its trie
+                self._accounts_trie.update(key, self._accounts[key].root_hash)
+            self._dirty_accounts = OverlayDict()
+
+        if self._dirty_assets:
+            for key in self._dirty_assets:
+                self._assets_trie.update(key, self._assets[key].state_hash)
+            self._dirty_assets = OverlayDict()
+
+    def fork(self) -> WorldState:
+        """Returns copy-on-write copy of state.
+
+        Tries storages are shared, tries roots are copied, materialized objects are layered — O(1) regardless of
+        state size. When accounts layers beneath are too deep, their accounts are written back into account cache
+        and the layers are replaced by view of accounts trie at current root, so lookups stay bounded and
+        compaction costs only changes of those layers, not whole state.
+
+        :return: forked world state
+        :rtype: WorldState
+        """
+        if self._accounts._depth >= OverlayDict.MAX_DEPTH:
+            self._write_back_accounts()
+
+        forked = WorldState((self._accounts_storage, self._assets_storage), self._account_cache)
+        forked._accounts_trie = MerklePatriciaTrie(self._accounts_storage, root=self._accounts_trie.root())
+        forked._assets_trie = MerklePatriciaTrie(self._assets_storage, root=self._assets_trie.root())
+        forked._accounts = self._accounts.fork()
+        forked._assets = self._assets.fork()
+        forked._holders = self._holders.fork()
+        forked._dirty_accounts = self._dirty_accounts.fork()
+        forked._dirty_assets = self._dirty_assets.fork()
+        forked._roots_hash = self._roots_hash
+
+        return forked
+
+    def _write_back_accounts(self) -> None:
+        """Puts accounts of layers beneath into account cache and replaces the layers by accounts trie view.
+
+        Every account is in accounts trie after commit, so view at current root holds the same accounts as layers do.
+        Copies are cached, as states owning the layers may modify their accounts once forks are discarded.
+
+        :return: None
+        """
+        self.commit()
+
+        layer = self._accounts._parent
+        written = set()
+        while isinstance(layer, OverlayDict):
+            for name, account in layer.local_items().items():
+                if name not in written and not self._accounts.is_local(name):
+                    self._account_cache.put((name, account.root_hash), account.copy())
+                    written.add(name)
+            layer = layer._parent
+
+        self._accounts.rebase(AccountsView(self._accounts_storage, self._accounts_trie.root(), self._account_cache))
+
+    def _merge(self, forked: WorldState) -> None:
+        """Adopts modifications of state forked from self.
+
+        Cost is proportional to number of objects modified in fork.
+
+        :param forked: state forked from self
+        :type forked: WorldState
+        :return: None
+        """
+        self._accounts_trie = MerklePatriciaTrie(self._accounts_storage, root=forked._accounts_trie.root())
+        self._assets_trie = MerklePatriciaTrie(self._assets_storage, root=forked._assets_trie.root())
+        self._accounts.apply(forked._accounts)
+        self._assets.apply(forked._assets)
+        self._dirty_accounts.apply(forked._dirty_accounts)
+        self._dirty_assets.apply(forked._dirty_assets)
+        self._roots_hash = forked._roots_hash
+
+        for key, holders in forked._holders.local_items().items():
+            own = self._holders.get(key) if self._holders.is_local(key) else None
+            if own is not None and holders._parent is own:
+                # holders forked from ones owned by self, changes are copied to keep layers shallow
+                own.apply(holders)
+            else:
+                self._holders[key] = holders
+
+    def _account_for_update(self, account_name: bytes, create: bool = False) -> Account:
+        """Returns account owned by this state, copying it from parent state if needed.
+
+        :param account_name: name of account
+        :type account_name: bytes
+        :param create: create new account if it does not exist
+        :type create: bool
+        :return: account which may be modified
+        :rtype: Account
+        :raises KeyError: if account does not exist and create is False
+        """
+        if self._accounts.is_local(account_name):
+            account = self._accounts[account_name]
+        else:
+            try:
+                account = self._accounts[account_name].copy()
+            except KeyError:
+                if not create:
+                    raise
+                account = Account(account_name, self._accounts_storage)
+
+            self._accounts[account_name] = account
+
+        account.defer_writes()
+
+        return account
 
     def _register_account_modification(self, account: Account) -> None:
         assert isinstance(account, Account)
 
         key = account.name.encode('utf-8')
 
-        self._accounts_trie.update(key, account.root_hash)
         self._accounts[key] = account
+        self._dirty_accounts[key] = None
+        self._roots_hash = None
+
+    def import_accounts(self, source: WorldState, account_names: set[bytes]) -> None:
+        """Copies accounts from another state into self.
+
+        Used to carry accounts, which are known to be unaffected by difference between states, without replaying
+        transactions. Both states must share tries storages and have the same assets. Balances of accounts in
+        holders index are carried too.
+
+        :param source: state to copy accounts from
+        :type source: WorldState
+        :param account_names: names of accounts to be copied
+        :type account_names: set[bytes]
+        :return: None
+        """
+        assert source._accounts_storage is self._accounts_storage
+
+        for account_name in account_names:
+            self._register_account_modification(source._accounts[account_name].copy())
+
+        for key in set(source._holders) | set(self._holders):
+            source_holders = source._holders.get(key, {})
+            holders = self._holders.get(key, {})
+            for account_name in account_names:
+                name = account_name.decode('utf-8')
+                delta = source_holders.get(name, 0) - holders.get(name, 0)
+                if delta:
+                    self._update_holders(account_name, key[0], AssetOwnershipType(key[1]), delta)
+                    holders = self._holders[key]
 
     def _register_asset_modification(self, asset: Asset) -> None:
         assert isinstance(asset, Asset)
 
         key = asset.name.encode('utf-8')
 
-        self._assets_trie.update(key, asset.state_hash)
         self._assets[key] = asset
+        self._dirty_assets[key] = None
+        self._roots_hash = None
 
     def account_exists(self, account_name: Union[str, bytes]) -> bool:
+        """Checks if account exists: in materialized layers or, falling through them, in accounts trie.
+
+        :param account_name: name of account
+        :type account_name: Union[str, bytes]
+        :return: True if account exists
+        :rtype: bool
+        """
         if isinstance(account_name, str):
             account_name = account_name.encode('utf-8')
         return account_name in self._accounts
@@ -55,26 +483,43 @@ class WorldState(object):
     def execute_tx(self, tx: Transaction) -> WorldState:
         """Executes tx against current state and returns modified copy.
 
-        Deepcopies current state,
-        atomizes tx in sequence of WorldStateModification and payload keywords,
-        tries to execute them.
+        Forks current state and applies tx on the fork, lookup apply_tx(...)
 
         :param tx: transaction to be executed
         :type tx: Transaction
         :return: world state
         :rtype: WorldState
         """
-        _new_world_state = copy.deepcopy(self)  # FIXME: may eat the fuck up RAM eventualy
+        _new_world_state = self.fork()
+
+        try:
+            _new_world_state.apply_tx(tx)
+        except Exception:
+            raise
+
+        return _new_world_state
+
+    def apply_tx(self, tx: Transaction) -> None:
+        """Executes tx against self atomically.
+
+        Atomizes tx in sequence of WorldStateModification and payload keywords and executes them on a fork,
+        which is merged back only if all of them succeeded, so failed tx leaves self untouched.
+
+        :param tx: transaction to be executed
+        :type tx: Transaction
+        :return: None
+        """
+        _tx_state = self.fork()
 
         instructions = tx.atomize()
 
         for instruction in instructions:
             try:
-                _new_world_state._execute_state_modification(instruction[0], **instruction[1])
+                _tx_state._execute_state_modification(instruction[0], **instruction[1])
             except Exception:
                 raise
 
-        return _new_world_state
+        self._merge(_tx_state)
 
     def _execute_state_modification(self, modification: WorldStateModificationType, **kwargs) -> None:
         """Executes arbitrary state modification instruction on self state.
@@ -103,10 +548,7 @@ class WorldState(object):
             amount = kwargs['amount']
             assert isinstance(amount, int)
 
-            try:
-                account = self._accounts[account_name]
-            except KeyError:
-                account = Account(account_name)
+            account = self._account_for_update(account_name, create=True)
 
             try:
                 asset = self._assets[asset_name]
@@ -121,6 +563,7 @@ class WorldState(object):
                 raise
 
             self._register_account_modification(account)
+            self._update_holders(account_name, asset.name, ownership_type, amount)
 
         elif modification == WorldStateModificationType.sub_asset_from_account:
 
@@ -141,7 +584,7 @@ class WorldState(object):
             assert isinstance(amount, int)
 
             try:
-                account = self._accounts[account_name]
+                account = self._account_for_update(account_name)
             except KeyError:
                 raise
 
@@ -158,6 +601,7 @@ class WorldState(object):
                 raise
 
             self._register_account_modification(account)
+            self._update_holders(account_name, asset.name, ownership_type, -amount)
 
         elif modification == WorldStateModificationType.create_asset:
             # assert all(k in ('name', 'type', 'status') for k in kwargs)
@@ -187,12 +631,9 @@ class WorldState(object):
     def execute_reward_modification(self, beneficiary: Union[str, bytes], amount: int) -> None:
         assert isinstance(beneficiary, (str, bytes))
         if isinstance(beneficiary, str):
-            beneficiary.encode('utf-8')
+            beneficiary = beneficiary.encode('utf-8')
 
-        try:
-            account = self._accounts[beneficiary]
-        except KeyError:
-            account = Account(beneficiary)
+        account = self._account_for_update(beneficiary, create=True)
 
         asset = CURRENCY_ASSET
 
@@ -202,6 +643,7 @@ class WorldState(object):
             raise
 
         self._register_account_modification(account)
+        self._update_holders(beneficiary, asset.name, AssetOwnershipType.owner, amount)
 
     def prepare_for_genesis(self, me: str) -> None:
 
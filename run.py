@@ -1,4 +1,96 @@
-from neuroAPI.application import server
+import os
+import signal
+import threading
+
+from node import server
+from node.gossip import Gossip
+from node.writer import WriterServer
+from primitives import BlockChain
+from primitives.parallel_execution import ParallelExecutor
+from storage import BlockStore, CheckpointManager, TxIndex
+from utils import config, logger
+
+DATA_DIR = config.get('storage', 'path', fallback='data')
+WRITER_SOCKET = config.get('deployment', 'writer_socket', fallback=os.path.join(DATA_DIR, 'writer.sock'))
+GOSSIP_LISTEN = config.get('gossip', 'listen', fallback='')
+GOSSIP_PEERS = [peer.strip() for peer in config.get('gossip', 'peers', fallback='').split(',') if peer.strip()]
+EXECUTION_WORKERS = config.getint('execution', 'workers', fallback=0)
+
+
+def open_blockchain(data_dir: str = DATA_DIR) -> tuple[BlockChain, CheckpointManager]:
+    """Restores blockchain persisted in data directory or creates new one there.
+
+    :param data_dir: data directory
+    :type data_dir: str
+    :return: blockchain and its checkpoint manager
+    :rtype: tuple[BlockChain, CheckpointManager]
+    """
+    checkpoints = CheckpointManager(os.path.join(data_dir, 'state'))
+    blockchain = checkpoints.restore(BlockStore(os.path.join(data_dir, 'blocks')))
+    blockchain.attach_tx_index(TxIndex(os.path.join(data_dir, 'tx_index.sqlite')))
+    if EXECUTION_WORKERS:
+        blockchain.executor = ParallelExecutor(EXECUTION_WORKERS)
+
+    return blockchain, checkpoints
+
+
+def start_gossip(node, listen: str = GOSSIP_LISTEN, peers: list[str] = None) -> Gossip:
+    """Starts gossip of started node with other nodes, lookup node.gossip.Gossip
+
+    :param node: node
+    :type node: Node
+    :param listen: "host:port" or Unix socket path peers connect to (optional, inbound peers are not accepted)
+    :type listen: str
+    :param peers: addresses of peers to connect to (optional, configured ones by default)
+    :type peers: list[str]
+    :return: gossip
+    :rtype: Gossip
+    """
+    node.gossip = Gossip(node)
+    if listen:
+        node.gossip.listen(listen)
+    for peer in GOSSIP_PEERS if peers is None else peers:
+        try:
+            node.gossip.connect(peer)
+        except OSError as e:
+            logger.warning(f'gossip peer {peer} is unreachable: {e}')
+    node.gossip.start()
+
+    return node.gossip
+
+
+def run_writer(data_dir: str = DATA_DIR, socket_path: str = WRITER_SOCKET) -> None:
+    """Runs writer process of multi-process deployment: node produces blocks and owns state, RPC worker processes
+    read persisted chain and forward writes over Unix socket, lookup gunicorn.conf.py and node.reader.serve_reads(...)
+
+    Serves until SIGTERM.
+
+    :param data_dir: data directory
+    :type data_dir: str
+    :param socket_path: Unix socket path writes are served on
+    :type socket_path: str
+    :return: None
+    """
+    server.attach_blockchain(*open_blockchain(data_dir))
+    server.start()
+    if GOSSIP_LISTEN or GOSSIP_PEERS:
+        start_gossip(server)
+
+    writer = WriterServer(server, socket_path)
+    # shutdown(...) waits for serve_forever(...), so it can not be called from the main thread handling the signal
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=writer.shutdown).start())
+    try:
+        writer.serve_forever()
+    finally:
+        writer.server_close()
+        if server.gossip is not None:
+            server.gossip.stop()
+        server.stop(timeout=5)
+
 
 if __name__ == '__main__':
-    server.run(debug=False)
+    server.attach_blockchain(*open_blockchain())
+    server.start()
+    if GOSSIP_LISTEN or GOSSIP_PEERS:
+        start_gossip(server)
+    server.run(debug=False, threaded=True)
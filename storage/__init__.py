@@ -0,0 +1,5 @@
+from storage.block_store import BlockStore
+from storage.checkpoints import CheckpointManager
+from storage.node_store import NodeStore
+from storage.snapshots import StateSnapshot
+from storage.tx_index import TxIndex
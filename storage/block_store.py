@@ -0,0 +1,423 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional, Union
+
+from primitives.blocks import Block, BlockHeader
+from primitives.transactions import Transaction
+
+
+class BlockStore(object):
+    """Represents append-only on-disk storage of blocks.
+
+    Public attributes:
+        path — directory of the store
+        height — number of stored blocks
+        last — last stored block
+        readonly — store is opened for reading only
+    Public methods:
+        append(...) — appends block to the store
+        truncate(...) — drops blocks above height (on reorg)
+        refresh(...) — picks up blocks appended or dropped by writer process (read-only store)
+        header(...) — returns header by height without reading body
+        headers(...) — iterates over headers without reading bodies
+        height_of(...) — returns height of block by hash
+        get_by_hash(...) — returns block by hash
+        close(...) — closes files
+    Private attributes:
+        _index — height -> (header segment, offset, length, body segment, offset, length)
+        _heights — block hash -> height
+        _cache — recently materialized blocks
+
+    Headers and bodies are appended to separate segment files (headers-NNNNN.seg, bodies-NNNNN.seg), so header-only
+    scans never touch bodies. Fixed-size records of index.dat map height to segment offsets, hashes.dat holds raw
+    block hashes by height and is loaded into hash -> height dict on open. Segments are read through mmap,
+    Block objects are materialized only on __getitem__ and kept in small LRU cache.
+
+    Store behaves like list of blocks (len, [], iteration, append), so it can be used as BlockChain.chain.
+    Writes SHOULD be done from one thread, reads are safe from any thread. Other processes may open the store
+    read-only and follow the writer with refresh(...).
+    """
+    INDEX_RECORD = struct.Struct('<IQIIQI')
+    HASH_SIZE = 32
+
+    path: str = ''
+    _index: list[tuple[int, int, int, int, int, int]] = None
+    _heights: dict[str, int] = None
+    _cache: OrderedDict = None
+    _last: Optional[Block] = None
+    readonly: bool = False
+
+    @property
+    def height(self) -> int:
+        """Returns number of stored blocks.
+
+        :return: number of stored blocks
+        :rtype: int
+        """
+        return len(self._index)
+
+    @property
+    def last(self) -> Optional[Block]:
+        """Returns last stored block.
+
+        :return: last block or None if store is empty
+        :rtype: Optional[Block]
+        """
+        if self._last is None and self._index:
+            self._last = self[len(self._index) - 1]
+        return self._last
+
+    def __init__(self, path: str, segment_size: int = 256 * 2 ** 20, cache_size: int = 256,
+                 fsync: bool = False, readonly: bool = False) -> None:
+        """Initialization of store, opens existing one or creates new.
+
+        :param path: directory of the store
+        :type path: str
+        :param segment_size: segment is rotated when it exceeds this size, bytes
+        :type segment_size: int
+        :param cache_size: number of materialized blocks to be cached
+        :type cache_size: int
+        :param fsync: fsync files after every append
+        :type fsync: bool
+        :param readonly: open existing store for reading only, files are never modified
+        :type readonly: bool
+        """
+        self.path = path
+        self.readonly = readonly
+        self._segment_size = segment_size
+        self._cache_size = cache_size
+        self._fsync = fsync
+        self._cache = OrderedDict()
+        self._maps: dict[tuple[str, int], mmap.mmap] = {}
+        self._writers: dict[str, tuple[int, object]] = {}
+        self._lock = threading.RLock()
+
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self._load_indexes()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __bool__(self) -> bool:
+        return bool(self._index)
+
+    def __iter__(self) -> Iterator[Block]:
+        for height in range(len(self._index)):
+            yield self[height]
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path}, {self.height} blocks)'
+
+    def __getitem__(self, height: int) -> Block:
+        """Returns block by height, materializing it from segments if needed.
+
+        :param height: block height, negative values count from the end
+        :type height: int
+        :return: block
+        :rtype: Block
+        """
+        assert isinstance(height, int)
+        if height < 0:
+            height += len(self._index)
+        if not 0 <= height < len(self._index):
+            raise IndexError(height)
+
+        with self._lock:
+            try:
+                self._cache.move_to_end(height)
+                return self._cache[height]
+            except KeyError:
+                pass
+
+        header_segment, header_offset, header_length, body_segment, body_offset, body_length = self._index[height]
+        header = self._parse_header(self._read('headers', header_segment, header_offset, header_length))
+        txs = [json.loads(tx, object_hook=Transaction.json_parser_hook)
+               for tx in json.loads(self._read('bodies', body_segment, body_offset, body_length))]
+        block = Block(header, txs)
+
+        with self._lock:
+            self._cache[height] = block
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return block
+
+    def header(self, height: int) -> BlockHeader:
+        """Returns block header by height without reading block body.
+
+        :param height: block height, negative values count from the end
+        :type height: int
+        :return: block header
+        :rtype: BlockHeader
+        """
+        if height < 0:
+            height += len(self._index)
+        if not 0 <= height < len(self._index):
+            raise IndexError(height)
+
+        cached = self._cache.get(height)
+        if cached is not None:
+            return cached.header
+
+        segment, offset, length = self._index[height][:3]
+        return self._parse_header(self._read('headers', segment, offset, length))
+
+    def headers(self, start: int = 0, stop: int = None) -> Iterator[BlockHeader]:
+        """Iterates over headers without reading bodies.
+
+        :param start: first height
+        :type start: int
+        :param stop: height to stop at (optional, end of chain by default)
+        :type stop: int
+        :return: iterator over headers
+        :rtype: Iterator[BlockHeader]
+        """
+        stop = len(self._index) if stop is None else min(stop, len(self._index))
+        for height in range(start, stop):
+            yield self.header(height)
+
+    def raw(self, height: int) -> tuple[bytes, bytes]:
+        """Returns raw header and body of block by height.
+
+        :param height: block height
+        :type height: int
+        :return: header JSON and body JSON
+        :rtype: tuple[bytes, bytes]
+        """
+        header_segment, header_offset, header_length, body_segment, body_offset, body_length = self._index[height]
+        return (self._read('headers', header_segment, header_offset, header_length),
+                self._read('bodies', body_segment, body_offset, body_length))
+
+    def height_of(self, block_hash: str) -> Optional[int]:
+        """Returns height of block by hash.
+
+        :param block_hash: block hash
+        :type block_hash: str
+        :return: height or None if block is not stored
+        :rtype: Optional[int]
+        """
+        return self._heights.get(block_hash)
+
+    def get_by_hash(self, block_hash: str) -> Optional[Block]:
+        """Returns block by hash.
+
+        :param block_hash: block hash
+        :type block_hash: str
+        :return: block or None if block is not stored
+        :rtype: Optional[Block]
+        """
+        height = self._heights.get(block_hash)
+        return self[height] if height is not None else None
+
+    def append(self, block: Block) -> None:
+        """Appends block to the store.
+
+        Body and header are written first, index records last, so block becomes visible only after all its data
+        has been written.
+
+        :param block: block to be stored
+        :type block: Block
+        :return: None
+        """
+        assert isinstance(block, Block)
+        assert not self.readonly, 'store is read-only'
+
+        block_hash = block.hash
+        body = json.dumps([tx.dump() for tx in block.transactions]).encode('utf-8')
+        header = block.header.dump().encode('utf-8')
+
+        with self._lock:
+            body_segment, body_offset = self._write('bodies', body)
+            header_segment, header_offset = self._write('headers', header)
+            record = (header_segment, header_offset, len(header), body_segment, body_offset, len(body))
+
+            self._append_file('index.dat', self.INDEX_RECORD.pack(*record))
+            self._append_file('hashes.dat', bytes.fromhex(block_hash))
+
+            self._index.append(record)
+            self._heights[block_hash] = len(self._index) - 1
+            self._last = block
+
+    def truncate(self, height: int) -> None:
+        """Drops blocks starting from height, so next appended block gets this height.
+
+        Only index records are dropped, segments data of dropped blocks stays in place and is never read again.
+
+        :param height: height of first dropped block
+        :type height: int
+        :return: None
+        """
+        assert 0 <= height <= len(self._index)
+        assert not self.readonly, 'store is read-only'
+
+        with self._lock:
+            for i in range(height, len(self._index)):
+                self._cache.pop(i, None)
+            hashes_path = os.path.join(self.path, 'hashes.dat')
+            with open(hashes_path, 'rb') as file:
+                file.seek(height * self.HASH_SIZE)
+                dropped = file.read()
+            for i in range(0, len(dropped), self.HASH_SIZE):
+                self._heights.pop(dropped[i:i + self.HASH_SIZE].hex(), None)
+            del self._index[height:]
+            self._last = None
+
+            os.truncate(os.path.join(self.path, 'index.dat'), height * self.INDEX_RECORD.size)
+            os.truncate(hashes_path, height * self.HASH_SIZE)
+
+    def refresh(self) -> None:
+        """Picks up blocks appended by writer process since store was opened or refreshed. If writer has dropped
+        blocks (reorg), indexes are reloaded. Read-only store only.
+
+        :return: None
+        """
+        assert self.readonly, 'only read-only store follows writer'
+
+        with self._lock:
+            count = len(self._index)
+            with open(os.path.join(self.path, 'hashes.dat'), 'rb') as file:
+                file.seek(max(count - 1, 0) * self.HASH_SIZE)
+                raw_hashes = file.read()
+            with open(os.path.join(self.path, 'index.dat'), 'rb') as file:
+                file.seek(count * self.INDEX_RECORD.size)
+                raw_index = file.read()
+
+            last_hash = raw_hashes[:self.HASH_SIZE].hex() if count else None
+            if count and self._heights.get(last_hash) != count - 1:
+                self._cache.clear()
+                self._last = None
+                self._load_indexes()
+                return
+
+            if count:
+                raw_hashes = raw_hashes[self.HASH_SIZE:]
+            for i in range(min(len(raw_index) // self.INDEX_RECORD.size, len(raw_hashes) // self.HASH_SIZE)):
+                record = self.INDEX_RECORD.unpack_from(raw_index, i * self.INDEX_RECORD.size)
+                if not self._record_is_complete(record):
+                    break
+                self._index.append(record)
+                self._heights[raw_hashes[i * self.HASH_SIZE:(i + 1) * self.HASH_SIZE].hex()] = len(self._index) - 1
+                self._last = None
+
+    def close(self) -> None:
+        """Closes files and mappings.
+
+        :return: None
+        """
+        with self._lock:
+            for mapping in self._maps.values():
+                mapping.close()
+            self._maps.clear()
+            for _, file in self._writers.values():
+                file.close()
+            self._writers.clear()
+
+    def _load_indexes(self) -> None:
+        """Loads index and hashes, dropping trailing records which were not written completely.
+
+        :return: None
+        """
+        index_path = os.path.join(self.path, 'index.dat')
+        hashes_path = os.path.join(self.path, 'hashes.dat')
+
+        raw_index = b''
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as file:
+                raw_index = file.read()
+        raw_hashes = b''
+        if os.path.exists(hashes_path):
+            with open(hashes_path, 'rb') as file:
+                raw_hashes = file.read()
+
+        count = min(len(raw_index) // self.INDEX_RECORD.size, len(raw_hashes) // self.HASH_SIZE)
+        self._index = [self.INDEX_RECORD.unpack_from(raw_index, i * self.INDEX_RECORD.size) for i in range(count)]
+
+        while self._index and not self._record_is_complete(self._index[-1]):
+            self._index.pop()
+        count = len(self._index)
+
+        self._heights = {raw_hashes[i * self.HASH_SIZE:(i + 1) * self.HASH_SIZE].hex(): i for i in range(count)}
+
+        if self.readonly:
+            return
+        for name, size in (('index.dat', self.INDEX_RECORD.size), ('hashes.dat', self.HASH_SIZE)):
+            file_path = os.path.join(self.path, name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) != count * size:
+                os.truncate(file_path, count * size)
+
+    def _record_is_complete(self, record: tuple[int, int, int, int, int, int]) -> bool:
+        header_segment, header_offset, header_length, body_segment, body_offset, body_length = record
+        for kind, segment, end in (('headers', header_segment, header_offset + header_length),
+                                   ('bodies', body_segment, body_offset + body_length)):
+            segment_path = self._segment_path(kind, segment)
+            if not os.path.exists(segment_path) or os.path.getsize(segment_path) < end:
+                return False
+        return True
+
+    def _segment_path(self, kind: str, segment: int) -> str:
+        return os.path.join(self.path, f'{kind}-{segment:05d}.seg')
+
+    def _write(self, kind: str, data: bytes) -> tuple[int, int]:
+        """Appends data to active segment of kind, rotating it if needed.
+
+        :return: segment number and offset of data
+        :rtype: tuple[int, int]
+        """
+        try:
+            segment, file = self._writers[kind]
+        except KeyError:
+            segment = max((record[0 if kind == 'headers' else 3] for record in self._index[-1:]), default=0)
+            file = open(self._segment_path(kind, segment), 'ab')
+            self._writers[kind] = (segment, file)
+
+        offset = file.seek(0, os.SEEK_END)
+        if offset and offset + len(data) > self._segment_size:
+            file.close()
+            segment += 1
+            file = open(self._segment_path(kind, segment), 'ab')
+            self._writers[kind] = (segment, file)
+            offset = 0
+
+        file.write(data)
+        file.flush()
+        if self._fsync:
+            os.fsync(file.fileno())
+
+        return segment, offset
+
+    def _append_file(self, name: str, data: bytes) -> None:
+        with open(os.path.join(self.path, name), 'ab') as file:
+            file.write(data)
+            file.flush()
+            if self._fsync:
+                os.fsync(file.fileno())
+
+    def _read(self, kind: str, segment: int, offset: int, length: int) -> bytes:
+        """Reads data from segment through mmap, remapping active segment if it has grown.
+
+        :return: data
+        :rtype: bytes
+        """
+        key = (kind, segment)
+        mapping = self._maps.get(key)
+        if mapping is None or len(mapping) < offset + length:
+            with self._lock:
+                mapping = self._maps.get(key)
+                if mapping is None or len(mapping) < offset + length:
+                    # readers may still hold previous mapping of active segment, it is released when unreferenced
+                    with open(self._segment_path(kind, segment), 'rb') as file:
+                        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._maps[key] = mapping
+
+        return mapping[offset:offset + length]
+
+    @staticmethod
+    def _parse_header(raw: Union[bytes, str]) -> BlockHeader:
+        return json.loads(raw, object_hook=BlockHeader.json_parser_hook)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Optional, Sequence
+
+from primitives.blockchain import BlockChain
+from primitives.blocks import Block
+from primitives.world_state import WorldState
+from storage.node_store import NodeStore
+
+
+class CheckpointManager(object):
+    """Writes periodic checkpoints of world state and restores blockchain from the latest one.
+
+    Public attributes:
+        path — directory of checkpoints and tries nodes
+        interval — checkpoint is written at every interval-th block
+        keep — number of latest checkpoints kept on disk
+        storages — accounts and assets tries storages world state MUST be built on
+        readonly — tries storages are opened for reading only (reader process)
+    Public methods:
+        maybe_write(...) — writes checkpoint if blockchain tip is at checkpoint height
+        write(...) — writes checkpoint of blockchain tip
+        write_head(...) — publishes blockchain tip and its state roots for reader processes
+        read_head(...) — returns head published by writer process
+        checkpoints(...) — iterates over stored checkpoints, latest first
+        restore(...) — initializes blockchain on stored chain from the latest matching checkpoint
+        close(...) — closes tries storages
+
+    Tries nodes are appended to NodeStore files (accounts.nodes, assets.nodes) as state is built, so checkpoint
+    (checkpoint-NNNNNNNNNN.json) holds only tip height and hash, tries roots and assets and holders indexes,
+    lookup WorldState.dump_indexes(...). Holders index is written whole, so checkpoint size grows with the number
+    of balances. Nodes are flushed before checkpoint file is atomically renamed into place,
+    so every checkpoint on disk refers only to durable nodes.
+    Nodes of abandoned pending states are stored too, storage is never compacted.
+    Head (head.json) is lighter than checkpoint: tip, tries roots and assets index without holders index. It is
+    rewritten at every new tip after tries nodes are flushed (without fsync), so reader processes opening the same
+    directory read-only can follow the tip, lookup node.reader.
+    """
+    PREFIX = 'checkpoint-'
+    SUFFIX = '.json'
+    HEAD = 'head.json'
+
+    def __init__(self, path: str, interval: int = 100, keep: int = 3, readonly: bool = False) -> None:
+        """Initialization of manager, opens tries storages.
+
+        :param path: directory of checkpoints and tries nodes
+        :type path: str
+        :param interval: checkpoint is written at every interval-th block
+        :type interval: int
+        :param keep: number of latest checkpoints kept on disk
+        :type keep: int
+        :param readonly: open tries storages for reading only, nothing is written
+        :type readonly: bool
+        """
+        assert interval >= 1 and keep >= 1
+
+        self.path = path
+        self.interval = interval
+        self.keep = keep
+        self.readonly = readonly
+
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self.storages = (NodeStore(os.path.join(path, 'accounts.nodes'), readonly=readonly),
+                         NodeStore(os.path.join(path, 'assets.nodes'), readonly=readonly))
+
+    def maybe_write(self, blockchain: BlockChain) -> bool:
+        """Writes checkpoint if blockchain tip is at checkpoint height. Called at block boundaries.
+
+        :param blockchain: blockchain built on self.storages
+        :type blockchain: BlockChain
+        :return: True if checkpoint was written
+        :rtype: bool
+        """
+        if blockchain.last.header.heigth % self.interval:
+            return False
+
+        self.write(blockchain)
+        return True
+
+    def write(self, blockchain: BlockChain) -> None:
+        """Writes checkpoint of blockchain tip and removes outdated checkpoints.
+
+        :param blockchain: blockchain built on self.storages
+        :type blockchain: BlockChain
+        :return: None
+        """
+        assert not self.readonly
+        state = blockchain.state
+        assert state._accounts_storage is self.storages[0] and state._assets_storage is self.storages[1]
+
+        tip = blockchain.last
+        checkpoint = {
+            'height': tip.header.heigth,
+            'block_hash': tip.hash,
+            'state_roots_hash': state.state_roots_hash,
+            'state': state.dump_indexes(),
+        }
+
+        for storage in self.storages:
+            storage.flush()
+
+        file_path = self._checkpoint_path(checkpoint['height'])
+        with open(file_path + '.tmp', 'w') as file:
+            json.dump(checkpoint, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file_path + '.tmp', file_path)
+
+        for height in self._heights()[self.keep:]:
+            os.remove(self._checkpoint_path(height))
+
+    def write_head(self, blockchain: BlockChain) -> None:
+        """Publishes blockchain tip and its state roots for reader processes. Called at every new tip.
+
+        :param blockchain: blockchain built on self.storages
+        :type blockchain: BlockChain
+        :return: None
+        """
+        assert not self.readonly
+        snapshot = blockchain.snapshot
+        head = {
+            'height': snapshot.height,
+            'block_hash': snapshot.hash,
+            'state_roots_hash': snapshot.state_roots_hash,
+            'state': snapshot.state.dump_indexes(holders=False),
+        }
+
+        # readers follow nodes through page cache, durability is left to checkpoints
+        for storage in self.storages:
+            storage.flush(fsync=False)
+
+        file_path = os.path.join(self.path, self.HEAD)
+        with open(file_path + '.tmp', 'w') as file:
+            json.dump(head, file)
+        os.replace(file_path + '.tmp', file_path)
+
+    def read_head(self) -> Optional[dict]:
+        """Returns head published by writer process, lookup write_head(...)
+
+        :return: tip height and hash, state roots hash and indexes without holders, None if there is no head
+        :rtype: Optional[dict]
+        """
+        try:
+            with open(os.path.join(self.path, self.HEAD)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def checkpoints(self) -> list[dict]:
+        """Returns stored checkpoints, latest first. Unreadable checkpoints are skipped.
+
+        :return: checkpoints
+        :rtype: list[dict]
+        """
+        checkpoints = []
+        for height in self._heights():
+            try:
+                with open(self._checkpoint_path(height)) as file:
+                    checkpoints.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+
+        return checkpoints
+
+    def restore(self, chain: Sequence[Block]) -> BlockChain:
+        """Initializes blockchain on stored chain from the latest checkpoint matching it.
+
+        State is loaded from tries storages by checkpoint roots and verified against state root of the stored
+        header at checkpoint height, only later blocks are replayed. New blockchain (with genesis checkpoint) is
+        created if chain is empty.
+
+        :param chain: list of blocks or block store
+        :type chain: Sequence[Block]
+        :return: blockchain
+        :rtype: BlockChain
+        :raises AssertionError: if there is no checkpoint matching chain
+        """
+        assert not self.readonly
+        if not chain:
+            blockchain = BlockChain(chain, WorldState(self.storages))
+            self.write(blockchain)
+            return blockchain
+
+        for checkpoint in self.checkpoints():
+            height = checkpoint['height']
+            if height < len(chain) and chain[height].hash == checkpoint['block_hash']:
+                state = WorldState.from_indexes(checkpoint['state'], self.storages)
+                assert state.state_roots_hash == checkpoint['state_roots_hash'], 'checkpoint is corrupted'
+                return BlockChain(chain, state, height)
+
+        raise AssertionError('no checkpoint matches stored chain')
+
+    def close(self) -> None:
+        """Closes tries storages.
+
+        :return: None
+        """
+        for storage in self.storages:
+            storage.close()
+
+    def _checkpoint_path(self, height: int) -> str:
+        return os.path.join(self.path, f'{self.PREFIX}{height:010d}{self.SUFFIX}')
+
+    def _heights(self) -> list[int]:
+        """Returns heights of stored checkpoints, latest first."""
+        return sorted((int(name[len(self.PREFIX):-len(self.SUFFIX)]) for name in os.listdir(self.path)
+                       if name.startswith(self.PREFIX) and name.endswith(self.SUFFIX)), reverse=True)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import threading
+from collections.abc import MutableMapping
+from typing import Iterator
+
+
+class NodeStore(MutableMapping):
+    """Represents append-only on-disk storage of trie nodes, may be used as MerklePatriciaTrie storage.
+
+    Public attributes:
+        path — file of the store
+        readonly — store is opened for reading only
+    Public methods:
+        flush(...) — makes written nodes durable
+        refresh(...) — picks up nodes appended by writer process (read-only store)
+        close(...) — closes file and mapping
+    Private attributes:
+        _index — node key -> (offset, length) of node value in file
+        _pending — nodes written since last flush(...)
+
+    Nodes are content-addressed and immutable, so records (key length, value length, key, value) are only appended,
+    writing existing key is a no-op and deletion is not supported. Offsets of all nodes are kept in memory and
+    rebuilt by one sequential scan on open, values are read through mmap. Record which was not written completely
+    is dropped on open.
+
+    Writes SHOULD be done from one thread, reads are safe from any thread. Other processes may open the store
+    read-only and follow the writer with refresh(...): nodes flushed by the writer are visible to them.
+    """
+    RECORD_HEADER = struct.Struct('<BI')
+
+    path: str = ''
+    _index: dict[bytes, tuple[int, int]] = None
+    _pending: dict[bytes, bytes] = None
+    readonly: bool = False
+
+    def __init__(self, path: str, fsync: bool = True, readonly: bool = False) -> None:
+        """Initialization of store, opens existing one or creates new.
+
+        :param path: file of the store
+        :type path: str
+        :param fsync: fsync file on flush(...)
+        :type fsync: bool
+        :param readonly: open existing store for reading only, file is never modified
+        :type readonly: bool
+        """
+        self.path = path
+        self.readonly = readonly
+        self._fsync = fsync
+        self._index = {}
+        self._pending = {}
+        self._scanned = 0
+        self._map: mmap.mmap = None
+        self._file = None
+        self._lock = threading.Lock()
+
+        if not readonly:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        if not readonly:
+            self._file = open(path, 'ab')
+            self._end = self._file.seek(0, os.SEEK_END)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path}, {len(self._index)} nodes)'
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(list(self._index))
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __getitem__(self, key: bytes) -> bytes:
+        try:
+            return self._pending[key]
+        except KeyError:
+            pass
+
+        offset, length = self._index[key]
+        mapping = self._map
+        if mapping is None or len(mapping) < offset + length:
+            with self._lock:
+                mapping = self._map
+                if mapping is None or len(mapping) < offset + length:
+                    # readers may still hold previous mapping, it is released when unreferenced
+                    with open(self.path, 'rb') as file:
+                        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._map = mapping
+
+        return mapping[offset:offset + length]
+
+    def __setitem__(self, key: bytes, value: bytes) -> None:
+        assert not self.readonly, 'store is read-only'
+        if key in self._index:
+            return
+
+        record = self.RECORD_HEADER.pack(len(key), len(value)) + key + value
+        self._pending[key] = value
+        self._file.write(record)
+        self._index[key] = (self._end + len(record) - len(value), len(value))
+        self._end += len(record)
+
+    def __delitem__(self, key: bytes) -> None:
+        raise NotImplementedError
+
+    def flush(self, fsync: bool = None) -> None:
+        """Writes buffered nodes to file, fsyncs it if enabled.
+
+        :param fsync: fsync file (optional, as configured by default), written nodes are visible to other processes
+            either way
+        :type fsync: bool
+        :return: None
+        """
+        if self._file is None:
+            return
+
+        self._file.flush()
+        if self._fsync if fsync is None else fsync:
+            os.fsync(self._file.fileno())
+        self._pending.clear()
+
+    def refresh(self) -> None:
+        """Picks up nodes appended by writer process since store was opened or refreshed. Read-only store only.
+
+        :return: None
+        """
+        assert self.readonly, 'only read-only store follows writer'
+        with self._lock:
+            self._load_index()
+
+    def close(self) -> None:
+        """Flushes and closes file and mapping.
+
+        :return: None
+        """
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def _load_index(self) -> None:
+        """Scans file from the last scanned record and adds nodes to index. Trailing record which was not written
+        completely is truncated, or left for the next scan if store is read-only (writer may be writing it).
+
+        :return: None
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as file:
+            file.seek(self._scanned)
+            data = file.read()
+
+        offset = 0
+        header_size = self.RECORD_HEADER.size
+        while offset + header_size <= len(data):
+            key_length, value_length = self.RECORD_HEADER.unpack_from(data, offset)
+            end = offset + header_size + key_length + value_length
+            if end > len(data):
+                break
+            key = data[offset + header_size:offset + header_size + key_length]
+            self._index[key] = (self._scanned + end - value_length, value_length)
+            offset = end
+
+        self._scanned += offset
+        if offset != len(data) and not self.readonly:
+            os.truncate(self.path, self._scanned)
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from mpt.hash import keccak_hash
+from primitives.assets import Asset, AssetStatus, AssetType
+from primitives.tries import root_ref, trie_items, trie_nodes
+from primitives.world_state import WorldState
+
+ACCOUNTS, ASSETS = 0, 1
+
+# (storage tag, node value length), followed by 32-byte node key and node value
+RECORD_HEADER = struct.Struct('<BI')
+KEY_SIZE = 32
+
+
+def _read_chunk(path: str, sha256: str) -> list[tuple[int, bytes, bytes]]:
+    """Reads chunk file and verifies it independently of other chunks.
+
+    Runs in worker process. Checks hash of chunk against manifest and every node against its content address.
+
+    :param path: chunk file
+    :type path: str
+    :param sha256: expected sha256 of chunk
+    :type sha256: str
+    :return: (storage tag, key, encoded node) records
+    :rtype: list[tuple[int, bytes, bytes]]
+    :raises AssertionError: if chunk is corrupted
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    assert hashlib.sha256(data).hexdigest() == sha256, f'chunk {path} hash mismatch'
+
+    records = []
+    offset = 0
+    while offset < len(data):
+        tag, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        key = data[offset:offset + KEY_SIZE]
+        value = data[offset + KEY_SIZE:offset + KEY_SIZE + length]
+        offset += KEY_SIZE + length
+
+        assert tag in (ACCOUNTS, ASSETS) and len(value) == length, f'chunk {path} is truncated'
+        assert keccak_hash(value) == key, f'chunk {path} has node not matching its key'
+        records.append((tag, key, value))
+
+    return records
+
+
+class StateSnapshot(object):
+    """Represents chunked verifiable snapshot of world state in local directory.
+
+    Public attributes:
+        path — directory of snapshot
+        manifest — tip height and hash, state roots hash, tries roots, assets and chunks (file, sha256, size, nodes)
+    Public methods:
+        export(...) — writes snapshot of world state
+        load(...) — verifies chunks in parallel and rebuilds world state
+
+    Snapshot ships state, not history: nodes of accounts trie, of every account trie and of assets trie are
+    streamed into chunk files (chunk-NNNNNN.bin) of about chunk_size bytes. Every chunk is verified on its own —
+    its hash against manifest and every node against its content address, so chunks may be fetched and checked
+    in any order. Indexes of accounts and holders are rebuilt from the tries, assets definitions from manifest are
+    checked against assets trie, and resulting state roots hash is checked against manifest (and trusted value).
+    """
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, path: str) -> None:
+        """Opens existing snapshot.
+
+        :param path: directory of snapshot
+        :type path: str
+        """
+        self.path = path
+        with open(os.path.join(path, self.MANIFEST)) as file:
+            self.manifest = json.load(file)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path}, {self.manifest["state_roots_hash"]})'
+
+    @classmethod
+    def export(cls, state: WorldState, path: str, height: int = None, block_hash: str = None,
+               chunk_size: int = 4 * 2 ** 20) -> StateSnapshot:
+        """Writes snapshot of world state, streaming tries nodes into chunks.
+
+        State SHOULD NOT be modified while exported (chain states and forks of them are never modified).
+
+        :param state: world state
+        :type state: WorldState
+        :param path: directory of snapshot, created if needed
+        :type path: str
+        :param height: height of block state belongs to (optional)
+        :type height: int
+        :param block_hash: hash of block state belongs to (optional)
+        :type block_hash: str
+        :param chunk_size: chunk is closed when it reaches this size, bytes
+        :type chunk_size: int
+        :return: snapshot
+        :rtype: StateSnapshot
+        """
+        os.makedirs(path, exist_ok=True)
+        state_roots_hash = state.state_roots_hash  # commits pending changes to tries
+        accounts_root = state._accounts_trie.root()
+        assets_root = state._assets_trie.root()
+
+        def records() -> Iterator[tuple[int, bytes, bytes]]:
+            seen = set()
+            for key, value in trie_nodes(state._accounts_storage, accounts_root, seen):
+                yield ACCOUNTS, key, value
+            for _, account_root in trie_items(state._accounts_storage, accounts_root):
+                for key, value in trie_nodes(state._accounts_storage, root_ref(account_root), seen):
+                    yield ACCOUNTS, key, value
+            for key, value in trie_nodes(state._assets_storage, assets_root, set()):
+                yield ASSETS, key, value
+
+        chunks = []
+        buffer = bytearray()
+        nodes = 0
+
+        def flush() -> None:
+            name = f'chunk-{len(chunks):06d}.bin'
+            with open(os.path.join(path, name), 'wb') as file:
+                file.write(buffer)
+            chunks.append({'file': name, 'sha256': hashlib.sha256(buffer).hexdigest(), 'size': len(buffer),
+                           'nodes': nodes})
+
+        for tag, key, value in records():
+            buffer += RECORD_HEADER.pack(tag, len(value)) + key + value
+            nodes += 1
+            if len(buffer) >= chunk_size:
+                flush()
+                buffer.clear()
+                nodes = 0
+        if buffer:
+            flush()
+
+        manifest = {
+            'height': height,
+            'block_hash': block_hash,
+            'state_roots_hash': state_roots_hash,
+            'accounts_root': accounts_root.hex() if accounts_root else None,
+            'assets_root': assets_root.hex() if assets_root else None,
+            'assets': {name.decode('utf-8'): (asset.type.value, asset.status.value)
+                       for name, asset in state._assets.items()},
+            'chunks': chunks,
+        }
+        with open(os.path.join(path, cls.MANIFEST + '.tmp'), 'w') as file:
+            json.dump(manifest, file)
+        os.replace(os.path.join(path, cls.MANIFEST + '.tmp'), os.path.join(path, cls.MANIFEST))
+
+        return cls(path)
+
+    def load(self, storages: tuple[dict, dict] = None, workers: int = None,
+             state_roots_hash: str = None) -> WorldState:
+        """Verifies chunks in parallel and rebuilds world state from them, no transaction is replayed.
+
+        :param storages: accounts and assets tries storages to load nodes into (optional, new dicts by default)
+        :type storages: tuple[dict, dict]
+        :param workers: number of worker processes, 0 to verify in current process (optional, CPUs by default)
+        :type workers: int
+        :param state_roots_hash: trusted state roots hash, e.g. from validated header (optional)
+        :type state_roots_hash: str
+        :return: world state
+        :rtype: WorldState
+        :raises AssertionError: if snapshot is corrupted or incomplete
+        """
+        manifest = self.manifest
+        if state_roots_hash is not None:
+            assert manifest['state_roots_hash'] == state_roots_hash, 'snapshot is not of trusted state'
+
+        storages = storages if storages is not None else ({}, {})
+        for records in self._verified_chunks(workers):
+            for tag, key, value in records:
+                storages[tag][key] = value
+
+        def ref(root: str):
+            return bytes.fromhex(root) if root else None
+
+        try:
+            for _, account_root in trie_items(storages[ACCOUNTS], ref(manifest['accounts_root'])):
+                for _ in trie_nodes(storages[ACCOUNTS], root_ref(account_root), set()):
+                    pass
+
+            asset_hashes = dict(trie_items(storages[ASSETS], ref(manifest['assets_root'])))
+        except KeyError:
+            raise AssertionError('snapshot is incomplete')
+
+        assert set(asset_hashes) == {name.encode('utf-8') for name in manifest['assets']}
+        for name, (_type, status) in manifest['assets'].items():
+            asset = Asset(name, AssetType(_type), AssetStatus(status))
+            assert asset.state_hash == asset_hashes[name.encode('utf-8')], f'asset {name} does not match trie'
+
+        # accounts are materialized lazily from accounts trie, holders index is rebuilt from tries
+        state = WorldState.from_indexes(manifest, storages)
+
+        assert state.state_roots_hash == manifest['state_roots_hash'], 'snapshot does not match its roots'
+
+        return state
+
+    def _verified_chunks(self, workers: int = None) -> Iterator[list[tuple[int, bytes, bytes]]]:
+        """Yields records of verified chunks, keeping bounded number of chunks in flight."""
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        chunks = [(os.path.join(self.path, chunk['file']), chunk['sha256']) for chunk in self.manifest['chunks']]
+
+        if not workers:
+            for chunk in chunks:
+                yield _read_chunk(*chunk)
+            return
+
+        with ProcessPoolExecutor(workers) as executor:
+            window = deque()
+            for chunk in chunks:
+                window.append(executor.submit(_read_chunk, *chunk))
+                if len(window) >= 2 * workers:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
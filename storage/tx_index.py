@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from typing import Optional, Sequence
+
+from primitives.blocks import Block
+from primitives.transactions import Transaction
+
+# (height, tx index in block)
+TxLocation = tuple[int, int]
+
+
+def involved_accounts(tx: Transaction) -> set[str]:
+    """Returns accounts transaction is listed under in history: sender and payload recipient(s).
+
+    :param tx: transaction
+    :type tx: Transaction
+    :return: account names
+    :rtype: set[str]
+    """
+    accounts = {tx.sender}
+    payload = tx.payload if isinstance(tx.payload, dict) else {}
+    recipient = payload.get('recipient')
+    if isinstance(recipient, str):
+        accounts.add(recipient)
+    transfers = payload.get('transfers')
+    if isinstance(transfers, list):
+        # batch transfer
+        accounts.update(transfer[0] for transfer in transfers
+                        if isinstance(transfer, list) and transfer and isinstance(transfer[0], str))
+
+    return accounts
+
+
+class TxIndex(object):
+    """Represents persistent secondary indexes of canonical chain transactions.
+
+    Public attributes:
+        path — SQLite database file
+        height — number of indexed blocks
+    Public methods:
+        add_block(...) — indexes block on top of indexed ones
+        rollback(...) — drops blocks starting from height (on reorg)
+        sync(...) — brings index in line with chain after restart
+        get(...) — returns location of transaction by hash
+        history(...) — returns page of account transactions locations
+
+    Indexes tx hash -> (height, index) and account -> [(height, index)] for sender and payload recipients are
+    B-trees of SQLite database, so lookups are O(log n) regardless of chain length. Every block is indexed in one
+    SQLite transaction together with its hash, which is used to find diverged blocks on sync(...).
+
+    Writes SHOULD be done from one thread, reads are safe from any thread (every thread has its own connection,
+    database is in WAL mode, so readers are not blocked by writer).
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialization of index, opens existing database or creates new.
+
+        :param path: SQLite database file
+        :type path: str
+        """
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, hash TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS txs (
+                    hash TEXT PRIMARY KEY, height INTEGER NOT NULL, idx INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS txs_height ON txs (height);
+                CREATE TABLE IF NOT EXISTS account_txs (
+                    account TEXT NOT NULL, height INTEGER NOT NULL, idx INTEGER NOT NULL,
+                    PRIMARY KEY (account, height, idx)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS account_txs_height ON account_txs (height);
+            ''')
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path}, {self.height} blocks)'
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path)
+        return connection
+
+    @property
+    def height(self) -> int:
+        """Returns number of indexed blocks.
+
+        :return: number of indexed blocks
+        :rtype: int
+        """
+        row = self._connection().execute('SELECT MAX(height) FROM blocks').fetchone()
+        return row[0] + 1 if row[0] is not None else 0
+
+    def block_hash(self, height: int) -> Optional[str]:
+        """Returns hash of indexed block by height.
+
+        :param height: block height
+        :type height: int
+        :return: block hash or None if block is not indexed
+        :rtype: Optional[str]
+        """
+        row = self._connection().execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+        return row[0] if row else None
+
+    def add_block(self, block: Block) -> None:
+        """Indexes block, which must be at height of index.
+
+        :param block: block
+        :type block: Block
+        :return: None
+        """
+        height = block.header.heigth
+        assert height == self.height, 'block is not on top of indexed ones'
+
+        txs = []
+        accounts = []
+        for i, tx in enumerate(block.transactions):
+            txs.append((tx.hash, height, i))
+            accounts.extend((account, height, i) for account in involved_accounts(tx))
+
+        with self._connection() as connection:
+            connection.execute('INSERT INTO blocks VALUES (?, ?)', (height, block.hash))
+            # transaction included again (e.g. after reorg) points to its latest location
+            connection.executemany('INSERT OR REPLACE INTO txs VALUES (?, ?, ?)', txs)
+            connection.executemany('INSERT OR IGNORE INTO account_txs VALUES (?, ?, ?)', accounts)
+
+    def rollback(self, height: int) -> None:
+        """Drops indexed blocks starting from height.
+
+        :param height: height of first dropped block
+        :type height: int
+        :return: None
+        """
+        with self._connection() as connection:
+            for table in ('blocks', 'txs', 'account_txs'):
+                connection.execute(f'DELETE FROM {table} WHERE height >= ?', (height,))
+
+    def sync(self, chain: Sequence[Block]) -> None:
+        """Brings index in line with chain: drops diverged blocks and indexes missing ones.
+
+        :param chain: list of blocks or block store
+        :type chain: Sequence[Block]
+        :return: None
+        """
+        height = min(self.height, len(chain))
+        while height and self.block_hash(height - 1) != chain[height - 1].hash:
+            height -= 1
+        if height < self.height:
+            self.rollback(height)
+
+        for i in range(height, len(chain)):
+            self.add_block(chain[i])
+
+    def get(self, tx_hash: str) -> Optional[TxLocation]:
+        """Returns location of transaction in canonical chain.
+
+        :param tx_hash: transaction hash
+        :type tx_hash: str
+        :return: (height, index in block) or None if transaction is not indexed
+        :rtype: Optional[TxLocation]
+        """
+        row = self._connection().execute('SELECT height, idx FROM txs WHERE hash = ?', (tx_hash,)).fetchone()
+        return tuple(row) if row else None
+
+    def history(self, account: str, limit: int = 100, before: TxLocation = None) -> list[TxLocation]:
+        """Returns page of locations of transactions account is involved in, newest first.
+
+        :param account: account name
+        :type account: str
+        :param limit: maximum number of locations
+        :type limit: int
+        :param before: location to continue after — last location of previous page (optional)
+        :type before: TxLocation
+        :return: locations (height, index in block)
+        :rtype: list[TxLocation]
+        """
+        if before is None:
+            rows = self._connection().execute(
+                'SELECT height, idx FROM account_txs WHERE account = ? ORDER BY height DESC, idx DESC LIMIT ?',
+                (account, limit))
+        else:
+            rows = self._connection().execute(
+                'SELECT height, idx FROM account_txs WHERE account = ? AND (height, idx) < (?, ?) '
+                'ORDER BY height DESC, idx DESC LIMIT ?',
+                (account, before[0], before[1], limit))
+
+        return [tuple(row) for row in rows]
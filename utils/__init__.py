@@ -1,6 +1,7 @@
 import configparser
 
 from utils.log_handling import logger, handle_exception
+from utils.metrics import metrics, Metrics, LatencyStats
 
 
 class LoggedBaseException(BaseException):
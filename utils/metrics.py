@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class LatencyStats(object):
+    """Collects latency samples.
+
+    Keeps running totals for all samples and a window of most recent samples for percentiles.
+    Thread-safe.
+    """
+
+    def __init__(self, window: int = 1024) -> None:
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """Records one sample.
+
+        :param seconds: measured latency, seconds
+        :type seconds: float
+        :return: None
+        """
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._samples.append(seconds)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Records latency of the wrapped block.
+
+        :return: context manager
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def percentile(self, p: float) -> float:
+        """Returns percentile of recent samples.
+
+        :param p: percentile in [0, 100]
+        :type p: float
+        :return: latency, seconds (0 if there are no samples)
+        :rtype: float
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+
+        if not samples:
+            return 0.
+
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def snapshot(self) -> dict[str, float]:
+        """Returns summary of collected samples, milliseconds.
+
+        :return: count, mean, p50, p90, p99 and max
+        :rtype: dict[str, float]
+        """
+        return {'count': self.count,
+                'mean_ms': self.total / self.count * 1000 if self.count else 0.,
+                'p50_ms': self.percentile(50) * 1000,
+                'p90_ms': self.percentile(90) * 1000,
+                'p99_ms': self.percentile(99) * 1000,
+                'max_ms': self.max * 1000}
+
+
+class Metrics(object):
+    """Registry of named latency stats and counters.
+
+    Stats and counters are created on first use.
+    Thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self._latencies: dict[str, LatencyStats] = {}
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def latency(self, name: str) -> LatencyStats:
+        """Returns latency stats by name.
+
+        :param name: name of stats, dot-separated
+        :type name: str
+        :return: latency stats
+        :rtype: LatencyStats
+        """
+        try:
+            return self._latencies[name]
+        except KeyError:
+            with self._lock:
+                return self._latencies.setdefault(name, LatencyStats())
+
+    def incr(self, name: str, value: int = 1) -> None:
+        """Increments counter by name.
+
+        :param name: name of counter, dot-separated
+        :type name: str
+        :param value: increment
+        :type value: int
+        :return: None
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def counter(self, name: str) -> int:
+        """Returns counter value by name.
+
+        :param name: name of counter
+        :type name: str
+        :return: counter value
+        :rtype: int
+        """
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict[str, dict]:
+        """Returns all stats and counters.
+
+        :return: latencies summaries and counters
+        :rtype: dict[str, dict]
+        """
+        return {'latency': {name: stats.snapshot() for name, stats in list(self._latencies.items())},
+                'counters': dict(self._counters)}
+
+
+metrics = Metrics()